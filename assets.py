@@ -0,0 +1,433 @@
+"""Asset provisioning for Kokoro TTS Local
+
+Fetches the model weights, config and voice files concurrently from a
+pluggable source and verifies them against a checksum manifest:
+
+    hf                      the Hugging Face Hub (default); "hf:<repo>@<revision>" picks a repo
+    /path/to/mirror         a directory with the same layout (kokoro-v1_0.pth, config.json, voices/*.pt)
+    /path/to/assets.tar.gz  a tarball with that layout (.tar, .tar.gz or .tgz)
+
+Files are downloaded to <file>.part, and an interrupted download resumes
+from there. Each file is checked against the source's checksums (the Hub's
+LFS sha256, or the manifest.json of a mirror or tarball) before it is moved
+into place. The local manifest (.cache/assets_manifest.json) records every
+verified file with its size and modification time, so on a node whose files
+still match it nothing is hashed or fetched and no network is needed.
+
+Several processes can provision the same directory at once (e.g. parallel
+chapter workers on a fresh node): each asset is fetched under a file lock,
+and whichever process takes it first downloads it.
+
+The source is --source or KOKORO_ASSET_SOURCE.
+
+Usage:
+    python assets.py [--source /mnt/kokoro-mirror] [--voices af_bella,am_adam] [--verify] [--jobs 8]
+    python assets.py --write-manifest /mnt/kokoro-mirror
+"""
+from typing import Optional, List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import time
+import urllib.error
+import urllib.request
+
+REPO_ID = "hexgrad/Kokoro-82M"
+MODEL_FILE = "kokoro-v1_0.pth"
+CONFIG_FILE = "config.json"
+MANIFEST_PATH = Path('.cache/assets_manifest.json')
+SOURCE_MANIFEST = "manifest.json"
+DEFAULT_JOBS = 8
+COPY_BLOCK = 1 << 20
+
+def sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _part_offset(part_path: Path) -> int:
+    return part_path.stat().st_size if part_path.exists() else 0
+
+def _read_json(path: Path) -> dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_json(path: Path, data: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+@contextmanager
+def file_lock(path: Path):
+    """Hold an exclusive lock on path (created if needed) against other processes."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a+b') as f:
+        try:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        except ImportError:
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass  # LK_LOCK gives up after ten seconds; keep waiting
+        # Closing the file releases the lock
+        yield
+
+def _matches(expected: Optional[dict], size: int, sha256: str) -> bool:
+    """Whether a file agrees with the source's checksums (fields the source lacks are not checked)."""
+    expected = expected or {}
+    return expected.get("size") in (None, size) and expected.get("sha256") in (None, sha256)
+
+def _missing_manifest_warning(source) -> None:
+    print(f"Warning: {source.describe()} has no {SOURCE_MANIFEST}, so files from it are not verified "
+          f"(create one with: python assets.py --write-manifest <dir>)")
+
+class HFSource:
+    """Downloads from the Hugging Face Hub with resumable HTTP range requests."""
+
+    resumable = True
+
+    def __init__(self, repo_id: str = REPO_ID, revision: str = "main", timeout: float = 60.0):
+        self.repo_id = repo_id
+        self.revision = revision
+        self.timeout = timeout
+
+    def describe(self) -> str:
+        return f"hf:{self.repo_id}@{self.revision}"
+
+    def checksums(self, names: List[str]) -> Dict[str, dict]:
+        """Sizes and (for LFS files) sha256 of the given files, from the Hub's metadata."""
+        from huggingface_hub import HfApi
+        entries = {}
+        for info in HfApi().get_paths_info(self.repo_id, names, revision=self.revision):
+            if hasattr(info, 'size'):
+                entries[info.path] = {"size": info.size, "sha256": info.lfs.sha256 if info.lfs else None}
+        return entries
+
+    def prepare(self, names: List[str], part_paths: Dict[str, Path]) -> None:
+        pass
+
+    def fetch(self, name: str, part_path: Path) -> None:
+        from huggingface_hub import hf_hub_url
+        from huggingface_hub.utils import build_hf_headers
+
+        offset = _part_offset(part_path)
+        headers = build_hf_headers()
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        request = urllib.request.Request(hf_hub_url(self.repo_id, name, revision=self.revision), headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                # A server that ignores the range sends the whole file again
+                mode = 'ab' if offset and response.status == 206 else 'wb'
+                with open(part_path, mode) as f:
+                    shutil.copyfileobj(response, f, COPY_BLOCK)
+        except urllib.error.HTTPError as e:
+            # 416: the part file already holds the whole file; verification decides
+            if e.code != 416:
+                raise
+
+class MirrorSource:
+    """Copies from a local or network-mounted directory with the repo's layout."""
+
+    resumable = True
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def describe(self) -> str:
+        return str(self.root)
+
+    def checksums(self, names: List[str]) -> Dict[str, dict]:
+        if not (self.root / SOURCE_MANIFEST).exists():
+            _missing_manifest_warning(self)
+            return {}
+        return _read_json(self.root / SOURCE_MANIFEST).get("assets", {})
+
+    def prepare(self, names: List[str], part_paths: Dict[str, Path]) -> None:
+        pass
+
+    def fetch(self, name: str, part_path: Path) -> None:
+        offset = _part_offset(part_path)
+        with open(self.root / name, 'rb') as src, open(part_path, 'ab') as dst:
+            src.seek(offset)
+            shutil.copyfileobj(src, dst, COPY_BLOCK)
+
+class TarballSource:
+    """Extracts from a tarball with the repo's layout, optionally under one top-level directory.
+
+    Compressed tarballs cannot be read at random, so prepare() extracts
+    every requested file in a single pass and fetch() only checks the result.
+    """
+
+    resumable = False
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._members = None
+        self._extracted = set()
+
+    def describe(self) -> str:
+        return str(self.path)
+
+    def members(self) -> Dict[str, str]:
+        """Map of asset name to member name in the tarball."""
+        if self._members is None:
+            with tarfile.open(self.path) as tar:
+                names = [m.name for m in tar.getmembers() if m.isfile()]
+            prefixes = {name.split('/', 1)[0] for name in names if '/' in name}
+            strip = prefixes.pop() + '/' if len(prefixes) == 1 and all('/' in n for n in names) else ''
+            self._members = {name[len(strip):]: name for name in names}
+        return self._members
+
+    def checksums(self, names: List[str]) -> Dict[str, dict]:
+        member = self.members().get(SOURCE_MANIFEST)
+        if not member:
+            _missing_manifest_warning(self)
+            return {}
+        with tarfile.open(self.path) as tar:
+            return json.load(tar.extractfile(member)).get("assets", {})
+
+    def prepare(self, names: List[str], part_paths: Dict[str, Path]) -> None:
+        wanted = {self.members()[name]: name for name in names if name in self.members()}
+        with tarfile.open(self.path, 'r|*') as tar:
+            for member in tar:
+                name = wanted.get(member.name)
+                if name is None or not member.isfile():
+                    continue
+                with tar.extractfile(member) as src, open(part_paths[name], 'wb') as dst:
+                    shutil.copyfileobj(src, dst, COPY_BLOCK)
+                self._extracted.add(name)
+
+    def fetch(self, name: str, part_path: Path) -> None:
+        if name not in self._extracted:
+            raise FileNotFoundError(f"{name} is not in {self.path}")
+
+def source_from_spec(spec: Optional[str] = None):
+    """Create a source from "hf[:repo[@revision]]", a mirror directory or a tarball path."""
+    spec = spec or os.environ.get('KOKORO_ASSET_SOURCE') or "hf"
+    if spec == "hf" or spec.startswith("hf:"):
+        repo, _, revision = spec[3:].partition('@')
+        return HFSource(repo or REPO_ID, revision or "main")
+    path = Path(spec)
+    if path.is_dir():
+        return MirrorSource(spec)
+    if path.is_file() and tarfile.is_tarfile(path):
+        return TarballSource(spec)
+    raise ValueError(f"Unknown asset source: {spec} (expected 'hf', a directory or a tarball)")
+
+class AssetProvisioner:
+    """Fetches and verifies assets concurrently, skipping files the local manifest vouches for.
+
+    Args:
+        source: Where to fetch from (see source_from_spec); default from KOKORO_ASSET_SOURCE or the Hub
+        root: Directory the asset names are relative to
+        manifest_path: Local manifest of verified files; its directory also holds the download locks
+        jobs: Files fetched at the same time
+        verify: Hash every file again, even if the manifest matches
+    """
+
+    def __init__(self, source=None, root: str = ".", manifest_path: Path = MANIFEST_PATH,
+                 jobs: int = DEFAULT_JOBS, verify: bool = False):
+        self.source = source if source is not None and not isinstance(source, str) else source_from_spec(source)
+        self.root = Path(root)
+        self.manifest_path = Path(manifest_path)
+        self.jobs = jobs
+        self.verify = verify
+
+    def _matches_manifest(self, name: str, entry: Optional[dict]) -> bool:
+        path = self.root / name
+        if not entry or not path.exists():
+            return False
+        stat = path.stat()
+        return entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime
+
+    def _record(self, name: str, sha256: str, verified: bool) -> dict:
+        stat = (self.root / name).stat()
+        return {"sha256": sha256, "size": stat.st_size, "mtime": stat.st_mtime, "verified": verified,
+                "source": self.source.describe()}
+
+    def _expected(self, names: List[str]) -> Dict[str, dict]:
+        try:
+            return self.source.checksums(names)
+        except Exception as e:
+            print(f"Warning: Could not get checksums from {self.source.describe()}: {e}")
+            return {}
+
+    def _part_path(self, name: str) -> Path:
+        path = self.root / name
+        if self.source.resumable:
+            # Shared between processes, but only written while holding the asset's lock
+            return path.with_name(path.name + ".part")
+        # Filled by prepare() before the lock is taken, so it must be private to this process
+        return path.with_name(f"{path.name}.part.{os.getpid()}")
+
+    def _lock_path(self, name: str) -> Path:
+        return self.manifest_path.parent / "locks" / (name.replace('/', '_') + ".lock")
+
+    def _download(self, name: str, expected: Optional[dict]) -> str:
+        """Fetch one file into place; returns its sha256. Raises if it cannot be verified."""
+        with file_lock(self._lock_path(name)):
+            return self._download_locked(name, expected)
+
+    def _download_locked(self, name: str, expected: Optional[dict]) -> str:
+        path = self.root / name
+        part_path = self._part_path(name)
+        if path.exists():
+            # Another process may have fetched it while we waited for the lock
+            sha256 = sha256_file(path)
+            if _matches(expected, path.stat().st_size, sha256):
+                if not self.source.resumable:
+                    part_path.unlink(missing_ok=True)
+                return sha256
+        for attempt in range(2):
+            resumed = _part_offset(part_path) if self.source.resumable else 0
+            print(f"Downloading {name}" + (f" (resuming at {resumed / 2**20:.1f} MiB)..." if resumed else "..."))
+            self.source.fetch(name, part_path)
+            sha256 = sha256_file(part_path)
+            size = part_path.stat().st_size
+            if not _matches(expected, size, sha256):
+                # A corrupt or stale part file: start over once
+                part_path.unlink()
+                if attempt == 0 and resumed:
+                    continue
+                raise ValueError(f"checksum mismatch (got {size} bytes, sha256 {sha256[:12]})")
+            os.replace(part_path, path)
+            return sha256
+        raise ValueError("checksum mismatch")
+
+    def provision(self, names: List[str]) -> Dict[str, str]:
+        """Make sure the named assets exist and are verified.
+
+        Returns {name: status}, where status is "cached" (matched the
+        manifest), "verified" (present and checked), "downloaded", or
+        "failed: <reason>".
+        """
+        entries = _read_json(self.manifest_path).get("assets", {})
+        updated = {}
+        statuses = {}
+        pending = [name for name in names if self.verify or not self._matches_manifest(name, entries.get(name))]
+        for name in names:
+            if name not in pending:
+                statuses[name] = "cached"
+        if not pending:
+            return statuses
+
+        expected = self._expected(pending)
+        downloads = []
+        for name in pending:
+            path = self.root / name
+            if not path.exists():
+                downloads.append(name)
+                continue
+            sha256 = sha256_file(path)
+            want = expected.get(name) or {}
+            if not _matches(want, path.stat().st_size, sha256):
+                print(f"Warning: {name} does not match its checksum, downloading it again")
+                downloads.append(name)
+                continue
+            updated[name] = self._record(name, sha256, bool(want.get("sha256")))
+            statuses[name] = "verified"
+
+        if downloads:
+            part_paths = {}
+            for name in downloads:
+                part_paths[name] = self._part_path(name)
+                part_paths[name].parent.mkdir(parents=True, exist_ok=True)
+            start = time.perf_counter()
+            try:
+                self.source.prepare(downloads, part_paths)
+            except Exception as e:
+                print(f"Warning: Could not read {self.source.describe()}: {e}")
+            with ThreadPoolExecutor(max_workers=max(1, self.jobs)) as pool:
+                futures = {name: pool.submit(self._download, name, expected.get(name)) for name in downloads}
+            for name, future in futures.items():
+                try:
+                    sha256 = future.result()
+                except Exception as e:
+                    print(f"Warning: Failed to download {name}: {e}")
+                    statuses[name] = f"failed: {e}"
+                    continue
+                updated[name] = self._record(name, sha256, bool((expected.get(name) or {}).get("sha256")))
+                statuses[name] = "downloaded"
+            fetched = sum(status == "downloaded" for status in statuses.values())
+            print(f"Downloaded {fetched}/{len(downloads)} file(s) from {self.source.describe()} "
+                  f"in {time.perf_counter() - start:.1f}s")
+        self._save_manifest(updated)
+        return statuses
+
+    def _save_manifest(self, updated: Dict[str, dict]) -> None:
+        """Merge entries into the manifest, keeping those other processes wrote meanwhile."""
+        with file_lock(self.manifest_path.with_name(self.manifest_path.name + ".lock")):
+            manifest = _read_json(self.manifest_path)
+            manifest.setdefault("assets", {}).update(updated)
+            _write_json(self.manifest_path, manifest)
+
+def provision_assets(names: List[str], source=None, jobs: int = DEFAULT_JOBS, verify: bool = False) -> Dict[str, str]:
+    """Provision assets with an AssetProvisioner in the working directory."""
+    return AssetProvisioner(source, jobs=jobs, verify=verify).provision(names)
+
+def voice_assets(voice_files: List[str]) -> List[str]:
+    return [f"voices/{voice_file}" for voice_file in voice_files]
+
+def write_source_manifest(root: str, names: Optional[List[str]] = None) -> Path:
+    """Write manifest.json with the size and sha256 of every file in a mirror directory."""
+    root = Path(root)
+    if names is None:
+        names = sorted(p.relative_to(root).as_posix() for p in root.rglob('*')
+                       if p.is_file() and p.name != SOURCE_MANIFEST and not p.name.endswith('.part'))
+    assets = {name: {"size": (root / name).stat().st_size, "sha256": sha256_file(root / name)} for name in names}
+    _write_json(root / SOURCE_MANIFEST, {"assets": assets})
+    return root / SOURCE_MANIFEST
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", help="'hf[:repo[@revision]]', a mirror directory or a tarball "
+                                         "(default: KOKORO_ASSET_SOURCE or hf)")
+    parser.add_argument("--voices", help="Comma-separated voices to fetch (default: all)")
+    parser.add_argument("--no-model", action="store_true", help="Skip the model weights and config")
+    parser.add_argument("--verify", action="store_true", help="Re-hash every file even if the manifest matches")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="Files fetched at the same time")
+    parser.add_argument("--write-manifest", metavar="DIR", help="Write manifest.json for a mirror directory and exit")
+    args = parser.parse_args(argv)
+
+    if args.write_manifest:
+        path = write_source_manifest(args.write_manifest)
+        print(f"Wrote {path}")
+        return 0
+
+    from models import VOICE_FILES
+    voice_files = VOICE_FILES
+    if args.voices:
+        voice_files = [v.strip().replace('.pt', '') + '.pt' for v in args.voices.split(',') if v.strip()]
+    names = ([] if args.no_model else [MODEL_FILE, CONFIG_FILE]) + voice_assets(voice_files)
+    try:
+        statuses = provision_assets(names, args.source, args.jobs, args.verify)
+    except ValueError as e:
+        parser.error(str(e))
+    counts = {}
+    for status in statuses.values():
+        key = status.split(':')[0]
+        counts[key] = counts.get(key, 0) + 1
+    print(", ".join(f"{count} {key}" for key, count in sorted(counts.items())))
+    return 1 if counts.get("failed") else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
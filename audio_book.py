@@ -1,13 +1,20 @@
 import torch
 from typing import Optional, Tuple, List
 from models import build_model, generate_speech, list_available_voices
+from runtime_config import configure_runtime
+from instrumentation import configure_tracing, get_tracer, instrument_pipeline
+from profiling import ChunkProfiler, profiler_from_env
+from pcm_buffer import PCMBuffer
+from loudness import StreamingNormalizer, apply_gain
+from memory_budget import get_governor
+from contextlib import nullcontext
 from tqdm.auto import tqdm
-import soundfile as sf
 from pathlib import Path
-import numpy as np
 import os
+import subprocess
 import pdfplumber
 import datetime
+import time
 
 # Constants
 SAMPLE_RATE = 24000
@@ -15,6 +22,7 @@ DEFAULT_MODEL_PATH = 'kokoro-v1_0.pth'
 DEFAULT_OUTPUT_FILE = 'outputs/output.wav'
 DEFAULT_LANGUAGE = 'a'  # 'a' for American English, 'b' for British English
 DEFAULT_TEXT = "Hello, welcome to this text-to-speech test."
+CHUNK_SILENCE_SECONDS = 0.5  # Silence inserted after each chunk
 
 # Configure tqdm for better Windows console support
 tqdm.monitor_interval = 0
@@ -83,48 +91,81 @@ def extract_text_from_pdf(file_path: str) -> List[str]:
                     print("Please enter valid numbers")
             
             # Extract text from selected pages
-            text_lines = []
-            for page_num in range(start_page - 1, end_page):
-                page = pdf.pages[page_num]
-                text = page.extract_text(x_tolerance=3, y_tolerance=3)
-                
-                if text:
-                    # Split text into paragraphs
-                    paragraphs = text.split('\n')
-                    
-                    for paragraph in paragraphs:
-                        # Clean and normalize the paragraph
-                        cleaned_text = ' '.join(paragraph.split())
-                        
-                        # Split into sentences at punctuation marks
-                        current_sentence = []
-                        current_length = 0
-                        
-                        words = cleaned_text.split()
-                        for word in words:
-                            # Check if word ends with sentence-ending punctuation
-                            ends_sentence = any(word.endswith(p) for p in ['.', '!', '?', ':'])
-                            
-                            # Add word to current sentence
-                            current_sentence.append(word)
-                            current_length += len(word) + 1
-                            
-                            # Check if we should start a new line
-                            if ends_sentence or current_length > 150:
-                                if current_sentence:
-                                    text_lines.append(' '.join(current_sentence))
-                                    current_sentence = []
-                                    current_length = 0
-                        
-                        # Add any remaining words
-                        if current_sentence:
-                            text_lines.append(' '.join(current_sentence))
+            text_lines = extract_pdf_pages(pdf, start_page, end_page)
             
             return text_lines if text_lines else [DEFAULT_TEXT]
     except Exception as e:
         print(f"Error reading PDF file: {e}")
         return [DEFAULT_TEXT]
 
+def extract_pdf_pages(pdf, start_page: int, end_page: int) -> List[str]:
+    """Extract lines from pages start_page..end_page (1-based, inclusive) of an open PDF."""
+    text_lines = []
+    with get_tracer().stage("pdf_extraction"):
+        for page_num in range(start_page - 1, end_page):
+            page = pdf.pages[page_num]
+            text = page.extract_text(x_tolerance=3, y_tolerance=3)
+            
+            if text:
+                # Split text into paragraphs
+                paragraphs = text.split('\n')
+                
+                for paragraph in paragraphs:
+                    # Clean and normalize the paragraph
+                    cleaned_text = ' '.join(paragraph.split())
+                    
+                    # Split into sentences at punctuation marks
+                    current_sentence = []
+                    current_length = 0
+                    
+                    words = cleaned_text.split()
+                    for word in words:
+                        # Check if word ends with sentence-ending punctuation
+                        ends_sentence = any(word.endswith(p) for p in ['.', '!', '?', ':'])
+                        
+                        # Add word to current sentence
+                        current_sentence.append(word)
+                        current_length += len(word) + 1
+                        
+                        # Check if we should start a new line
+                        if ends_sentence or current_length > 150:
+                            if current_sentence:
+                                text_lines.append(' '.join(current_sentence))
+                                current_sentence = []
+                                current_length = 0
+                    
+                    # Add any remaining words
+                    if current_sentence:
+                        text_lines.append(' '.join(current_sentence))
+    
+    return text_lines
+
+def read_input_file(file_path: str, start_page: Optional[int] = None,
+                    end_page: Optional[int] = None) -> List[str]:
+    """Read text lines from a .txt or .pdf file without prompting.
+    
+    Reads every page of a PDF unless a page range is given. Raises ValueError
+    for unsupported file types, invalid page ranges or files without text."""
+    file_extension = os.path.splitext(file_path)[1].lower()
+    
+    if file_extension == '.pdf':
+        with pdfplumber.open(file_path) as pdf:
+            total_pages = len(pdf.pages)
+            start_page = start_page or 1
+            end_page = end_page or total_pages
+            if not 1 <= start_page <= end_page <= total_pages:
+                raise ValueError(f"Invalid page range {start_page}-{end_page} for a PDF with {total_pages} pages")
+            lines = extract_pdf_pages(pdf, start_page, end_page)
+    elif file_extension == '.txt':
+        with open(file_path, 'r', encoding='utf-8') as f:
+            lines = [line.strip() for line in f.readlines() if line.strip()]
+    else:
+        raise ValueError(f"Unsupported input file type: {file_extension}")
+    
+    if not lines:
+        raise ValueError(f"No text found in {file_path}")
+    return lines
+
 def find_input_files() -> List[str]:
     """Find all PDF and TXT files in the input directory."""
     input_dir = Path('input')
@@ -173,9 +214,7 @@ def get_file_input() -> List[str]:
         if file_extension == '.pdf':
             return extract_text_from_pdf(file_path)
         elif file_extension == '.txt':
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = [line.strip() for line in f.readlines() if line.strip()]
-            return lines if lines else [DEFAULT_TEXT]
+            return read_input_file(file_path)
     except Exception as e:
         print(f"Error reading file: {e}")
         return [DEFAULT_TEXT]
@@ -262,98 +301,173 @@ def split_text_into_chunks(text: str) -> List[str]:
     
     return chunks
 
-def generate_audio(model, text_lines: List[str], voice: str, speed: float) -> None:
+def save_normalized(source_wav: Path, output_path: Path, format: str, gain_db: float) -> Path:
+    """Write the final file from an unnormalized float WAV, applying gain_db on the way.
+    
+    WAV output is scaled block by block; for MP3/AAC the gain is applied by
+    FFmpeg's volume filter in the encoding pass. The source file is removed.
+    Returns the path written, which is a WAV if conversion failed."""
+    tracer = get_tracer()
+    output_path = Path(output_path)
+    if format == "wav":
+        with tracer.stage("write"):
+            apply_gain(source_wav, output_path, gain_db)
+        source_wav.unlink()
+        return output_path
+    
+    # Convert to desired format using FFmpeg, applying the gain in the same pass
+    if format == "mp3":
+        codec = ["-codec:a", "libmp3lame", "-qscale:a", "2"]
+    else:
+        codec = ["-c:a", "aac", "-b:a", "192k"]
+    try:
+        with tracer.stage("encode"):
+            subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-i", str(source_wav),
+                            "-af", f"volume={gain_db:.2f}dB", *codec, str(output_path)], check=True)
+        if not output_path.exists() or output_path.stat().st_size == 0:
+            raise RuntimeError(f"FFmpeg did not write {output_path}")
+        
+        # Remove the unnormalized WAV file only once the encoded file exists
+        source_wav.unlink()
+        print(f"\nAudio saved as: {output_path}")
+        return output_path
+    except (subprocess.CalledProcessError, FileNotFoundError, RuntimeError) as e:
+        print(f"Error converting to {format.upper()}: {e}")
+        wav_path = output_path.with_suffix('.wav')
+        with tracer.stage("write"):
+            apply_gain(source_wav, wav_path, gain_db)
+        source_wav.unlink()
+        print(f"WAV file saved as: {wav_path}")
+        return wav_path
+
+def generate_audio(model, text_lines: List[str], voice: str, speed: float,
+                   profiler: Optional[ChunkProfiler] = None, audio_format: Optional[str] = None,
+                   output_path: Optional[str] = None, stats: Optional[dict] = None) -> Optional[Path]:
     """Generate audio for multiple lines of text and combine into a single file.
-    Skips problematic chunks instead of stopping the entire process."""
-    all_audio_segments = []
+    Skips problematic chunks instead of stopping the entire process.
+    
+    The format ('wav', 'mp3' or 'aac') is asked interactively unless
+    audio_format is given, and the output goes to a timestamped file in
+    outputs/ unless output_path is given. Returns the written file's path,
+    or None if nothing was written. The path is a WAV file if encoding to
+    MP3/AAC failed. If a stats dict is given, it is filled with the render's
+    audio_seconds, chunks and failed_chunks.
+    
+    If a ChunkProfiler is given, selected chunks are profiled and their traces
+    saved in an <output>_profile directory next to the output file."""
     failed_chunks = []
+    tracer = get_tracer()
+    governor = get_governor()
+    render_start = time.perf_counter()
     
     # Join all lines with appropriate spacing
     full_text = ' '.join(text_lines)
     
     # Split text into natural chunks
-    chunks = split_text_into_chunks(full_text)
+    with tracer.stage("segmentation"):
+        chunks = split_text_into_chunks(full_text)
     
-    # Get desired audio format
-    format, extension = get_audio_format()
+    # One chunk-sized buffer, reused for every chunk; finished chunks are
+    # streamed to disk, so memory does not grow with the length of the text
+    pcm = PCMBuffer.for_text(max((len(chunk) for chunk in chunks), default=0), speed,
+                             silence_seconds=CHUNK_SILENCE_SECONDS)
     
-    # Create a timestamp for unique filename
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_path = Path(f"outputs/output_{timestamp}{extension}")
+    # Get desired audio format
+    if audio_format is None:
+        format, extension = get_audio_format()
+    else:
+        format, extension = audio_format, f".{audio_format}"
     
-    for idx, chunk in enumerate(chunks, 1):
-        print(f"\nProcessing chunk {idx}/{len(chunks)}: '{chunk}'")
-        
-        try:
-            chunk_audio = []
-            generator = model(chunk, voice=f"voices/{voice}.pt", speed=speed)
-            
-            with tqdm(desc="Generating") as pbar:
-                try:
-                    for gs, ps, audio in generator:
-                        if audio is not None:
-                            if isinstance(audio, np.ndarray):
-                                audio = torch.from_numpy(audio).float()
-                            chunk_audio.append(audio)
-                            pbar.update(1)
-                except Exception as e:
-                    print(f"\nWarning: Error processing audio segment: {e}")
-                    failed_chunks.append((chunk, str(e)))
-                    continue
-            
-            if chunk_audio:
-                # Combine audio for this chunk
-                chunk_combined = torch.cat(chunk_audio, dim=0)
-                all_audio_segments.append(chunk_combined.numpy())
-                
-                # Add silence between chunks
-                silence = np.zeros(int(SAMPLE_RATE * 0.5))  # 0.5s silence
-                all_audio_segments.append(silence)
-            else:
-                print(f"\nWarning: No audio generated for chunk: '{chunk}'")
-                failed_chunks.append((chunk, "No audio generated"))
-        except Exception as e:
-            print(f"\nWarning: Failed to process chunk: '{chunk}'. Error: {e}")
-            failed_chunks.append((chunk, str(e)))
-            continue
+    if output_path is None:
+        # Create a timestamp for unique filename
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_path = Path(f"outputs/output_{timestamp}{extension}")
+    else:
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+    if profiler:
+        profiler.begin(output_path.with_name(f"{output_path.stem}_profile"))
     
-    if all_audio_segments:
-        # Combine all audio segments
-        audio_array = np.concatenate(all_audio_segments)
-        
-        # Normalize audio
-        audio_array = audio_array / np.max(np.abs(audio_array))
-        
-        # Save the audio file in the desired format
-        if format == "wav":
-            sf.write(output_path, audio_array, SAMPLE_RATE)
-        else:
-            # Save as WAV first
-            temp_wav = output_path.with_suffix('.wav')
-            sf.write(temp_wav, audio_array, SAMPLE_RATE)
+    # Audio is written unnormalized while its loudness is measured
+    stream = StreamingNormalizer(output_path.with_name(f"{output_path.stem}.unnormalized.wav"), SAMPLE_RATE)
+    try:
+        for idx, chunk in enumerate(chunks, 1):
+            # Evict voices and spill buffers if the process is over its memory budget
+            governor.throttle()
+            print(f"\nProcessing chunk {idx}/{len(chunks)}: '{chunk}'")
+            tracer.begin_chunk(idx, chunk)
+            chunk_samples = 0
+            chunk_error = None
             
-            # Convert to desired format using FFmpeg
+            pcm.truncate(0)
             try:
-                if format == "mp3":
-                    os.system(f'ffmpeg -i "{temp_wav}" -codec:a libmp3lame -qscale:a 2 "{output_path}"')
-                elif format == "aac":
-                    os.system(f'ffmpeg -i "{temp_wav}" -c:a aac -b:a 192k "{output_path}"')
+                generator = model(chunk, voice=f"voices/{voice}.pt", speed=speed)
+                chunk_profile = profiler.chunk(idx, chunk) if profiler else nullcontext()
+                
+                with tqdm(desc="Generating") as pbar, chunk_profile:
+                    try:
+                        for gs, ps, audio in generator:
+                            tracer.add_phonemes(ps)
+                            if audio is not None:
+                                # Copy the segment straight into the chunk buffer
+                                with tracer.stage("concatenate"):
+                                    pcm.append(audio)
+                                pbar.update(1)
+                    except Exception as e:
+                        print(f"\nWarning: Error processing audio segment: {e}")
+                        failed_chunks.append((chunk, str(e)))
+                        chunk_error = str(e)
+                        continue
                 
-                # Remove temporary WAV file
-                temp_wav.unlink()
-                print(f"\nAudio saved as: {output_path}")
+                chunk_samples = len(pcm)
+                if chunk_samples:
+                    # Add silence between chunks
+                    pcm.append_silence(CHUNK_SILENCE_SECONDS)
+                    with tracer.stage("measure"):
+                        stream.write(pcm.view())
+                else:
+                    print(f"\nWarning: No audio generated for chunk: '{chunk}'")
+                    failed_chunks.append((chunk, "No audio generated"))
+                    chunk_error = "No audio generated"
             except Exception as e:
-                print(f"Error converting to {format.upper()}: {e}")
-                print(f"WAV file saved as: {temp_wav}")
-                return
+                print(f"\nWarning: Failed to process chunk: '{chunk}'. Error: {e}")
+                failed_chunks.append((chunk, str(e)))
+                chunk_error = str(e)
+                chunk_samples = 0
+                continue
+            finally:
+                tracer.end_chunk(chunk_samples, chunk_error)
+    except BaseException:
+        stream.discard()
+        raise
+    stream.close()
+    
+    if profiler:
+        # Re-run the slowest chunks under the profilers and rank all chunks
+        profiler.finish(lambda text: list(model(text, voice=f"voices/{voice}.pt", speed=speed)))
+    
+    if stream.samples:
+        # Loudness-normalize while writing or encoding the final file
+        with tracer.stage("normalize"):
+            gain_db = stream.gain_db()
+        saved_path = save_normalized(stream.path, output_path, format, gain_db)
+        if stats is not None:
+            stats.update(audio_seconds=stream.seconds, chunks=len(chunks), failed_chunks=len(failed_chunks))
+        
+        tracer.event("render", output=str(saved_path), chunks=len(chunks), failed_chunks=len(failed_chunks),
+                     audio_seconds=stream.seconds, wall=time.perf_counter() - render_start, buffer=pcm.stats(),
+                     loudness=stream.summary(), memory=governor.summary())
         
         # Report any failed chunks after successful audio generation
         if failed_chunks:
             print("\nWarning: Some chunks were skipped during processing:")
             for chunk, error in failed_chunks:
                 print(f"- Failed chunk: '{chunk}'\n  Error: {error}")
+        return saved_path
     else:
+        stream.discard()
         print("No audio was generated. Please check if the input text is not empty.")
+        return None
 
 def main() -> None:
     try:
@@ -361,11 +475,21 @@ def main() -> None:
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
         print(f"Using device: {device}")
         
+        # Apply thread/affinity settings from KOKORO_RUNTIME or runtime.json, if any
+        configure_runtime()
+        
+        # Enable timing trace/metrics from KOKORO_TRACE or KOKORO_METRICS_PORT, if set
+        configure_tracing()
+        
         # Initialize model directly without verification
         model = build_model(DEFAULT_MODEL_PATH, device)
+        instrument_pipeline(model)
         
         voices = list_available_voices()
         
+        # Profile hot chunks if KOKORO_PROFILE_SLOWEST or KOKORO_PROFILE_PATTERN is set
+        profiler = profiler_from_env()
+        
         while True:
             choice = print_menu()
             
@@ -374,14 +498,14 @@ def main() -> None:
                 text_lines = get_text_input()
                 voice = select_voice(voices)
                 speed = get_speed()
-                generate_audio(model, text_lines, voice, speed)
+                generate_audio(model, text_lines, voice, speed, profiler)
             
             elif choice == "2":
                 # Generate speech from PDF file or TXT file
                 text_lines = get_file_input()
                 voice = select_voice(voices)
                 speed = get_speed()
-                generate_audio(model, text_lines, voice, speed)
+                generate_audio(model, text_lines, voice, speed, profiler)
             
             elif choice == "3":
                 print("\nGoodbye!")
@@ -396,6 +520,7 @@ def main() -> None:
         # Cleanup
         if 'model' in locals():
             del model
+        get_tracer().close()
         torch.cuda.empty_cache()
 
 if __name__ == "__main__":
@@ -0,0 +1,205 @@
+"""Headless batch rendering for Kokoro TTS Local
+
+Renders every item of a manifest with one warm model, without prompts.
+The manifest is JSONL (one object per line) or CSV (with a header row):
+
+    {"input": "input/book.pdf", "pages": "5-120", "voice": "am_adam", "speed": 1.1,
+     "format": "mp3", "output": "outputs/book.mp3"}
+
+    input,pages,voice,speed,format,output
+    input/story.txt,,af_bella,1.0,wav,outputs/story.wav
+
+Only "input" is required. Defaults: all pages, voice af_bella, speed 1.0,
+format from the output suffix (or wav), output outputs/<input stem>.<format>.
+
+Usage:
+    python batch_render.py manifest.jsonl [--report outputs/batch_report.jsonl]
+"""
+from typing import Optional, List
+from contextlib import nullcontext, redirect_stderr, redirect_stdout
+from pathlib import Path
+import argparse
+import csv
+import io
+import json
+import os
+import time
+import torch
+import soundfile as sf
+
+from models import build_model, QUANTIZE_MODES, BACKENDS
+from audio_book import generate_audio, read_input_file, DEFAULT_MODEL_PATH
+from runtime_config import configure_runtime
+from instrumentation import configure_tracing, get_tracer, instrument_pipeline
+
+DEFAULT_VOICE = "af_bella"
+AUDIO_FORMATS = ("wav", "mp3", "aac")
+
+def parse_pages(pages: Optional[str]) -> tuple:
+    """Parse a page range such as '5-120' or '7' into (start_page, end_page)."""
+    if pages is None or not str(pages).strip():
+        return None, None
+    pages = str(pages).strip()
+    if '-' in pages:
+        start, end = pages.split('-', 1)
+        return int(start), int(end)
+    return int(pages), int(pages)
+
+def load_manifest(manifest_path: str) -> List[dict]:
+    """Load manifest items from a .jsonl or .csv file."""
+    suffix = Path(manifest_path).suffix.lower()
+    with open(manifest_path, 'r', encoding='utf-8', newline='') as f:
+        if suffix == '.csv':
+            rows = list(csv.DictReader(f))
+        elif suffix in ('.jsonl', '.json'):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            raise ValueError(f"Unsupported manifest type: {suffix} (use .jsonl or .csv)")
+    return [normalize_item(row, line) for line, row in enumerate(rows, 1)]
+
+def normalize_item(row: dict, line: int, output_dir: str = "outputs") -> dict:
+    """Fill in defaults for one manifest row and validate it."""
+    row = {k.strip(): v.strip() if isinstance(v, str) else v for k, v in row.items() if k and v not in (None, '')}
+    if 'input' not in row:
+        raise ValueError(f"Manifest item {line} has no 'input'")
+
+    output = row.get('output')
+    audio_format = row.get('format') or (Path(output).suffix.lstrip('.').lower() if output else 'wav')
+    if audio_format not in AUDIO_FORMATS:
+        raise ValueError(f"Manifest item {line}: unsupported format '{audio_format}'")
+    if not output:
+        output = str(Path(output_dir) / f"{Path(row['input']).stem}.{audio_format}")
+
+    if 'pages' in row:
+        start_page, end_page = parse_pages(row['pages'])
+    else:
+        start_page = int(row['start_page']) if 'start_page' in row else None
+        end_page = int(row['end_page']) if 'end_page' in row else None
+
+    speed = float(row.get('speed', 1.0))
+    if not 0.5 <= speed <= 2.0:
+        raise ValueError(f"Manifest item {line}: speed must be between 0.5 and 2.0")
+
+    return {
+        "line": line,
+        "input": row['input'],
+        "output": output,
+        "format": audio_format,
+        "voice": row.get('voice', DEFAULT_VOICE).replace('.pt', ''),
+        "speed": speed,
+        "start_page": start_page,
+        "end_page": end_page,
+    }
+
+def audio_duration(path: Path) -> Optional[float]:
+    """Return the duration of an audio file in seconds, if soundfile can read it."""
+    try:
+        return sf.info(str(path)).duration
+    except Exception:
+        return None
+
+def render_item(model, item: dict, quiet: bool = False) -> dict:
+    """Render one manifest item and return its status record."""
+    status = {"input": item["input"], "output": item["output"], "voice": item["voice"],
+              "speed": item["speed"], "format": item["format"]}
+    start = time.perf_counter()
+    try:
+        if not os.path.exists(f"voices/{item['voice']}.pt"):
+            raise ValueError(f"Voice file not found: voices/{item['voice']}.pt")
+        lines = read_input_file(item["input"], item["start_page"], item["end_page"])
+        status["characters"] = sum(len(line) for line in lines)
+
+        sink = io.StringIO()
+        render = {}
+        with redirect_stdout(sink) if quiet else nullcontext(), redirect_stderr(sink) if quiet else nullcontext():
+            output_path = generate_audio(model, lines, item["voice"], item["speed"],
+                                         audio_format=item["format"], output_path=item["output"], stats=render)
+        if output_path is None:
+            raise RuntimeError("No audio was generated")
+        output_path = Path(output_path)
+        if not output_path.exists() or output_path.stat().st_size == 0:
+            raise RuntimeError(f"Output file was not written: {output_path}")
+        if output_path != Path(item["output"]):
+            # generate_audio fell back to WAV because encoding failed
+            raise RuntimeError(f"Encoding to {item['format'].upper()} failed; unencoded audio kept at {output_path}")
+
+        # soundfile cannot read AAC; the rendered sample count is just as good
+        duration = audio_duration(output_path) or render.get("audio_seconds")
+        status.update({"status": "ok", "output": str(output_path), "audio_seconds": duration})
+    except Exception as e:
+        status.update({"status": "failed", "error": str(e)})
+    status["wall_seconds"] = time.perf_counter() - start
+    if status.get("audio_seconds"):
+        status["rtf"] = status["wall_seconds"] / status["audio_seconds"]
+    get_tracer().event("batch_item", **status)
+    return status
+
+def print_summary(results: List[dict], wall_seconds: float) -> None:
+    """Print aggregate counts and throughput for a batch run."""
+    ok = [r for r in results if r["status"] == "ok"]
+    failed = [r for r in results if r["status"] == "failed"]
+    skipped = [r for r in results if r["status"] == "skipped"]
+    audio_seconds = sum(r.get("audio_seconds") or 0 for r in ok)
+    characters = sum(r.get("characters") or 0 for r in ok)
+
+    print("\n=== Batch summary ===")
+    print(f"Items: {len(results)} ({len(ok)} ok, {len(failed)} failed, {len(skipped)} skipped)")
+    print(f"Wall time: {wall_seconds:.1f}s")
+    if characters:
+        print(f"Characters: {characters} ({characters / wall_seconds:.0f} chars/s)")
+    if audio_seconds:
+        print(f"Audio produced: {audio_seconds / 60:.1f} min "
+              f"({audio_seconds / wall_seconds:.2f}x real time, RTF {wall_seconds / audio_seconds:.3f})")
+    for r in failed:
+        print(f"- Failed: {r['input']}: {r['error']}")
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest", help="Manifest file (.jsonl or .csv)")
+    parser.add_argument("--report", help="Write per-item status as JSON lines to this file")
+    parser.add_argument("--skip-existing", action="store_true", help="Skip items whose output already exists")
+    parser.add_argument("--quantize", choices=[m for m in QUANTIZE_MODES if m], help="Quantized CPU inference")
+    parser.add_argument("--backend", choices=BACKENDS, default="eager", help="Inference backend")
+    parser.add_argument("--quiet", action="store_true", help="Hide per-chunk progress output")
+    args = parser.parse_args(argv)
+
+    items = load_manifest(args.manifest)
+    print(f"Loaded {len(items)} item(s) from {args.manifest}")
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    configure_runtime()
+    configure_tracing()
+    model = build_model(DEFAULT_MODEL_PATH, device, quantize=args.quantize, backend=args.backend)
+    instrument_pipeline(model)
+
+    report = open(args.report, 'a', encoding='utf-8') if args.report else None
+    results = []
+    start = time.perf_counter()
+    try:
+        for i, item in enumerate(items, 1):
+            print(f"\n[{i}/{len(items)}] {item['input']} -> {item['output']}")
+            if args.skip_existing and os.path.exists(item["output"]):
+                result = {"input": item["input"], "output": item["output"], "status": "skipped"}
+            else:
+                result = render_item(model, item, quiet=args.quiet)
+            results.append(result)
+
+            if result["status"] == "ok":
+                audio = result.get("audio_seconds")
+                timing = f" ({audio:.1f}s audio in {result['wall_seconds']:.1f}s)" if audio else ""
+                print(f"[{i}/{len(items)}] ok{timing}")
+            else:
+                print(f"[{i}/{len(items)}] {result['status']}{': ' + result['error'] if 'error' in result else ''}")
+            if report:
+                report.write(json.dumps(result) + "\n")
+                report.flush()
+    finally:
+        if report:
+            report.close()
+        print_summary(results, time.perf_counter() - start)
+        get_tracer().close()
+
+    return 1 if any(r["status"] == "failed" for r in results) else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1 @@
+"""Benchmarks for Kokoro TTS Local"""
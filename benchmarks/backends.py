@@ -0,0 +1,115 @@
+"""Compare chunk-level latency of the eager and ONNX Runtime backends.
+
+Each backend runs in its own process. Every fixed text is synthesized as one
+chunk, the way generate_audio feeds chunks to the pipeline, and the report
+lists per-chunk latency plus an equivalence check against eager output.
+
+The decoder draws random noise for its harmonic source and ONNX Runtime
+uses its own RNG, so outputs are compared by length (identical predicted
+durations) and log-spectral distance rather than sample by sample.
+
+Usage:
+    python -m benchmarks.backends [--voice af_bella] [--repeats 5] [--tolerance-db 3.0]
+"""
+from typing import Optional
+from pathlib import Path
+import argparse
+import tempfile
+import time
+import numpy as np
+
+from benchmarks.common import (
+    DEFAULT_MODEL_PATH, DEFAULT_VOICE, FIXED_TEXTS, SAMPLE_RATE, log_spectral_distance,
+    print_table, run_worker_process, synthesize, write_report
+)
+
+BACKENDS = ("eager", "onnx")
+
+def run_worker(backend: str, voice: str, repeats: int, output_file: str) -> None:
+    """Time every fixed text as a single chunk on one backend."""
+    from models import build_model
+
+    start = time.perf_counter()
+    model = build_model(DEFAULT_MODEL_PATH, 'cpu', backend=backend)
+    load_seconds = time.perf_counter() - start
+
+    # Warm up kernels and the voice cache before timing
+    synthesize(model, FIXED_TEXTS[0], voice)
+
+    audios, latencies = [], []
+    for text in FIXED_TEXTS:
+        runs = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            audio = synthesize(model, text, voice)
+            runs.append(time.perf_counter() - start)
+        audios.append(audio)
+        latencies.append(runs)
+
+    arrays = {f"audio_{i}": audio for i, audio in enumerate(audios)}
+    np.savez(output_file, latencies=np.array(latencies), load_seconds=load_seconds, **arrays)
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--voice", default=DEFAULT_VOICE, help="Voice to synthesize with")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per chunk")
+    parser.add_argument("--tolerance-db", type=float, default=3.0,
+                        help="Maximum log-spectral distance for outputs to count as equivalent")
+    parser.add_argument("--worker", choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(args.worker, args.voice, args.repeats, args.worker_output)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {
+            backend: run_worker_process(
+                "benchmarks.backends",
+                ["--worker", backend, "--voice", args.voice, "--repeats", str(args.repeats)],
+                Path(tmp) / f"{backend}.npz"
+            )
+            for backend in BACKENDS
+        }
+
+    eager, onnx = results["eager"], results["onnx"]
+    chunks = []
+    for i, text in enumerate(FIXED_TEXTS):
+        eager_audio, onnx_audio = eager[f"audio_{i}"], onnx[f"audio_{i}"]
+        eager_ms = float(np.median(eager["latencies"][i])) * 1000
+        onnx_ms = float(np.median(onnx["latencies"][i])) * 1000
+        distance = log_spectral_distance(eager_audio, onnx_audio)
+        chunks.append({
+            "chunk": i + 1,
+            "chars": len(text),
+            "audio_s": len(eager_audio) / SAMPLE_RATE,
+            "eager_ms": eager_ms,
+            "onnx_ms": onnx_ms,
+            "speedup": eager_ms / onnx_ms if onnx_ms else None,
+            "same_length": len(eager_audio) == len(onnx_audio),
+            "lsd_db": distance,
+            "equivalent": len(eager_audio) == len(onnx_audio) and distance <= args.tolerance_db,
+        })
+
+    summary = {
+        "eager_load_s": float(eager["load_seconds"]),
+        "onnx_load_s": float(onnx["load_seconds"]),
+        "eager_p50_ms": float(np.median(eager["latencies"])) * 1000,
+        "onnx_p50_ms": float(np.median(onnx["latencies"])) * 1000,
+        "eager_p95_ms": float(np.percentile(eager["latencies"], 95)) * 1000,
+        "onnx_p95_ms": float(np.percentile(onnx["latencies"], 95)) * 1000,
+        "all_equivalent": all(c["equivalent"] for c in chunks),
+    }
+
+    print("\n=== Backend latency per chunk (CPU) ===")
+    print_table(chunks, ["chunk", "chars", "audio_s", "eager_ms", "onnx_ms", "speedup", "lsd_db", "equivalent"])
+    print()
+    for key, value in summary.items():
+        print(f"{key}: {value:.1f}" if isinstance(value, float) else f"{key}: {value}")
+    path = write_report({"voice": args.voice, "repeats": args.repeats, "tolerance_db": args.tolerance_db,
+                         "summary": summary, "chunks": chunks, "texts": FIXED_TEXTS}, "backends")
+    print(f"\nReport saved to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Shared helpers for the Kokoro TTS benchmarks"""
+from typing import Optional, List
+from pathlib import Path
+import datetime
+import json
+import subprocess
+import sys
+import numpy as np
+
+SAMPLE_RATE = 24000
+DEFAULT_MODEL_PATH = 'kokoro-v1_0.pth'
+DEFAULT_VOICE = 'af_bella'
+RESULTS_DIR = Path('outputs/benchmarks')
+
+# Fixed text set used to compare engines and precisions. Covers plain prose,
+# numbers, abbreviations, long words and dialogue punctuation.
+FIXED_TEXTS = [
+    "Hello, welcome to this text-to-speech test.",
+    "The quick brown fox jumps over the lazy dog while the cat watches from the windowsill.",
+    "On March 3rd, 1998, Dr. Smith paid $1,250.75 for 12 boxes at 4:30 p.m.",
+    "Incomprehensibilities and antidisestablishmentarianism are notoriously difficult words.",
+    "\"Are you coming?\" she asked. \"Not yet,\" he replied, \"I still have three chapters left!\"",
+    "It was the best of times, it was the worst of times, it was the age of wisdom, "
+    "it was the age of foolishness, it was the epoch of belief, it was the epoch of incredulity.",
+]
+
+def synthesize(model, text: str, voice: str = DEFAULT_VOICE, speed: float = 1.0, seed: int = 0) -> np.ndarray:
+    """Synthesize text with a KPipeline and return the concatenated float32 audio.
+
+    The decoder's harmonic source draws random noise, so the RNG is seeded
+    before every call to make runs comparable.
+    """
+    import torch
+    torch.manual_seed(seed)
+    segments = []
+    for gs, ps, audio in model(text, voice=f"voices/{voice}.pt", speed=speed):
+        if audio is not None:
+            if isinstance(audio, torch.Tensor):
+                audio = audio.numpy()
+            segments.append(np.asarray(audio, dtype=np.float32))
+    if not segments:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(segments)
+
+def run_worker_process(module: str, worker_args: List[str], output_file: Path) -> dict:
+    """Run a benchmark worker in a fresh interpreter and load the arrays it saved.
+
+    The model is a process-wide singleton, so every configuration that needs
+    its own model (precision, backend) is measured in its own process.
+    """
+    subprocess.run(
+        [sys.executable, "-m", module, *worker_args, "--worker-output", str(output_file)],
+        check=True
+    )
+    with np.load(output_file) as data:
+        return {key: data[key] for key in data.files}
+
+def peak_rss_mb() -> Optional[float]:
+    """Return the peak resident set size of this process in MiB, if available."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in KiB elsewhere
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+def log_spectral_distance(reference: np.ndarray, candidate: np.ndarray,
+                          n_fft: int = 1024, hop: int = 256) -> float:
+    """Log-spectral distance in dB between two signals, over their common length.
+
+    Durations can differ by a few frames between engines because predicted
+    phoneme durations are rounded, so the comparison is done on magnitude
+    spectra rather than on raw samples.
+    """
+    length = min(len(reference), len(candidate))
+    if length < n_fft:
+        return float('nan')
+    window = np.hanning(n_fft).astype(np.float32)
+
+    def log_spectrum(signal: np.ndarray) -> np.ndarray:
+        frames = np.lib.stride_tricks.sliding_window_view(signal[:length], n_fft)[::hop]
+        magnitude = np.abs(np.fft.rfft(frames * window, axis=-1))
+        return 20 * np.log10(np.maximum(magnitude, 1e-5))
+
+    diff = log_spectrum(reference) - log_spectrum(candidate)
+    return float(np.mean(np.sqrt(np.mean(diff ** 2, axis=-1))))
+
+def write_report(report: dict, name: str) -> Path:
+    """Write a benchmark report as JSON under outputs/benchmarks and return its path."""
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    path = RESULTS_DIR / f"{name}_{timestamp}.json"
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    return path
+
+def print_table(rows: List[dict], columns: List[str]) -> None:
+    """Print a list of result rows as a plain-text table."""
+    widths = {c: max(len(c), *(len(_format_cell(r.get(c))) for r in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(_format_cell(row.get(c)).ljust(widths[c]) for c in columns))
+
+def _format_cell(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return "-" if value is None else str(value)
@@ -0,0 +1,90 @@
+"""Fixed benchmark corpora for Kokoro TTS Local
+
+Corpora are generated from a seeded RNG instead of being shipped as files,
+so every checkout benchmarks exactly the same text. Sentences mix plain
+prose with numbers, abbreviations, long words and dialogue, like real books.
+"""
+from typing import List
+from pathlib import Path
+import random
+
+# Number of sentences per corpus
+CORPORA = {"small": 40, "medium": 400, "large": 4000}
+CORPUS_SEED = 82
+
+_SUBJECTS = ["The captain", "Dr. Watson", "An old fisherman", "The committee", "Mrs. O'Neill",
+             "The youngest apprentice", "Professor Lindqvist", "A tired messenger"]
+_VERBS = ["examined", "described", "carried", "remembered", "questioned", "ignored", "measured", "followed"]
+_OBJECTS = ["the weathered map", "a peculiar letter", "the northern lighthouse", "three brass keys",
+            "the unfinished manuscript", "an extraordinarily complicated mechanism", "the harbour records"]
+_TAILS = ["before the storm arrived", "without saying a word", "while the bells rang at St. Mary's",
+          "as the clock struck 11:45 p.m.", "for nearly 2,500 miles", "on the 3rd of September, 1887",
+          "at a cost of $1,249.99", "despite incomprehensible instructions"]
+_QUOTES = ["\"Are you certain?\" she asked.", "\"Not yet,\" he replied, \"but soon.\"",
+           "\"Look!\" cried the boy.", "\"We leave at dawn,\" said the captain."]
+
+def generate_corpus(name: str = "small") -> List[str]:
+    """Return the named corpus as a list of lines (one sentence per line)."""
+    rng = random.Random(f"{CORPUS_SEED}:{name}")
+    lines = []
+    for _ in range(CORPORA[name]):
+        if rng.random() < 0.15:
+            lines.append(rng.choice(_QUOTES))
+        else:
+            sentence = f"{rng.choice(_SUBJECTS)} {rng.choice(_VERBS)} {rng.choice(_OBJECTS)} {rng.choice(_TAILS)}"
+            if rng.random() < 0.3:
+                sentence += f", and {rng.choice(_SUBJECTS).lower()} {rng.choice(_VERBS)} {rng.choice(_OBJECTS)}"
+            lines.append(sentence + rng.choice([".", ".", ".", "!", "?"]))
+    return lines
+
+def _pdf_escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def write_simple_pdf(lines: List[str], path: Path, lines_per_page: int = 45,
+                     max_line_chars: int = 95) -> Path:
+    """Write lines to a minimal text-only PDF (Helvetica, US Letter) at path.
+
+    Long lines are wrapped at word boundaries. Only Latin-1 text is supported,
+    which is all the generated corpora contain.
+    """
+    wrapped = []
+    for line in lines:
+        current = ""
+        for word in line.split():
+            if current and len(current) + len(word) + 1 > max_line_chars:
+                wrapped.append(current)
+                current = word
+            else:
+                current = f"{current} {word}" if current else word
+        if current:
+            wrapped.append(current)
+    pages = [wrapped[i:i + lines_per_page] for i in range(0, len(wrapped), lines_per_page)] or [[]]
+
+    # Object numbers: 1 catalog, 2 pages, 3 font, then (page, content) pairs
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>",
+               3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    for i, page_lines in enumerate(pages):
+        page_obj, content_obj = 4 + 2 * i, 5 + 2 * i
+        kids.append(f"{page_obj} 0 R")
+        text_ops = "".join(f"({_pdf_escape(l)}) Tj T*\n" for l in page_lines)
+        stream = f"BT\n/F1 10 Tf\n14 TL\n50 742 Td\n{text_ops}ET\n".encode('latin-1')
+        objects[page_obj] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                             f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_obj} 0 R >>").encode()
+        objects[content_obj] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"endstream"
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>".encode()
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for number in sorted(objects):
+        offsets[number] = len(output)
+        output += f"{number} 0 obj\n".encode() + objects[number] + b"\nendobj\n"
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for number in sorted(objects):
+        output += f"{offsets[number]:010d} 00000 n \n".encode()
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+
+    path = Path(path)
+    path.write_bytes(bytes(output))
+    return path
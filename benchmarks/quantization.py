@@ -0,0 +1,114 @@
+"""Compare full-precision and dynamic int8 CPU inference.
+
+Each precision runs in its own process so peak memory is measured in
+isolation. Reports real-time factor, peak RSS and the log-spectral distance
+of the quantized audio against fp32 on a fixed text set.
+
+Usage:
+    python -m benchmarks.quantization [--voice af_bella] [--repeats 3]
+"""
+from typing import Optional
+from pathlib import Path
+import argparse
+import tempfile
+import time
+import numpy as np
+
+from benchmarks.common import (
+    DEFAULT_MODEL_PATH, DEFAULT_VOICE, FIXED_TEXTS, SAMPLE_RATE, log_spectral_distance,
+    peak_rss_mb, print_table, run_worker_process, synthesize, write_report
+)
+
+MODES = {"fp32": None, "int8": "int8"}
+
+def run_worker(mode: str, voice: str, repeats: int, output_file: str) -> None:
+    """Synthesize the fixed text set in one precision and save audio and timings."""
+    import torch
+    from models import build_model
+
+    start = time.perf_counter()
+    model = build_model(DEFAULT_MODEL_PATH, 'cpu', quantize=MODES[mode])
+    load_seconds = time.perf_counter() - start
+
+    # Warm up kernels and the voice cache before timing
+    synthesize(model, FIXED_TEXTS[0], voice)
+
+    audios, seconds = [], []
+    with torch.inference_mode():
+        for text in FIXED_TEXTS:
+            best = None
+            for _ in range(repeats):
+                start = time.perf_counter()
+                audio = synthesize(model, text, voice)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            audios.append(audio)
+            seconds.append(best)
+
+    arrays = {f"audio_{i}": audio for i, audio in enumerate(audios)}
+    np.savez(output_file, seconds=np.array(seconds), load_seconds=load_seconds,
+             peak_rss_mb=peak_rss_mb() or np.nan, **arrays)
+
+def run_mode(mode: str, voice: str, repeats: int, work_dir: Path) -> dict:
+    """Run one precision in a fresh interpreter and load its results."""
+    data = run_worker_process(
+        "benchmarks.quantization",
+        ["--worker", mode, "--voice", voice, "--repeats", str(repeats)],
+        work_dir / f"{mode}.npz"
+    )
+    return {
+        "seconds": data["seconds"].tolist(),
+        "load_seconds": float(data["load_seconds"]),
+        "peak_rss_mb": float(data["peak_rss_mb"]),
+        "audio": [data[f"audio_{i}"] for i in range(len(FIXED_TEXTS))],
+    }
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--voice", default=DEFAULT_VOICE, help="Voice to synthesize with")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per text (best is kept)")
+    parser.add_argument("--worker", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(args.worker, args.voice, args.repeats, args.worker_output)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {mode: run_mode(mode, args.voice, args.repeats, Path(tmp)) for mode in MODES}
+
+    reference = results["fp32"]
+    rows, texts = [], []
+    for mode, result in results.items():
+        total_seconds = sum(result["seconds"])
+        total_audio = sum(len(a) for a in result["audio"]) / SAMPLE_RATE
+        distances = [log_spectral_distance(ref, audio) for ref, audio in zip(reference["audio"], result["audio"])]
+        rows.append({
+            "mode": mode,
+            "load_s": result["load_seconds"],
+            "synth_s": total_seconds,
+            "audio_s": total_audio,
+            "rtf": total_seconds / total_audio if total_audio else None,
+            "speedup": sum(reference["seconds"]) / total_seconds if total_seconds else None,
+            "peak_rss_mb": result["peak_rss_mb"],
+            "lsd_db": float(np.nanmean(distances)),
+        })
+        for i, text in enumerate(FIXED_TEXTS):
+            texts.append({
+                "mode": mode,
+                "text": text,
+                "seconds": result["seconds"][i],
+                "audio_seconds": len(result["audio"][i]) / SAMPLE_RATE,
+                "duration_delta_s": (len(result["audio"][i]) - len(reference["audio"][i])) / SAMPLE_RATE,
+                "lsd_db": distances[i],
+            })
+
+    print("\n=== Quantization benchmark (CPU) ===")
+    print_table(rows, ["mode", "load_s", "synth_s", "audio_s", "rtf", "speedup", "peak_rss_mb", "lsd_db"])
+    path = write_report({"voice": args.voice, "repeats": args.repeats, "summary": rows, "texts": texts},
+                        "quantization")
+    print(f"\nReport saved to {path}")
+
+if __name__ == "__main__":
+    main()
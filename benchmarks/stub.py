@@ -0,0 +1,41 @@
+"""Deterministic stand-in for KPipeline used by the benchmark suite"""
+from typing import Optional
+import re
+import numpy as np
+import torch
+
+SAMPLE_RATE = 24000
+
+class StubPipeline:
+    """Mimics the KPipeline call interface without running a model.
+
+    Splits text the way KPipeline does and yields (graphemes, phonemes,
+    audio) per segment, where audio is a fixed-length float32 tensor. The
+    waveform is precomputed, so the stub costs almost nothing and every
+    other stage of the render path can be measured in isolation.
+    """
+
+    def __init__(self, segment_seconds: float = 0.5, device: str = 'cpu'):
+        self.device = device
+        self.voices = {}
+        self.backend = "stub"
+        self.quantize = None
+        self.model = None
+        samples = int(SAMPLE_RATE * segment_seconds)
+        t = np.arange(samples, dtype=np.float32) / SAMPLE_RATE
+        self._waveform = torch.from_numpy((0.3 * np.sin(2 * np.pi * 220.0 * t)).astype(np.float32))
+
+    def load_voice(self, voice_path: str) -> torch.Tensor:
+        name = voice_path.rsplit('/', 1)[-1].replace('.pt', '')
+        self.voices[name] = torch.zeros((510, 1, 256))
+        return self.voices[name]
+
+    def __call__(self, text: str, voice: Optional[str] = None, speed: float = 1,
+                 split_pattern: Optional[str] = r'\n+'):
+        segments = re.split(split_pattern, text.strip()) if split_pattern else [text]
+        for graphemes in segments:
+            if not graphemes.strip():
+                continue
+            # Fake phonemes: one symbol per letter, like a trivial G2P
+            phonemes = ''.join(c for c in graphemes.lower() if c.isalpha() or c == ' ')
+            yield graphemes, phonemes, self._waveform.clone()
@@ -0,0 +1,264 @@
+"""Reproducible CPU benchmark suite for the text-to-file path.
+
+Measures each component of a render on a fixed corpus, plus the whole path
+through audio_book.generate_audio:
+
+    segmentation    split_text_into_chunks on the corpus
+    pdf_extraction  read_input_file on a PDF rendering of the corpus
+    g2p             English G2P on every chunk (skipped if misaki is unavailable)
+    synthesis       the pipeline call for every chunk
+    concat_normalize  buffering chunk audio with silence and measuring loudness
+    encoding        writing WAV (and MP3 if ffmpeg is installed)
+    end_to_end      generate_audio to a WAV file
+
+With --model stub (the default) synthesis uses a deterministic StubPipeline
+that emits fixed-length audio, so runs are fast and measure everything
+except the model itself; --model real uses the Kokoro model.
+
+Results are written as JSON. Compare two result files (or a baseline with a
+fresh run) to catch throughput regressions:
+
+    python -m benchmarks.suite --corpus medium --output base.json
+    python -m benchmarks.suite --corpus medium --compare base.json
+"""
+from typing import Optional, Callable
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+from benchmarks.common import DEFAULT_MODEL_PATH, DEFAULT_VOICE, SAMPLE_RATE, print_table, write_report
+from benchmarks.corpora import CORPORA, generate_corpus, write_simple_pdf
+
+SUITE_VERSION = 1
+DEFAULT_THRESHOLD = 0.10
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _quiet():
+    """Silence the progress output of the code under test."""
+    sink = io.StringIO()
+    return redirect_stdout(sink), redirect_stderr(sink)
+
+class BenchmarkContext:
+    """Inputs shared by the component benchmarks."""
+
+    def __init__(self, model, corpus: str, work_dir: Path, voice: str):
+        import audio_book
+
+        self.model = model
+        self.voice = voice
+        self.work_dir = work_dir
+        self.lines = generate_corpus(corpus)
+        self.text = ' '.join(self.lines)
+        self.chunks = audio_book.split_text_into_chunks(self.text)
+        self.pdf_path = write_simple_pdf(self.lines, work_dir / "corpus.pdf")
+        self.chunk_audio = [self.synthesize(chunk) for chunk in self.chunks]
+
+    def synthesize(self, chunk: str) -> list:
+        return [audio for _, _, audio in self.model(chunk, voice=f"voices/{self.voice}.pt", speed=1.0)
+                if audio is not None]
+
+    @property
+    def audio_seconds(self) -> float:
+        return sum(len(a) for segments in self.chunk_audio for a in segments) / SAMPLE_RATE
+
+def bench_segmentation(ctx: BenchmarkContext):
+    import audio_book
+    audio_book.split_text_into_chunks(ctx.text)
+    return len(ctx.text), "chars"
+
+def bench_pdf_extraction(ctx: BenchmarkContext):
+    import audio_book
+    lines = audio_book.read_input_file(str(ctx.pdf_path))
+    return sum(len(line) for line in lines), "chars"
+
+_g2p = None
+
+def bench_g2p(ctx: BenchmarkContext):
+    global _g2p
+    if _g2p is None:
+        from kokoro import KPipeline
+        _g2p = KPipeline(lang_code='a', model=False).g2p
+    for chunk in ctx.chunks:
+        _g2p(chunk)
+    return len(ctx.text), "chars"
+
+def bench_synthesis(ctx: BenchmarkContext):
+    for chunk in ctx.chunks:
+        ctx.synthesize(chunk)
+    return ctx.audio_seconds, "audio_s"
+
+def bench_concat_normalize(ctx: BenchmarkContext):
+    # Mirrors the chunk buffering and streaming loudness measurement in generate_audio
+    from audio_book import CHUNK_SILENCE_SECONDS
+    from loudness import LoudnessMeter, normalization_gain
+    from pcm_buffer import PCMBuffer
+    pcm = PCMBuffer.for_text(max(len(chunk) for chunk in ctx.chunks), 1.0, silence_seconds=CHUNK_SILENCE_SECONDS)
+    meter = LoudnessMeter(SAMPLE_RATE)
+    for chunk_audio in ctx.chunk_audio:
+        pcm.truncate(0)
+        for audio in chunk_audio:
+            pcm.append(audio)
+        pcm.append_silence(CHUNK_SILENCE_SECONDS)
+        meter.add(pcm.view())
+    normalization_gain(meter)
+    return ctx.audio_seconds, "audio_s"
+
+def bench_encoding(ctx: BenchmarkContext):
+    import soundfile as sf
+    audio = np.concatenate([a.numpy() for segments in ctx.chunk_audio for a in segments])
+    wav_path = ctx.work_dir / "encode.wav"
+    sf.write(wav_path, audio, SAMPLE_RATE)
+    if shutil.which("ffmpeg"):
+        subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-i", str(wav_path),
+                        "-codec:a", "libmp3lame", "-qscale:a", "2", str(ctx.work_dir / "encode.mp3")], check=True)
+    return len(audio) / SAMPLE_RATE, "audio_s"
+
+def bench_end_to_end(ctx: BenchmarkContext):
+    import audio_book
+    out, err = _quiet()
+    with out, err:
+        audio_book.generate_audio(ctx.model, ctx.lines, ctx.voice, 1.0,
+                                  audio_format="wav", output_path=str(ctx.work_dir / "end_to_end.wav"))
+    return len(ctx.text), "chars"
+
+COMPONENTS = {
+    "segmentation": bench_segmentation,
+    "pdf_extraction": bench_pdf_extraction,
+    "g2p": bench_g2p,
+    "synthesis": bench_synthesis,
+    "concat_normalize": bench_concat_normalize,
+    "encoding": bench_encoding,
+    "end_to_end": bench_end_to_end,
+}
+
+def time_component(func: Callable, ctx: BenchmarkContext, repeats: int) -> dict:
+    """Run one component `repeats` times (after a warm-up run) and summarize its timings."""
+    units, unit = func(ctx)
+    runs = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(ctx)
+        runs.append(time.perf_counter() - start)
+    median = statistics.median(runs)
+    return {"median_s": median, "min_s": min(runs), "runs": runs, "units": units, "unit": unit,
+            "throughput": units / median if median else None}
+
+def run_suite(model_kind: str, corpus: str, repeats: int, voice: str,
+              components: Optional[list] = None) -> dict:
+    """Run the selected components and return the result document."""
+    if model_kind == "stub":
+        from benchmarks.stub import StubPipeline
+        model = StubPipeline()
+    else:
+        from models import build_model
+        model = build_model(DEFAULT_MODEL_PATH, 'cpu')
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        ctx = BenchmarkContext(model, corpus, Path(tmp), voice)
+        for name in components or COMPONENTS:
+            print(f"Running {name}...")
+            try:
+                results[name] = time_component(COMPONENTS[name], ctx, repeats)
+            except Exception as e:
+                # e.g. misaki or its spaCy model missing for g2p
+                print(f"  skipped: {e}")
+                results[name] = {"skipped": str(e)}
+
+    return {
+        "suite_version": SUITE_VERSION,
+        "git_commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "processor": platform.processor(), "cpu_count": os.cpu_count()},
+        "model": model_kind,
+        "corpus": corpus,
+        "corpus_chars": len(ctx.text),
+        "chunks": len(ctx.chunks),
+        "repeats": repeats,
+        "components": results,
+    }
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> bool:
+    """Print per-component throughput changes; return True if any regressed beyond threshold."""
+    if (baseline.get("model"), baseline.get("corpus")) != (candidate.get("model"), candidate.get("corpus")):
+        print("Warning: comparing runs with different model or corpus settings")
+    rows, regressed = [], False
+    for name in COMPONENTS:
+        base = baseline["components"].get(name, {})
+        cand = candidate["components"].get(name, {})
+        if not base.get("throughput") or not cand.get("throughput"):
+            continue
+        change = cand["throughput"] / base["throughput"] - 1
+        status = "REGRESSION" if change < -threshold else ("faster" if change > threshold else "ok")
+        regressed |= status == "REGRESSION"
+        rows.append({"component": name, "unit": f"{base['unit']}/s", "baseline": base["throughput"],
+                     "candidate": cand["throughput"], "change_%": change * 100, "status": status})
+    print(f"\nBaseline {baseline.get('git_commit')} vs candidate {candidate.get('git_commit')} "
+          f"(threshold {threshold:.0%})")
+    print_table(rows, ["component", "unit", "baseline", "candidate", "change_%", "status"])
+    return regressed
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=("stub", "real"), default="stub", help="Pipeline to synthesize with")
+    parser.add_argument("--corpus", choices=CORPORA, default="small", help="Fixed corpus size")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per component")
+    parser.add_argument("--voice", default=DEFAULT_VOICE, help="Voice to synthesize with")
+    parser.add_argument("--components", nargs="+", choices=COMPONENTS, help="Only run these components")
+    parser.add_argument("--output", help="Write results to this path instead of outputs/benchmarks/")
+    parser.add_argument("--compare", nargs="+", metavar="RESULTS",
+                        help="Baseline results file, optionally followed by a candidate file "
+                             "(default: run the suite now as the candidate)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative throughput drop that counts as a regression")
+    args = parser.parse_args(argv)
+
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes a baseline and at most one candidate")
+
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[1], 'r', encoding='utf-8') as f:
+            candidate = json.load(f)
+    else:
+        candidate = run_suite(args.model, args.corpus, args.repeats, args.voice, args.components)
+        rows = [{"component": name, "median_s": r.get("median_s"), "throughput": r.get("throughput"),
+                 "unit": f"{r['unit']}/s" if "unit" in r else "skipped"}
+                for name, r in candidate["components"].items()]
+        print(f"\n=== Benchmark suite ({candidate['model']} model, {candidate['corpus']} corpus, "
+              f"{candidate['corpus_chars']} chars, {candidate['chunks']} chunks) ===")
+        print_table(rows, ["component", "median_s", "throughput", "unit"])
+        if args.output:
+            Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(candidate, f, indent=2)
+            path = Path(args.output)
+        else:
+            path = write_report(candidate, f"suite_{args.model}_{args.corpus}")
+        print(f"\nResults saved to {path}")
+
+    if args.compare:
+        with open(args.compare[0], 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(baseline, candidate, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""Chapter-aware audiobook rendering for Kokoro TTS Local
+
+Splits a book into chapters at detected headings, renders each chapter as
+an independent job (optionally on several pinned worker processes) and
+assembles an M4B or MKA file with chapter markers:
+
+    outputs/<book>/
+        chapters/01_chapter-one_<hash>.wav   one file per chapter
+        chapters.json                        titles, durations and hashes
+        <book>.m4b                           all chapters with markers
+
+Each chapter file is keyed by a hash of its text and render settings. On a
+re-run only chapters whose text or settings changed are rendered again, and
+the others are reused as they are.
+
+Usage:
+    python chapters.py input/book.pdf [--pages 5-120] [--voice af_bella] [--workers 2]
+"""
+from typing import Optional, List
+from contextlib import nullcontext, redirect_stderr, redirect_stdout
+from pathlib import Path
+import argparse
+import hashlib
+import io
+import json
+import multiprocessing as mp
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+CHAPTER_FORMAT_VERSION = 1
+CONTAINER_FORMATS = {"m4b": ["-c:a", "aac", "-b:a", "96k"], "mka": ["-c:a", "flac"]}
+
+_NUMBER = r"(?:\d+|[ivxlcdm]+|one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve|" \
+          r"thirteen|fourteen|fifteen|sixteen|seventeen|eighteen|nineteen|twenty|thirty|forty|fifty)"
+NUMBERED_HEADING = re.compile(rf"^(?:chapter|part|book)\s+{_NUMBER}\b", re.IGNORECASE)
+NAMED_HEADING = re.compile(r"^(?:prologue|epilogue|preface|foreword|afterword|introduction|interlude)\b",
+                           re.IGNORECASE)
+MAX_HEADING_LENGTH = 80
+
+def is_heading(line: str, caps_headings: bool = True) -> bool:
+    """Return True if a line looks like a chapter heading."""
+    line = line.strip()
+    if not line or len(line) > MAX_HEADING_LENGTH:
+        return False
+    if NUMBERED_HEADING.match(line) or NAMED_HEADING.match(line):
+        return True
+    # Short all-caps lines such as "THE LONG WINTER", but not "I." or "OK!"
+    letters = [c for c in line if c.isalpha()]
+    return (caps_headings and len(letters) >= 4 and line.upper() == line
+            and line[-1] not in '.!?,;' and len(line.split()) <= 8)
+
+def detect_chapters(text_lines: List[str], caps_headings: bool = True) -> List[dict]:
+    """Split text lines into chapters at heading lines.
+
+    Returns a list of {"index", "title", "lines"} dicts. Text before the
+    first heading becomes an "Opening" chapter; text without headings is a
+    single chapter. A heading line ending in ':' absorbs the following line
+    as its subtitle (PDF extraction splits "Chapter 1: The Storm" there).
+    """
+    chapters = []
+    title, lines = None, []
+    i = 0
+    while i < len(text_lines):
+        line = text_lines[i].strip()
+        if is_heading(line, caps_headings):
+            if lines:
+                chapters.append({"title": title or "Opening", "lines": lines})
+            title, lines = line.rstrip(':'), []
+            if line.endswith(':') and i + 1 < len(text_lines) and len(text_lines[i + 1]) <= MAX_HEADING_LENGTH:
+                title = f"{title}: {text_lines[i + 1].strip()}"
+                i += 1
+        elif line:
+            lines.append(line)
+        i += 1
+    if lines:
+        chapters.append({"title": title or ("Opening" if chapters else "Full text"), "lines": lines})
+
+    for index, chapter in enumerate(chapters, 1):
+        chapter["index"] = index
+    return chapters
+
+def slugify(title: str, max_length: int = 40) -> str:
+    slug = re.sub(r'[^a-z0-9]+', '-', title.lower()).strip('-')
+    return slug[:max_length].rstrip('-') or "chapter"
+
+def chapter_hash(chapter: dict, settings: dict) -> str:
+    """Hash of a chapter's text and the settings that affect its audio."""
+    key = {"version": CHAPTER_FORMAT_VERSION, "title": chapter["title"], "lines": chapter["lines"], **settings}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def artifact_name(chapter: dict, digest: str) -> str:
+    return f"{chapter['index']:02d}_{slugify(chapter['title'])}_{digest}.wav"
+
+def render_chapter(model, job: dict, quiet: bool = True) -> dict:
+    """Render one chapter job to its WAV artifact and return its status."""
+    from audio_book import generate_audio
+
+    final_path = Path(job["path"])
+    partial_path = final_path.with_name(final_path.stem + ".partial.wav")
+    start = time.perf_counter()
+    sink = io.StringIO()
+    try:
+        with redirect_stdout(sink) if quiet else nullcontext(), redirect_stderr(sink) if quiet else nullcontext():
+            written = generate_audio(model, job["lines"], job["voice"], job["speed"],
+                                     audio_format="wav", output_path=str(partial_path))
+        if written is None:
+            raise RuntimeError("No audio was generated")
+        os.replace(partial_path, final_path)
+        return {"index": job["index"], "status": "ok", "wall_seconds": time.perf_counter() - start}
+    except Exception as e:
+        if partial_path.exists():
+            partial_path.unlink()
+        return {"index": job["index"], "status": "failed", "error": str(e),
+                "wall_seconds": time.perf_counter() - start}
+
+# Per-process model for pool workers
+_worker_model = None
+
+def _init_worker(core_queue, device: str, quantize: Optional[str], backend: str,
+                 memory_limit: Optional[int] = None) -> None:
+    """Pin a pool worker to its own cores, apply its memory budget and load the model once."""
+    global _worker_model
+    from runtime_config import apply_thread_config
+    from memory_budget import configure_memory_budget
+    from models import build_model
+    from audio_book import DEFAULT_MODEL_PATH
+
+    cores = core_queue.get()
+    apply_thread_config(len(cores), 1, cores)
+    if memory_limit:
+        configure_memory_budget(str(memory_limit))
+    _worker_model = build_model(DEFAULT_MODEL_PATH, device, quantize=quantize, backend=backend)
+
+def _render_in_worker(job: dict) -> dict:
+    return render_chapter(_worker_model, job)
+
+def render_chapters(jobs: List[dict], workers: int, device: str, quantize: Optional[str] = None,
+                    backend: str = "eager", verbose: bool = False):
+    """Render chapter jobs, yielding each status as it finishes.
+
+    With one worker the jobs run in this process; otherwise each worker
+    process is pinned to a core set from plan_workers and keeps its own
+    model loaded for all the jobs it takes.
+    """
+    if not jobs:
+        return
+    workers = max(1, min(workers, len(jobs)))
+    if workers == 1:
+        from models import build_model
+        from audio_book import DEFAULT_MODEL_PATH
+        from instrumentation import instrument_pipeline
+        model = build_model(DEFAULT_MODEL_PATH, device, quantize=quantize, backend=backend)
+        instrument_pipeline(model)
+        for job in jobs:
+            yield render_chapter(model, job, quiet=not verbose)
+        return
+
+    from runtime_config import plan_workers
+    from memory_budget import get_governor
+    ctx = mp.get_context('spawn')
+    core_queue = ctx.Queue()
+    for cores in plan_workers(workers):
+        core_queue.put(cores)
+    # Longest chapters first so one long chapter does not finish last on its own
+    ordered = sorted(jobs, key=lambda job: sum(len(line) for line in job["lines"]), reverse=True)
+    # Workers share this process's memory budget, if one is set
+    governor = get_governor()
+    memory_limit = governor.limit // workers if governor.enabled else None
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                             initargs=(core_queue, device, quantize, backend, memory_limit)) as pool:
+        futures = [pool.submit(_render_in_worker, job) for job in ordered]
+        for future in as_completed(futures):
+            yield future.result()
+
+def _ffmetadata_escape(text: str) -> str:
+    return re.sub(r'([=;#\\\n])', r'\\\1', text)
+
+def assemble_book(chapters: List[dict], output_path: Path, title: str) -> Optional[Path]:
+    """Join chapter WAVs into one M4B/MKA with chapter markers using ffmpeg.
+
+    Returns the output path, or None if ffmpeg is not installed.
+    """
+    if not shutil.which("ffmpeg"):
+        print("Warning: ffmpeg not found; skipping the chapter-marked book (per-chapter files are ready)")
+        return None
+    codec = CONTAINER_FORMATS[output_path.suffix.lstrip('.')]
+
+    metadata = [";FFMETADATA1", f"title={_ffmetadata_escape(title)}"]
+    position = 0
+    for chapter in chapters:
+        start, position = position, position + int(round(chapter["duration"] * 1000))
+        metadata += ["[CHAPTER]", "TIMEBASE=1/1000", f"START={start}", f"END={position}",
+                     f"title={_ffmetadata_escape(chapter['title'])}"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        list_path = Path(tmp) / "chapters.txt"
+        metadata_path = Path(tmp) / "metadata.txt"
+        list_path.write_text("".join("file '{}'\n".format(str(Path(c["path"]).resolve()).replace("'", "'\\''"))
+                                     for c in chapters), encoding='utf-8')
+        metadata_path.write_text("\n".join(metadata) + "\n", encoding='utf-8')
+        partial_path = output_path.with_name(output_path.stem + ".partial" + output_path.suffix)
+        subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", str(list_path),
+                        "-i", str(metadata_path), "-map", "0:a", "-map_metadata", "1", "-map_chapters", "1",
+                        *codec, str(partial_path)], check=True)
+        os.replace(partial_path, output_path)
+    return output_path
+
+def write_chapter_index(path: Path, index: dict) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, path)
+
+def render_book(input_path: str, output_dir: Optional[str] = None, voice: str = "af_bella", speed: float = 1.0,
+                start_page: Optional[int] = None, end_page: Optional[int] = None, container: str = "m4b",
+                workers: int = 1, force: Optional[List[int]] = None, quantize: Optional[str] = None,
+                backend: str = "eager", caps_headings: bool = True, verbose: bool = False) -> Optional[Path]:
+    """Render a book chapter by chapter and assemble the chapter-marked file.
+
+    Returns the path of the assembled book, or None if it was not written.
+    """
+    import soundfile as sf
+    import torch
+    from audio_book import read_input_file, DEFAULT_MODEL_PATH
+    from instrumentation import get_tracer
+
+    if not os.path.exists(f"voices/{voice}.pt"):
+        raise ValueError(f"Voice file not found: voices/{voice}.pt")
+    book = Path(input_path).stem
+    output_dir = Path(output_dir or f"outputs/{book}")
+    chapter_dir = output_dir / "chapters"
+    chapter_dir.mkdir(parents=True, exist_ok=True)
+
+    chapters = detect_chapters(read_input_file(input_path, start_page, end_page), caps_headings)
+    print(f"Detected {len(chapters)} chapter(s) in {input_path}")
+    settings = {"voice": voice, "speed": speed, "model": DEFAULT_MODEL_PATH, "quantize": quantize,
+                "backend": backend}
+
+    jobs, wanted = [], set()
+    for chapter in chapters:
+        digest = chapter_hash(chapter, settings)
+        path = chapter_dir / artifact_name(chapter, digest)
+        # Reuse an artifact with the same content under its old index or title
+        if not path.exists():
+            for existing in chapter_dir.glob(f"*_{digest}.wav"):
+                os.replace(existing, path)
+                break
+        chapter.update({"hash": digest, "path": str(path)})
+        wanted.add(path.name)
+        if not path.exists() or chapter["index"] in (force or []):
+            jobs.append({"index": chapter["index"], "path": str(path), "lines": chapter["lines"],
+                         "voice": voice, "speed": speed})
+
+    for stale in chapter_dir.glob("*.wav"):
+        if stale.name not in wanted:
+            stale.unlink()
+
+    print(f"{len(chapters) - len(jobs)} chapter(s) up to date, {len(jobs)} to render")
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    failed, rendered = [], 0
+    for result in render_chapters(jobs, workers, device, quantize, backend, verbose):
+        chapter = chapters[result["index"] - 1]
+        get_tracer().event("chapter", title=chapter["title"], **result)
+        if result["status"] == "ok":
+            rendered += 1
+            print(f"  [{chapter['index']:02d}] {chapter['title']}: rendered in {result['wall_seconds']:.1f}s")
+        else:
+            print(f"  [{chapter['index']:02d}] {chapter['title']}: failed: {result['error']}")
+            failed.append(chapter)
+
+    for chapter in chapters:
+        path = Path(chapter["path"])
+        chapter["duration"] = sf.info(str(path)).duration if path.exists() else None
+
+    index_path = output_dir / "chapters.json"
+    previous = {}
+    if index_path.exists():
+        with open(index_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    index = {"input": input_path, "settings": settings,
+             "chapters": [{"index": c["index"], "title": c["title"], "file": Path(c["path"]).name,
+                           "hash": c["hash"], "duration": c["duration"]} for c in chapters]}
+
+    if failed:
+        write_chapter_index(index_path, index)
+        print(f"Warning: {len(failed)} chapter(s) failed; not assembling {book}.{container}")
+        return None
+
+    book_path = output_dir / f"{book}.{container}"
+    assembled_key = hashlib.sha256("".join(c["hash"] for c in chapters).encode()).hexdigest()[:16]
+    # A forced re-render keeps the chapter's hash, so anything rendered now means reassembling
+    if not rendered and book_path.exists() and previous.get("assembled", {}).get(container) == assembled_key:
+        print(f"{book_path} is up to date")
+        index["assembled"] = previous["assembled"]
+    else:
+        print(f"Assembling {book_path}...")
+        if assemble_book(chapters, book_path, book) is None:
+            book_path = None
+        else:
+            index["assembled"] = {**previous.get("assembled", {}), container: assembled_key}
+    write_chapter_index(index_path, index)
+    if book_path:
+        print(f"Audiobook saved as: {book_path}")
+    return book_path
+
+def main(argv: Optional[list] = None) -> None:
+    from batch_render import parse_pages
+    from models import QUANTIZE_MODES, BACKENDS
+    from runtime_config import configure_memory, configure_runtime
+    from instrumentation import configure_tracing, get_tracer
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="PDF or TXT file")
+    parser.add_argument("--pages", help="Page range of a PDF, e.g. 5-120")
+    parser.add_argument("--voice", default="af_bella", help="Voice name (from voices/)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Speech speed (0.5-2.0)")
+    parser.add_argument("--output-dir", help="Output directory (default: outputs/<book>)")
+    parser.add_argument("--format", choices=CONTAINER_FORMATS, default="m4b", help="Chapter-marked book format")
+    parser.add_argument("--workers", type=int, default=1, help="Chapters rendered in parallel, each on its own cores")
+    parser.add_argument("--force", type=int, nargs="+", metavar="N", help="Re-render these chapter numbers")
+    parser.add_argument("--list", action="store_true", help="Only print the detected chapters")
+    parser.add_argument("--no-caps-headings", action="store_true", help="Don't treat all-caps lines as headings")
+    parser.add_argument("--quantize", choices=[m for m in QUANTIZE_MODES if m], help="Quantized CPU inference")
+    parser.add_argument("--backend", choices=BACKENDS, default="eager", help="Inference backend")
+    parser.add_argument("--verbose", action="store_true", help="Show per-chunk progress (single worker only)")
+    args = parser.parse_args(argv)
+
+    start_page, end_page = parse_pages(args.pages)
+    if args.list:
+        from audio_book import read_input_file
+        for chapter in detect_chapters(read_input_file(args.input, start_page, end_page), not args.no_caps_headings):
+            characters = sum(len(line) for line in chapter["lines"])
+            print(f"{chapter['index']:3d}. {chapter['title']} ({characters} chars)")
+        return
+
+    if args.workers == 1:
+        configure_runtime()
+    else:
+        # Pool workers pin their own threads, but split this process's memory budget
+        configure_memory(share=1)
+    configure_tracing()
+    try:
+        render_book(args.input, args.output_dir, args.voice.replace('.pt', ''), args.speed, start_page, end_page,
+                    args.format, args.workers, args.force, args.quantize, args.backend,
+                    not args.no_caps_headings, args.verbose)
+    finally:
+        get_tracer().close()
+
+if __name__ == "__main__":
+    main()
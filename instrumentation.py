@@ -0,0 +1,272 @@
+"""Per-stage timing instrumentation for Kokoro TTS Local
+
+Records wall and CPU time for each render stage (PDF extraction,
+segmentation, G2P, acoustic model, vocoder, concatenation, normalization,
+writing, encoding) and per-chunk statistics. Records are written as a
+JSON-lines trace and aggregated into Prometheus text metrics, which can be
+served over HTTP for long-running processes.
+
+Tracing is off by default: get_tracer() returns a NullTracer whose methods
+do nothing, so instrumented code costs a few attribute lookups per chunk.
+Enable it with configure_tracing() or the KOKORO_TRACE (trace file path)
+and KOKORO_METRICS_PORT environment variables.
+"""
+from typing import Optional
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import threading
+import time
+
+SAMPLE_RATE = 24000
+
+class Tracer:
+    """Collects stage timings and chunk records, writing them to a JSON-lines trace."""
+
+    enabled = True
+
+    def __init__(self, trace_path: Optional[str] = None):
+        self.trace_path = trace_path
+        self._trace_file = open(trace_path, 'a', encoding='utf-8') if trace_path else None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stage_totals = {}
+        self.counters = {"chunks": 0, "chunks_failed": 0, "characters": 0, "phonemes": 0,
+                         "audio_seconds": 0.0, "synthesis_wall_seconds": 0.0}
+        self.last_rtf = 0.0
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block as stage `name`, attributing it to the current chunk if any."""
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def record(self, name: str, wall: float, cpu: float) -> None:
+        """Add a measured duration to stage `name`."""
+        with self._lock:
+            totals = self.stage_totals.setdefault(name, {"wall": 0.0, "cpu": 0.0, "calls": 0})
+            totals["wall"] += wall
+            totals["cpu"] += cpu
+            totals["calls"] += 1
+        chunk = getattr(self._local, 'chunk', None)
+        if chunk is not None:
+            stages = chunk["stages"].setdefault(name, {"wall": 0.0, "cpu": 0.0})
+            stages["wall"] += wall
+            stages["cpu"] += cpu
+
+    def begin_chunk(self, index: int, text: str) -> None:
+        """Start a chunk record; stages timed until end_chunk() are attributed to it."""
+        self._local.chunk = {"index": index, "characters": len(text), "phonemes": 0, "stages": {},
+                             "_wall": time.perf_counter(), "_cpu": time.process_time()}
+
+    def add_phonemes(self, phonemes: Optional[str]) -> None:
+        """Count phonemes produced for the current chunk."""
+        chunk = getattr(self._local, 'chunk', None)
+        if chunk is not None and phonemes:
+            chunk["phonemes"] += len(phonemes)
+
+    def end_chunk(self, audio_samples: int, error: Optional[str] = None) -> None:
+        """Finish the current chunk record and write it to the trace."""
+        chunk = getattr(self._local, 'chunk', None)
+        if chunk is None:
+            return
+        self._local.chunk = None
+        wall = time.perf_counter() - chunk.pop("_wall")
+        cpu = time.process_time() - chunk.pop("_cpu")
+        audio_seconds = audio_samples / SAMPLE_RATE
+        chunk.update({"wall": wall, "cpu": cpu, "audio_seconds": audio_seconds,
+                      "rtf": wall / audio_seconds if audio_seconds else None})
+        if error:
+            chunk["error"] = error
+        with self._lock:
+            self.counters["chunks"] += 1
+            self.counters["chunks_failed"] += 1 if error else 0
+            self.counters["characters"] += chunk["characters"]
+            self.counters["phonemes"] += chunk["phonemes"]
+            self.counters["audio_seconds"] += audio_seconds
+            self.counters["synthesis_wall_seconds"] += wall
+            if chunk["rtf"] is not None:
+                self.last_rtf = chunk["rtf"]
+        self.event("chunk", **chunk)
+
+    def event(self, event_type: str, **fields) -> None:
+        """Write one record to the JSON-lines trace."""
+        if self._trace_file is None:
+            return
+        line = json.dumps({"type": event_type, "time": time.time(), **fields})
+        with self._lock:
+            self._trace_file.write(line + "\n")
+            self._trace_file.flush()
+
+    def metrics_text(self) -> str:
+        """Render the aggregated counters in Prometheus text exposition format."""
+        with self._lock:
+            stages = {name: dict(totals) for name, totals in self.stage_totals.items()}
+            counters = dict(self.counters)
+            last_rtf = self.last_rtf
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: list) -> None:
+            lines.append(f"# HELP kokoro_{name} {help_text}")
+            lines.append(f"# TYPE kokoro_{name} {kind}")
+            for labels, value in samples:
+                lines.append(f"kokoro_{name}{labels} {value}")
+
+        metric("stage_wall_seconds_total", "counter", "Wall time spent per stage.",
+               [(f'{{stage="{n}"}}', t["wall"]) for n, t in sorted(stages.items())])
+        metric("stage_cpu_seconds_total", "counter", "Process CPU time spent per stage.",
+               [(f'{{stage="{n}"}}', t["cpu"]) for n, t in sorted(stages.items())])
+        metric("stage_calls_total", "counter", "Number of timed calls per stage.",
+               [(f'{{stage="{n}"}}', t["calls"]) for n, t in sorted(stages.items())])
+        metric("chunks_total", "counter", "Chunks synthesized.", [("", counters["chunks"])])
+        metric("chunks_failed_total", "counter", "Chunks that failed.", [("", counters["chunks_failed"])])
+        metric("characters_total", "counter", "Input characters synthesized.", [("", counters["characters"])])
+        metric("phonemes_total", "counter", "Phonemes synthesized.", [("", counters["phonemes"])])
+        metric("audio_seconds_total", "counter", "Audio seconds produced.", [("", counters["audio_seconds"])])
+        metric("synthesis_wall_seconds_total", "counter", "Wall time spent synthesizing chunks.",
+               [("", counters["synthesis_wall_seconds"])])
+        metric("last_chunk_rtf", "gauge", "Real-time factor of the last chunk (wall / audio seconds).",
+               [("", last_rtf)])
+        return "\n".join(lines) + "\n"
+
+    def close(self) -> None:
+        if self._trace_file is not None:
+            self._trace_file.close()
+            self._trace_file = None
+
+class _NullContext:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class NullTracer:
+    """Tracer stand-in used when instrumentation is disabled; every method is a no-op."""
+
+    enabled = False
+    _context = _NullContext()
+
+    def stage(self, name: str):
+        return self._context
+
+    def record(self, name: str, wall: float, cpu: float) -> None:
+        pass
+
+    def begin_chunk(self, index: int, text: str) -> None:
+        pass
+
+    def add_phonemes(self, phonemes: Optional[str]) -> None:
+        pass
+
+    def end_chunk(self, audio_samples: int, error: Optional[str] = None) -> None:
+        pass
+
+    def event(self, event_type: str, **fields) -> None:
+        pass
+
+    def metrics_text(self) -> str:
+        return ""
+
+    def close(self) -> None:
+        pass
+
+_tracer = NullTracer()
+
+def get_tracer():
+    """Return the process-wide tracer (a NullTracer unless tracing is configured)."""
+    return _tracer
+
+def configure_tracing(trace_path: Optional[str] = None, metrics_port: Optional[int] = None):
+    """Enable tracing from arguments or KOKORO_TRACE / KOKORO_METRICS_PORT.
+
+    Returns the active tracer. Leaves tracing disabled when neither a trace
+    path nor a metrics port is given.
+    """
+    global _tracer
+    trace_path = trace_path or os.environ.get('KOKORO_TRACE')
+    metrics_port = metrics_port or int(os.environ.get('KOKORO_METRICS_PORT', 0))
+    if not trace_path and not metrics_port:
+        return _tracer
+    _tracer.close()
+    _tracer = Tracer(trace_path)
+    if trace_path:
+        print(f"Writing timing trace to {trace_path}")
+    if metrics_port:
+        serve_metrics(_tracer, metrics_port)
+        print(f"Serving Prometheus metrics on http://0.0.0.0:{metrics_port}/metrics")
+    return _tracer
+
+def serve_metrics(tracer, port: int, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+    """Serve tracer.metrics_text() at /metrics from a background thread."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = tracer.metrics_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class _TimedCallable:
+    """Wraps a callable so each call is recorded as a stage."""
+
+    def __init__(self, func, tracer, stage: str):
+        self.func = func
+        self.tracer = tracer
+        self.stage = stage
+
+    def __call__(self, *args, **kwargs):
+        with self.tracer.stage(self.stage):
+            return self.func(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.func, name)
+
+def _attach_module_timer(module, tracer, stage: str) -> None:
+    """Record a torch module's forward passes as a stage using forward hooks."""
+
+    def pre_hook(mod, inputs):
+        mod._trace_start = (time.perf_counter(), time.process_time())
+
+    def post_hook(mod, inputs, output):
+        wall, cpu = mod._trace_start
+        tracer.record(stage, time.perf_counter() - wall, time.process_time() - cpu)
+
+    module.register_forward_pre_hook(pre_hook)
+    module.register_forward_hook(post_hook)
+
+def instrument_pipeline(pipeline, tracer=None) -> None:
+    """Attach stage timers for G2P, the acoustic model and the vocoder to a KPipeline.
+
+    Does nothing when tracing is disabled, so uninstrumented pipelines pay
+    no per-call overhead. The "model" stage covers the whole forward pass
+    and "vocoder" the decoder inside it; eager backends report both.
+    """
+    tracer = tracer or get_tracer()
+    if not tracer.enabled or getattr(pipeline, '_instrumented', False):
+        return
+    pipeline.g2p = _TimedCallable(pipeline.g2p, tracer, "g2p")
+    model = pipeline.model
+    if hasattr(model, 'register_forward_hook'):
+        _attach_module_timer(model, tracer, "model")
+        if hasattr(model, 'decoder'):
+            _attach_module_timer(model.decoder, tracer, "vocoder")
+    elif model:
+        pipeline.model = _TimedCallable(model, tracer, "model")
+    pipeline._instrumented = True
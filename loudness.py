@@ -0,0 +1,311 @@
+"""Streaming loudness measurement and normalization for Kokoro TTS Local
+
+LoudnessMeter measures integrated loudness (ITU-R BS.1770 / EBU R128, in
+LUFS) and true peak as audio is produced, in constant memory:
+
+- K-weighting: the two BS.1770 biquads (high shelf + high pass), designed
+  for the actual sample rate and applied as one truncated-impulse-response
+  FIR with FFT overlap-save, since numpy has no IIR filter
+- gating: 400 ms blocks with 75% overlap are accumulated into a fine
+  loudness histogram, so the absolute (-70 LUFS) and relative (-10 LU)
+  gates are evaluated without keeping per-block values
+- true peak: 4x polyphase oversampling, as BS.1770 Annex 2 recommends
+
+normalization_gain() turns a measurement into a gain that brings the audio
+to a target loudness without pushing the true peak over a ceiling, so
+levels are consistent between titles and a single click cannot set the
+level of a whole book. StreamingNormalizer writes a render to disk while
+measuring it, so the gain can be applied in one pass afterwards.
+
+Usage:
+    python loudness.py outputs/book.wav [more files...]
+"""
+from typing import Optional
+from functools import lru_cache
+from pathlib import Path
+import math
+import numpy as np
+
+SAMPLE_RATE = 24000
+DEFAULT_TARGET_LUFS = -18.0
+DEFAULT_TRUE_PEAK_CEILING = -1.0  # dBTP
+
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+BLOCK_SECONDS = 0.4
+HOP_SECONDS = 0.1
+HISTOGRAM_MIN_LUFS = ABSOLUTE_GATE_LUFS
+HISTOGRAM_MAX_LUFS = 10.0
+HISTOGRAM_BIN_LU = 0.02
+
+K_WEIGHTING_TAPS = 4096
+OVERSAMPLING = 4
+TRUE_PEAK_TAPS = 48
+TRUE_PEAK_BLOCK = 2048
+
+def _biquad_impulse_response(b: tuple, a: tuple, taps: int) -> np.ndarray:
+    b0, b1, b2 = (x / a[0] for x in b)
+    a1, a2 = (x / a[0] for x in a[1:])
+    h = np.zeros(taps)
+    x1 = x2 = y1 = y2 = 0.0
+    for n in range(taps):
+        x0 = 1.0 if n == 0 else 0.0
+        y0 = b0 * x0 + b1 * x1 + b2 * x2 - a1 * y1 - a2 * y2
+        h[n] = y0
+        x2, x1, y2, y1 = x1, x0, y1, y0
+    return h
+
+@lru_cache(maxsize=None)
+def k_weighting_fir(sample_rate: int, taps: int = K_WEIGHTING_TAPS) -> np.ndarray:
+    """Impulse response of the BS.1770 K-weighting filter, truncated to `taps`.
+
+    Both stages decay within a few milliseconds, so 4096 taps at 24 kHz keep
+    the truncation error far below measurement resolution.
+    """
+    # Stage 1: high shelf (+4 dB above ~1.7 kHz)
+    f0, gain_db, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = math.tan(math.pi * f0 / sample_rate)
+    vh = 10 ** (gain_db / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf_b = ((vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0)
+    shelf_a = (1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+    # Stage 2: high pass at ~38 Hz
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = math.tan(math.pi * f0 / sample_rate)
+    hp_b = (1.0, -2.0, 1.0)
+    hp_a = (1.0, 2 * (k * k - 1) / (1 + k / q + k * k), (1 - k / q + k * k) / (1 + k / q + k * k))
+
+    impulse = _biquad_impulse_response(shelf_b, shelf_a, taps)
+    return np.convolve(impulse, _biquad_impulse_response(hp_b, hp_a, taps))[:taps]
+
+@lru_cache(maxsize=None)
+def true_peak_phases(factor: int = OVERSAMPLING, taps: int = TRUE_PEAK_TAPS) -> np.ndarray:
+    """Polyphase components (factor x taps/factor) of a windowed-sinc interpolator."""
+    n = np.arange(taps) - (taps - 1) / 2
+    h = np.sinc(n / factor) * np.hanning(taps)
+    phases = h.reshape(-1, factor).T
+    # Unity gain per phase, so a full-scale DC signal reads 0 dBTP
+    return phases / phases.sum(axis=1, keepdims=True)
+
+class OverlapSaveFIR:
+    """Streaming FIR filter using FFT overlap-save."""
+
+    def __init__(self, taps: np.ndarray, block: int = 16384):
+        self.taps = len(taps)
+        self.nfft = 1 << (block + self.taps - 2).bit_length()
+        self.block = self.nfft - self.taps + 1
+        self.spectrum = np.fft.rfft(taps, self.nfft)
+        self.history = np.zeros(self.taps - 1)
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+        out = np.empty(len(x))
+        for start in range(0, len(x), self.block):
+            piece = x[start:start + self.block]
+            segment = np.concatenate([self.history, piece])
+            y = np.fft.irfft(np.fft.rfft(segment, self.nfft) * self.spectrum, self.nfft)
+            out[start:start + len(piece)] = y[self.taps - 1:self.taps - 1 + len(piece)]
+            self.history = segment[-(self.taps - 1):]
+        return out
+
+class LoudnessMeter:
+    """Integrated loudness and true peak of a mono stream, fed chunk by chunk."""
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.samples = 0
+        self._filter = OverlapSaveFIR(k_weighting_fir(sample_rate))
+        self._hop = int(round(HOP_SECONDS * sample_rate))
+        self._hops_per_block = int(round(BLOCK_SECONDS / HOP_SECONDS))
+        self._carry = np.zeros(0)
+        self._recent_hops = np.zeros(0)  # energies of the last (hops_per_block - 1) hops
+        bins = int(round((HISTOGRAM_MAX_LUFS - HISTOGRAM_MIN_LUFS) / HISTOGRAM_BIN_LU))
+        self._block_counts = np.zeros(bins, dtype=np.int64)
+        self._block_energy = np.zeros(bins)
+        self._phases = true_peak_phases()
+        self._phase_gain = float(np.abs(self._phases).sum(axis=1).max())
+        self._peak_history = np.zeros(self._phases.shape[1] - 1)
+        self.sample_peak = 0.0
+        self.true_peak = 0.0
+
+    def add(self, audio) -> None:
+        """Measure the next part of the stream."""
+        x = np.asarray(audio, dtype=np.float64).reshape(-1)
+        if not len(x):
+            return
+        self.samples += len(x)
+        self._update_peaks(x)
+
+        # Mean square of the K-weighted signal per 100 ms hop
+        squared = np.concatenate([self._carry, self._filter.process(x) ** 2])
+        hops = len(squared) // self._hop
+        self._carry = squared[hops * self._hop:]
+        if not hops:
+            return
+        hop_energy = squared[:hops * self._hop].reshape(hops, self._hop).mean(axis=1)
+
+        # 400 ms blocks are the mean of 4 consecutive hops
+        energies = np.concatenate([self._recent_hops, hop_energy])
+        window = self._hops_per_block
+        if len(energies) >= window:
+            cumulative = np.concatenate([[0.0], np.cumsum(energies)])
+            blocks = (cumulative[window:] - cumulative[:-window]) / window
+            self._add_blocks(blocks)
+        self._recent_hops = energies[-(window - 1):]
+
+    def _add_blocks(self, energies: np.ndarray) -> None:
+        with np.errstate(divide='ignore'):
+            loudness = -0.691 + 10 * np.log10(energies)
+        gated = loudness > ABSOLUTE_GATE_LUFS
+        bins = ((loudness[gated] - HISTOGRAM_MIN_LUFS) / HISTOGRAM_BIN_LU).astype(np.int64)
+        bins = np.clip(bins, 0, len(self._block_counts) - 1)
+        np.add.at(self._block_counts, bins, 1)
+        np.add.at(self._block_energy, bins, energies[gated])
+
+    def _update_peaks(self, x: np.ndarray) -> None:
+        self.sample_peak = max(self.sample_peak, float(np.max(np.abs(x))))
+        self.true_peak = max(self.true_peak, self.sample_peak)
+        segment = np.concatenate([self._peak_history, x])
+        self._peak_history = segment[-len(self._peak_history):]
+        # An interpolated sample cannot exceed the local sample peak times the
+        # interpolator's L1 gain, so only blocks that could raise the true peak
+        # are oversampled
+        margin = len(self._peak_history)
+        for start in range(0, len(segment) - margin, TRUE_PEAK_BLOCK):
+            block = segment[start:start + TRUE_PEAK_BLOCK + margin]
+            if np.max(np.abs(block)) * self._phase_gain <= self.true_peak:
+                continue
+            for phase in self._phases:
+                self.true_peak = max(self.true_peak, float(np.max(np.abs(np.convolve(block, phase, 'valid')))))
+
+    def integrated_lufs(self) -> float:
+        """Gated integrated loudness so far; -inf if no block passed the absolute gate."""
+        count = self._block_counts.sum()
+        if not count:
+            return float('-inf')
+        ungated = -0.691 + 10 * math.log10(self._block_energy.sum() / count)
+        threshold = ungated + RELATIVE_GATE_LU
+        centers = HISTOGRAM_MIN_LUFS + (np.arange(len(self._block_counts)) + 0.5) * HISTOGRAM_BIN_LU
+        selected = centers > threshold
+        count = self._block_counts[selected].sum()
+        if not count:
+            return ungated
+        return -0.691 + 10 * math.log10(self._block_energy[selected].sum() / count)
+
+    def true_peak_db(self) -> float:
+        return 20 * math.log10(self.true_peak) if self.true_peak > 0 else float('-inf')
+
+    def summary(self) -> dict:
+        return {"integrated_lufs": self.integrated_lufs(), "true_peak_dbtp": self.true_peak_db(),
+                "sample_peak": self.sample_peak, "seconds": self.samples / self.sample_rate}
+
+def normalization_gain(meter: LoudnessMeter, target_lufs: float = DEFAULT_TARGET_LUFS,
+                       true_peak_ceiling: float = DEFAULT_TRUE_PEAK_CEILING) -> float:
+    """Gain in dB that brings the measured audio to target_lufs, limited by the true-peak ceiling.
+
+    Audio too short to gate (under 400 ms) is peak-normalized to the
+    ceiling; silent audio gets 0 dB instead of a division by zero.
+    """
+    peak_db = meter.true_peak_db()
+    if peak_db == float('-inf'):
+        return 0.0
+    loudness = meter.integrated_lufs()
+    gain = true_peak_ceiling - peak_db
+    if loudness != float('-inf'):
+        gain = min(target_lufs - loudness, gain)
+    return gain
+
+def apply_gain(source: Path, destination: Path, gain_db: float, block_seconds: float = 30.0,
+               subtype: str = 'PCM_16') -> None:
+    """Copy an audio file while applying a gain, block by block in constant memory."""
+    import soundfile as sf
+
+    gain = 10 ** (gain_db / 20)
+    with sf.SoundFile(str(source)) as src:
+        block = int(block_seconds * src.samplerate)
+        with sf.SoundFile(str(destination), 'w', src.samplerate, src.channels, subtype) as dst:
+            for data in src.blocks(blocksize=block, dtype='float32'):
+                data *= gain
+                np.clip(data, -1.0, 1.0, out=data)
+                dst.write(data)
+
+class StreamingNormalizer:
+    """Streams audio to an unnormalized float32 WAV while measuring its loudness.
+
+    Memory use does not depend on the length of the render. Once the stream
+    is closed, gain_db() gives the gain to apply while writing or encoding
+    the final file.
+    """
+
+    def __init__(self, path: Path, sample_rate: int = SAMPLE_RATE, target_lufs: float = DEFAULT_TARGET_LUFS,
+                 true_peak_ceiling: float = DEFAULT_TRUE_PEAK_CEILING):
+        import soundfile as sf
+        self.path = Path(path)
+        self.sample_rate = sample_rate
+        self.target_lufs = target_lufs
+        self.true_peak_ceiling = true_peak_ceiling
+        self.meter = LoudnessMeter(sample_rate)
+        self._file = sf.SoundFile(str(self.path), 'w', sample_rate, 1, 'FLOAT')
+
+    @property
+    def samples(self) -> int:
+        return self.meter.samples
+
+    @property
+    def seconds(self) -> float:
+        return self.meter.samples / self.sample_rate
+
+    def write(self, audio) -> None:
+        audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+        self.meter.add(audio)
+        self._file.write(audio)
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+    def discard(self) -> None:
+        """Close and delete the unnormalized file."""
+        self.close()
+        if self.path.exists():
+            self.path.unlink()
+
+    def gain_db(self) -> float:
+        return normalization_gain(self.meter, self.target_lufs, self.true_peak_ceiling)
+
+    def summary(self) -> dict:
+        return {**self.meter.summary(), "gain_db": self.gain_db(), "target_lufs": self.target_lufs}
+
+    def __enter__(self) -> "StreamingNormalizer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def normalize_array(audio: np.ndarray, target_lufs: float = DEFAULT_TARGET_LUFS,
+                    true_peak_ceiling: float = DEFAULT_TRUE_PEAK_CEILING,
+                    sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Loudness-normalize audio that is already in memory (in place for float32 input)."""
+    meter = LoudnessMeter(sample_rate)
+    meter.add(audio)
+    gain = 10 ** (normalization_gain(meter, target_lufs, true_peak_ceiling) / 20)
+    audio = np.asarray(audio, dtype=np.float32)
+    audio *= gain
+    return audio
+
+def measure_file(path: str, sample_rate: Optional[int] = None) -> dict:
+    """Measure an audio file (mono or downmixed) block by block."""
+    import soundfile as sf
+
+    with sf.SoundFile(path) as f:
+        meter = LoudnessMeter(sample_rate or f.samplerate)
+        for data in f.blocks(blocksize=f.samplerate * 10, dtype='float64'):
+            meter.add(data.mean(axis=1) if data.ndim > 1 else data)
+    return meter.summary()
+
+if __name__ == "__main__":
+    import sys
+    for audio_path in sys.argv[1:]:
+        result = measure_file(audio_path)
+        print(f"{audio_path}: {result['integrated_lufs']:.1f} LUFS, {result['true_peak_dbtp']:.1f} dBTP, "
+              f"{result['seconds']:.1f}s")
@@ -0,0 +1,335 @@
+"""Memory budget governor for Kokoro TTS Local
+
+Keeps long renders and multi-tenant servers within a memory budget, so they
+get slower instead of being killed by the OOM killer. The governor compares
+the process's resident memory (or, where that is not available, the memory
+of the buffers and caches it tracks) with the budget:
+
+- above the soft limit (85% of the budget) it evicts least recently used
+  voice packs from every VoiceCache and spills the largest PCMBuffers to
+  memory-mapped scratch files, then returns freed heap memory to the OS
+- new PCMBuffer storage that would not fit under the soft limit is
+  memory-mapped from the start
+- above the budget, when eviction and spilling are not enough, throttle()
+  warns once and lets the work continue: a single render thread has nothing
+  else to wait for. Callers that run renders on several threads (servers)
+  can pass wait=True to hold back new work until other threads free memory
+  or a timeout passes
+
+The governor is off by default: get_governor() returns a NullGovernor whose
+methods do nothing. Enable it with configure_memory_budget(), the
+KOKORO_MEMORY_LIMIT environment variable (e.g. "4G", "1500M" or "auto" for
+90% of the cgroup or physical memory limit), or "memory_limit" in the
+runtime config, which is shared between its worker slots.
+"""
+from typing import Optional
+from collections import OrderedDict
+import ctypes
+import gc
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import weakref
+
+SOFT_FRACTION = 0.85
+AUTO_FRACTION = 0.9
+THROTTLE_POLL_SECONDS = 0.25
+MAX_THROTTLE_SECONDS = 60.0
+DEFAULT_VOICE_CACHE_ENTRIES = 32
+
+# Every live voice cache and PCM buffer, so a governor configured later still sees them
+# (keyed by id: caches are dicts, which compare by content and cannot be hashed)
+_caches = weakref.WeakValueDictionary()
+_buffers = weakref.WeakValueDictionary()
+
+_SIZE_UNITS = {"": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40}
+
+def parse_size(text: str) -> int:
+    """Parse a size such as '4G', '1500M', '2GiB' or '1048576' into bytes."""
+    match = re.fullmatch(r'\s*([\d.]+)\s*([kmgt]?)(i?b)?\s*', str(text).lower())
+    if not match:
+        raise ValueError(f"Invalid memory size: {text}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+def format_size(size: float) -> str:
+    return f"{size / (1 << 20):.0f} MiB"
+
+def detect_memory_limit() -> Optional[int]:
+    """Return the cgroup memory limit, or the physical memory size, in bytes."""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path, 'r') as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # "max" (v2) or a huge number (v1) means no cgroup limit
+        if value.isdigit() and int(value) < 1 << 60:
+            return int(value)
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def current_rss() -> Optional[int]:
+    """Return the resident memory of this process in bytes, if available.
+
+    On Linux, file-backed pages (such as spilled buffers, which the kernel
+    can write back and drop) are not counted.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            fields = f.read().split()
+        return (int(fields[1]) - int(fields[2])) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        return None
+
+def release_free_memory() -> None:
+    """Collect garbage and return free heap pages to the OS where glibc allows it."""
+    gc.collect()
+    if sys.platform.startswith('linux'):
+        try:
+            ctypes.CDLL('libc.so.6').malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+def scratch_memmap(samples: int, dtype, scratch_dir: Optional[str] = None):
+    """Create a zero-filled array backed by a temporary file instead of memory."""
+    import numpy as np
+    scratch_dir = scratch_dir or os.environ.get('KOKORO_SCRATCH_DIR') or None
+    fd, path = tempfile.mkstemp(prefix='kokoro-pcm-', suffix='.raw', dir=scratch_dir)
+    os.close(fd)
+    array = np.memmap(path, dtype=dtype, mode='w+', shape=(samples,))
+    try:
+        # The mapping keeps the data alive; the name is not needed any more
+        os.unlink(path)
+    except OSError:
+        # Windows cannot delete a mapped file; remove it once the array is gone
+        weakref.finalize(array, _remove_file, path)
+    return array
+
+def _remove_file(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+class VoiceCache(OrderedDict):
+    """Loaded voice packs by name, least recently used first.
+
+    A drop-in replacement for KPipeline.voices. Holds at most max_entries
+    packs, and the memory governor can evict all but the most recent ones.
+    """
+
+    def __init__(self, max_entries: Optional[int] = DEFAULT_VOICE_CACHE_ENTRIES):
+        super().__init__()
+        self.max_entries = max_entries
+        self.evictions = 0
+        self.versions = {}
+        _caches[id(self)] = self
+
+    def __getitem__(self, name):
+        value = super().__getitem__(name)
+        self.move_to_end(name)
+        return value
+
+    def __setitem__(self, name, value) -> None:
+        super().__setitem__(name, value)
+        self.move_to_end(name)
+        if self.max_entries:
+            while len(self) > self.max_entries:
+                self.popitem(last=False)
+                self.evictions += 1
+
+    def __delitem__(self, name) -> None:
+        super().__delitem__(name)
+        self.versions.pop(name, None)
+
+    def popitem(self, last: bool = True):
+        name, value = super().popitem(last=last)
+        self.versions.pop(name, None)
+        return name, value
+
+    def lookup(self, name, version=None):
+        """The cached value for name if it was stored with the same version, else None."""
+        if name not in self or self.versions.get(name) != version:
+            return None
+        return self[name]
+
+    def store(self, name, value, version=None):
+        self[name] = value
+        self.versions[name] = version
+        return value
+
+    def nbytes(self) -> int:
+        return sum(v.numel() * v.element_size() for v in list(self.values()) if hasattr(v, 'numel'))
+
+    def evict(self, keep: int = 1) -> int:
+        """Drop all but the `keep` most recently used voices; returns the bytes released."""
+        freed = 0
+        while len(self) > keep:
+            _, value = self.popitem(last=False)
+            freed += value.numel() * value.element_size() if hasattr(value, 'numel') else 0
+            self.evictions += 1
+        return freed
+
+class MemoryGovernor:
+    """Keeps this process within a memory budget by evicting, spilling and throttling."""
+
+    enabled = True
+
+    def __init__(self, limit: int, soft_fraction: float = SOFT_FRACTION,
+                 max_throttle_seconds: float = MAX_THROTTLE_SECONDS, scratch_dir: Optional[str] = None):
+        self.limit = int(limit)
+        self.soft_limit = int(limit * soft_fraction)
+        self.max_throttle_seconds = max_throttle_seconds
+        self.scratch_dir = scratch_dir
+        self.peak_usage = 0
+        self.evicted_bytes = 0
+        self.spilled_bytes = 0
+        self.spills = 0
+        self.throttle_events = 0
+        self.throttled_seconds = 0.0
+        self.over_budget_warned = False
+        self._lock = threading.Lock()
+
+    def tracked_bytes(self) -> int:
+        """Memory held by tracked PCM buffers and voice caches."""
+        return (sum(buffer.nbytes for buffer in list(_buffers.values()))
+                + sum(cache.nbytes() for cache in list(_caches.values())))
+
+    def usage(self) -> int:
+        rss = current_rss()
+        usage = rss if rss is not None else self.tracked_bytes()
+        self.peak_usage = max(self.peak_usage, usage)
+        return usage
+
+    def pressure(self) -> str:
+        """'ok', 'soft' (above the soft limit) or 'hard' (above the budget)."""
+        usage = self.usage()
+        if usage > self.limit:
+            return "hard"
+        return "soft" if usage > self.soft_limit else "ok"
+
+    def allow_allocation(self, nbytes: int) -> bool:
+        """Whether nbytes of new buffer storage fit in memory under the soft limit."""
+        return self.usage() + nbytes <= self.soft_limit
+
+    def relieve(self) -> int:
+        """Evict cached voices and spill buffers until under the soft limit; returns bytes released."""
+        with self._lock:
+            freed = 0
+            for cache in list(_caches.values()):
+                freed += cache.evict(keep=1)
+            self.evicted_bytes += freed
+            release_free_memory()
+            # Largest buffers first: each spill releases the most memory
+            for buffer in sorted(list(_buffers.values()), key=lambda b: b.nbytes, reverse=True):
+                if self.usage() <= self.soft_limit or not buffer.nbytes:
+                    break
+                spilled = buffer.spill(self.scratch_dir)
+                if spilled:
+                    self.spills += 1
+                    self.spilled_bytes += spilled
+                    freed += spilled
+                    release_free_memory()
+            return freed
+
+    def throttle(self, wait: bool = False) -> float:
+        """Call before taking on new work; relieves memory pressure first.
+
+        If the process is still over budget, it warns (once) and returns
+        straight away, unless wait is set: then it waits for other threads
+        to free memory, for at most max_throttle_seconds, so a budget that is
+        simply too small slows work down without stopping it. Only wait when
+        other threads are doing work; a lone render thread would just sleep.
+        Returns the seconds waited.
+        """
+        level = self.pressure()
+        if level == "ok":
+            return 0.0
+        self.relieve()
+        if self.pressure() != "hard":
+            return 0.0
+        self.throttle_events += 1
+        if not wait:
+            if not self.over_budget_warned:
+                self.over_budget_warned = True
+                print(f"Warning: memory use {format_size(self.usage())} is over the {format_size(self.limit)} "
+                      f"budget even after evicting voices and spilling buffers; continuing")
+            return 0.0
+        start = time.perf_counter()
+        print(f"Warning: memory use {format_size(self.usage())} is over the {format_size(self.limit)} budget, "
+              f"waiting for memory to free up")
+        while time.perf_counter() - start < self.max_throttle_seconds:
+            time.sleep(THROTTLE_POLL_SECONDS)
+            self.relieve()
+            if self.pressure() != "hard":
+                break
+        else:
+            print("Warning: still over the memory budget, continuing anyway")
+        waited = time.perf_counter() - start
+        self.throttled_seconds += waited
+        return waited
+
+    def summary(self) -> dict:
+        return {"limit": self.limit, "usage": self.usage(), "peak_usage": self.peak_usage,
+                "tracked": self.tracked_bytes(), "evicted_bytes": self.evicted_bytes,
+                "spills": self.spills, "spilled_bytes": self.spilled_bytes,
+                "throttle_events": self.throttle_events, "throttled_seconds": self.throttled_seconds}
+
+class NullGovernor:
+    """Governor stand-in used when no budget is set; every method is a no-op."""
+
+    enabled = False
+    scratch_dir = None
+
+    def allow_allocation(self, nbytes: int) -> bool:
+        return True
+
+    def relieve(self) -> int:
+        return 0
+
+    def throttle(self, wait: bool = False) -> float:
+        return 0.0
+
+    def summary(self) -> dict:
+        return {}
+
+_governor = NullGovernor()
+
+def get_governor():
+    """Return the process-wide governor (a NullGovernor unless a budget is configured)."""
+    return _governor
+
+def configure_memory_budget(limit: Optional[str] = None, share: int = 1):
+    """Enable the governor with `limit` or KOKORO_MEMORY_LIMIT, divided by `share`.
+
+    Returns the active governor. Leaves it disabled when no limit is given.
+    """
+    global _governor
+    limit = limit or os.environ.get('KOKORO_MEMORY_LIMIT')
+    if not limit:
+        return _governor
+    if str(limit).lower() == 'auto':
+        detected = detect_memory_limit()
+        if detected is None:
+            print("Warning: could not detect the memory limit, memory budget disabled")
+            return _governor
+        limit_bytes = int(detected * AUTO_FRACTION)
+    else:
+        limit_bytes = parse_size(limit)
+    _governor = MemoryGovernor(limit_bytes // max(1, share))
+    print(f"Memory budget: {format_size(_governor.limit)}")
+    return _governor
+
+def track_buffer(buffer) -> None:
+    """Register a PCMBuffer so the governor can spill it under pressure."""
+    _buffers[id(buffer)] = buffer
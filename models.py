@@ -6,8 +6,12 @@ import os
 import json
 import codecs
 from pathlib import Path
-import numpy as np
 import shutil
+from contextlib import nullcontext
+from profiling import ChunkProfiler, default_profile_dir
+from pcm_buffer import PCMBuffer
+from memory_budget import VoiceCache, get_governor
+from assets import CONFIG_FILE, MODEL_FILE, provision_assets, voice_assets
 
 # Set environment variables for proper encoding
 os.environ["PYTHONIOENCODING"] = "utf-8"
@@ -48,6 +52,14 @@ def patched_load_voice(self, voice_path):
     if not os.path.exists(voice_path):
         raise FileNotFoundError(f"Voice file not found: {voice_path}")
     voice_name = Path(voice_path).stem
+    # Use a bounded LRU cache the memory governor can evict from
+    if not isinstance(getattr(self, 'voices', None), VoiceCache):
+        self.voices = VoiceCache()
+    # Reuse the loaded voice unless the file changed since (e.g. a re-saved blend)
+    mtime = os.path.getmtime(voice_path)
+    cached = self.voices.lookup(voice_name, mtime)
+    if cached is not None:
+        return cached
     voice_model = torch.load(voice_path, weights_only=False)
     if voice_model is None:
         raise ValueError(f"Failed to load voice model from {voice_path}")
@@ -55,8 +67,7 @@ def patched_load_voice(self, voice_path):
     if not hasattr(self, 'device'):
         self.device = 'cpu'
     # Move model to device and store in voices dictionary
-    self.voices[voice_name] = voice_model.to(self.device)
-    return self.voices[voice_name]
+    return self.voices.store(voice_name, voice_model.to(self.device), mtime)
 
 KPipeline.load_voice = patched_load_voice
 
@@ -136,106 +147,119 @@ except ImportError as e:
 # Initialize pipeline globally
 _pipeline = None
 
+# Supported values for build_model's quantize and backend arguments
+QUANTIZE_MODES = (None, "int8")
+BACKENDS = ("eager", "onnx")
+
+# KModel submodules (plbert, its projection and the text encoder) whose
+# linear/LSTM layers are dynamically quantized in "int8" mode. The prosody
+# predictor and the iSTFTNet decoder stay in full precision.
+QUANTIZED_SUBMODULES = ("bert", "bert_encoder", "text_encoder")
+
+def quantize_model(model: torch.nn.Module) -> torch.nn.Module:
+    """Apply dynamic int8 quantization to the linear/LSTM layers of the text encoder and plbert"""
+    # quantize_dynamic only swaps children, so group the targets in a container
+    # to also cover bert_encoder, which is itself a Linear layer
+    container = torch.nn.ModuleDict({name: getattr(model, name) for name in QUANTIZED_SUBMODULES})
+    torch.ao.quantization.quantize_dynamic(
+        container, {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8, inplace=True
+    )
+    for module in container.modules():
+        # TextEncoder calls flatten_parameters(), which quantized LSTMs don't have
+        if isinstance(module, torch.ao.nn.quantized.dynamic.LSTM):
+            module.flatten_parameters = lambda: None
+    for name in QUANTIZED_SUBMODULES:
+        setattr(model, name, container[name])
+    return model
+
 def download_voice_files():
-    """Download voice files from Hugging Face."""
-    voices_dir = Path("voices")
-    voices_dir.mkdir(exist_ok=True)
+    """Provision the voice files (see assets.py) and return those available."""
+    print("\nChecking voice files...")
+    statuses = provision_assets(voice_assets(VOICE_FILES))
+    available_voices = [voice_file for voice_file in VOICE_FILES if (Path("voices") / voice_file).exists()]
     
-    from huggingface_hub import hf_hub_download
-    downloaded_voices = []
-    
-    print("\nDownloading voice files...")
-    for voice_file in VOICE_FILES:
-        try:
-            # Full path where the voice file should be
-            voice_path = voices_dir / voice_file
-            
-            if not voice_path.exists():
-                print(f"Downloading {voice_file}...")
-                # Download to a temporary location first
-                temp_path = hf_hub_download(
-                    repo_id="hexgrad/Kokoro-82M",
-                    filename=f"voices/{voice_file}",
-                    local_dir="temp_voices",
-                    force_download=True
-                )
-                
-                # Move the file to the correct location
-                os.makedirs(os.path.dirname(voice_path), exist_ok=True)
-                shutil.move(temp_path, voice_path)
-                downloaded_voices.append(voice_file)
-                print(f"Successfully downloaded {voice_file}")
-            else:
-                print(f"Voice file {voice_file} already exists")
-                downloaded_voices.append(voice_file)
-        except Exception as e:
-            print(f"Warning: Failed to download {voice_file}: {e}")
-            continue
-    
-    # Clean up temporary directory
-    if os.path.exists("temp_voices"):
-        shutil.rmtree("temp_voices")
-    
-    if not downloaded_voices:
+    if not available_voices:
         print("Warning: No voice files could be downloaded. Please check your internet connection.")
-    else:
-        print(f"Successfully processed {len(downloaded_voices)} voice files")
+    elif any(status != "cached" for status in statuses.values()):
+        print(f"Successfully processed {len(available_voices)} voice files")
     
-    return downloaded_voices
+    return available_voices
+
+def build_model(model_path: str, device: str, quantize: Optional[str] = None,
+                backend: str = "eager") -> KPipeline:
+    """Build and return the Kokoro pipeline with proper encoding configuration
 
-def build_model(model_path: str, device: str) -> KPipeline:
-    """Build and return the Kokoro pipeline with proper encoding configuration"""
+    Args:
+        model_path: Path to the model weights (downloaded if missing)
+        device: Device to use ('cuda' or 'cpu')
+        quantize: None for full precision, or "int8" for dynamic int8
+            quantization of the text encoder and plbert (CPU only)
+        backend: "eager" for PyTorch, or "onnx" to run a cached ONNX export
+            of the model through ONNX Runtime (CPU only)
+    """
     global _pipeline
+    if quantize not in QUANTIZE_MODES:
+        raise ValueError(f"Unsupported quantize mode: {quantize}. Choose from {QUANTIZE_MODES}")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unsupported backend: {backend}. Choose from {BACKENDS}")
+    if quantize is not None and backend != "eager":
+        raise ValueError("Quantization is only supported with the eager backend")
+    if _pipeline is not None and backend != "eager" and _pipeline.backend != backend:
+        print(f"Warning: Pipeline already built with backend={_pipeline.backend}, ignoring backend={backend}")
+    if _pipeline is not None and quantize is not None and _pipeline.quantize != quantize:
+        print(f"Warning: Pipeline already built with quantize={_pipeline.quantize}, ignoring quantize={quantize}")
     if _pipeline is None:
         try:
             # Patch json loading before initializing pipeline
             patch_json_load()
             
-            # Download model if it doesn't exist
+            # Fetch the model, config and voices concurrently; files that match
+            # the asset manifest are skipped without network access
             if model_path is None:
-                model_path = 'kokoro-v1_0.pth'
-            
-            if not os.path.exists(model_path):
-                print(f"Downloading model file {model_path}...")
-                from huggingface_hub import hf_hub_download
-                model_path = hf_hub_download(
-                    repo_id="hexgrad/Kokoro-82M",
-                    filename="kokoro-v1_0.pth",
-                    local_dir=".",
-                    force_download=True
-                )
-                print(f"Model downloaded to {model_path}")
-            
-            # Download config if it doesn't exist
-            config_path = "config.json"
-            if not os.path.exists(config_path):
-                print("Downloading config file...")
-                config_path = hf_hub_download(
-                    repo_id="hexgrad/Kokoro-82M",
-                    filename="config.json",
-                    local_dir=".",
-                    force_download=True
-                )
-                print(f"Config downloaded to {config_path}")
-            
-            # Download voice files
-            downloaded_voices = download_voice_files()
+                model_path = MODEL_FILE
+            config_path = CONFIG_FILE
+            names = [config_path]
+            if model_path == MODEL_FILE or not os.path.exists(model_path):
+                model_path = MODEL_FILE
+                names.append(MODEL_FILE)
+            print("\nChecking model and voice files...")
+            provision_assets(names + voice_assets(VOICE_FILES))
+            downloaded_voices = [voice_file for voice_file in VOICE_FILES if (Path("voices") / voice_file).exists()]
             
             if not downloaded_voices:
                 print("Error: No voice files available. Cannot proceed.")
                 raise ValueError("No voice files available")
             
             # Initialize pipeline with American English by default
-            _pipeline = KPipeline(lang_code='a')
+            if backend == "onnx":
+                if device != 'cpu':
+                    print("Warning: The onnx backend runs on CPU only")
+                from onnx_backend import load_onnx_model
+                onnx_model = load_onnx_model(model_path, config_path)
+                _pipeline = KPipeline(lang_code='a', model=False)
+                _pipeline.model = onnx_model
+                device = 'cpu'
+            else:
+                _pipeline = KPipeline(lang_code='a')
             if _pipeline is None:
                 raise ValueError("Failed to initialize KPipeline - pipeline is None")
                 
-            # Store device parameter for reference in other operations
+            # Store device and backend for reference in other operations
             _pipeline.device = device
+            _pipeline.backend = backend
+            
+            # Optionally quantize the model for faster CPU inference
+            _pipeline.quantize = None
+            if quantize == "int8":
+                if str(_pipeline.model.device) != 'cpu':
+                    print("Warning: int8 quantization is only supported on CPU, using full precision")
+                else:
+                    print("Applying dynamic int8 quantization...")
+                    quantize_model(_pipeline.model)
+                    _pipeline.quantize = quantize
             
-            # Initialize voices dictionary if it doesn't exist
-            if not hasattr(_pipeline, 'voices'):
-                _pipeline.voices = {}
+            # Initialize the voice cache
+            _pipeline.voices = VoiceCache()
             
             # Try to load the first available voice
             for voice_file in downloaded_voices:
@@ -303,7 +327,8 @@ def generate_speech(
     voice: str,
     lang: str = 'a',
     device: str = 'cpu',
-    speed: float = 1.0
+    speed: float = 1.0,
+    profiler: Optional[ChunkProfiler] = None
 ) -> Tuple[Optional[torch.Tensor], Optional[str]]:
     """Generate speech using the Kokoro pipeline
     
@@ -314,17 +339,22 @@ def generate_speech(
         lang: Language code ('a' for American English, 'b' for British English)
         device: Device to use ('cuda' or 'cpu')
         speed: Speech speed multiplier (default: 1.0)
+        profiler: Optional ChunkProfiler to time and profile the generation
         
     Returns:
-        Tuple of (audio tensor, phonemes string) or (None, None) on error
+        Tuple of (audio tensor, phonemes string) or (None, None) on error.
+        All segments of the text are joined into one tensor.
     """
     try:
         if model is None:
             raise ValueError("Model is None - pipeline not properly initialized")
             
-        # Initialize voices dictionary if it doesn't exist
+        # Initialize the voice cache if it doesn't exist
         if not hasattr(model, 'voices'):
-            model.voices = {}
+            model.voices = VoiceCache()
+        
+        # Relieve memory pressure if the process is over its budget
+        get_governor().throttle()
             
         # Ensure device is set
         if not hasattr(model, 'device'):
@@ -353,14 +383,23 @@ def generate_speech(
             split_pattern=r'\n+'
         )
         
-        # Get first generated segment and convert numpy array to tensor if needed
-        for gs, ps, audio in generator:
-            if audio is not None:
-                if isinstance(audio, np.ndarray):
-                    audio = torch.from_numpy(audio).float()
-                return audio, ps
-            
-        return None, None
+        if profiler:
+            profiler.begin(default_profile_dir())
+        chunk_profile = profiler.chunk(1, text) if profiler else nullcontext()
+        
+        # Collect every segment into one buffer
+        pcm = PCMBuffer.for_text(len(text), speed)
+        phonemes = []
+        with chunk_profile:
+            for gs, ps, audio in generator:
+                if audio is not None:
+                    pcm.append(audio)
+                    phonemes.append(ps)
+        result = (pcm.to_tensor(), ' '.join(phonemes)) if len(pcm) else (None, None)
+        
+        if profiler:
+            profiler.finish(lambda t: list(model(t, voice=voice_path, speed=speed, split_pattern=r'\n+')))
+        return result
     except Exception as e:
         print(f"Error generating speech: {e}")
         return None, None
\ No newline at end of file
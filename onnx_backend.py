@@ -0,0 +1,133 @@
+"""ONNX Runtime backend for Kokoro TTS Local
+
+Exports the acoustic model once to an ONNX graph cached under .cache/onnx
+and runs inference through ONNX Runtime, avoiding the per-op Python
+dispatch overhead of eager PyTorch on short chunks.
+"""
+from typing import Optional, Union
+from pathlib import Path
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import torch
+from kokoro import KModel
+from kokoro.model import KModelForONNX
+
+ONNX_CACHE_DIR = Path('.cache/onnx')
+ONNX_OPSET = 17
+REPO_ID = "hexgrad/Kokoro-82M"
+
+def artifact_key(model_path: str, config_path: str) -> str:
+    """Return a cache key for the exported graph.
+
+    The key changes whenever the weights, the config or the exporting
+    toolchain change, so stale artifacts are never reused.
+    """
+    stat = os.stat(model_path)
+    with open(config_path, 'rb') as f:
+        config_bytes = f.read()
+    digest = hashlib.sha256()
+    digest.update(f"{os.path.abspath(model_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    digest.update(config_bytes)
+    digest.update(f"torch={torch.__version__};opset={ONNX_OPSET}".encode())
+    return digest.hexdigest()[:16]
+
+def export_onnx(model_path: str, config_path: str, output_path: Path) -> Path:
+    """Export the Kokoro acoustic model to an ONNX graph at output_path."""
+    # Complex STFT ops cannot be exported, so build a dedicated real-valued copy
+    kmodel = KModel(repo_id=REPO_ID, config=config_path, model=model_path, disable_complex=True).eval()
+    wrapper = KModelForONNX(kmodel).eval()
+
+    # Dummy inputs only fix ranks and dtypes; the token axis is dynamic
+    input_ids = torch.zeros((1, 32), dtype=torch.long)
+    ref_s = torch.zeros((1, 256), dtype=torch.float32)
+    speed = torch.tensor(1.0, dtype=torch.float32)
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary name first so concurrent processes never load a partial file
+    temp_path = output_path.with_suffix(f".{os.getpid()}.tmp")
+    torch.onnx.export(
+        wrapper,
+        (input_ids, ref_s, speed),
+        str(temp_path),
+        input_names=['input_ids', 'ref_s', 'speed'],
+        output_names=['waveform', 'duration'],
+        dynamic_axes={'input_ids': {1: 'input_ids_len'}, 'waveform': {0: 'num_samples'}},
+        opset_version=ONNX_OPSET,
+        dynamo=False
+    )
+    os.replace(temp_path, output_path)
+    return output_path
+
+class OnnxKModel:
+    """Drop-in replacement for KModel that runs inference through ONNX Runtime.
+
+    Implements the subset of the KModel interface used by KPipeline:
+    vocab, device and __call__(phonemes, ref_s, speed, return_output).
+    """
+
+    def __init__(self, session, vocab: dict, context_length: int):
+        self.session = session
+        self.vocab = vocab
+        self.context_length = context_length
+        self.device = 'cpu'
+
+    def __call__(
+        self,
+        phonemes: str,
+        ref_s: torch.FloatTensor,
+        speed: float = 1,
+        return_output: bool = False
+    ) -> Union[KModel.Output, torch.FloatTensor]:
+        input_ids = [i for i in map(self.vocab.get, phonemes) if i is not None]
+        if len(input_ids) + 2 > self.context_length:
+            raise ValueError(f"Phoneme sequence too long: {len(input_ids) + 2} > {self.context_length}")
+        waveform, duration = self.session.run(None, {
+            'input_ids': np.array([[0, *input_ids, 0]], dtype=np.int64),
+            'ref_s': ref_s.detach().cpu().numpy().astype(np.float32),
+            'speed': np.array(speed, dtype=np.float32),
+        })
+        audio = torch.from_numpy(waveform)
+        if not return_output:
+            return audio
+        return KModel.Output(audio=audio, pred_dur=torch.from_numpy(duration))
+
+def load_onnx_model(model_path: str, config_path: str = "config.json",
+                    cache_dir: Path = ONNX_CACHE_DIR, num_threads: Optional[int] = None) -> OnnxKModel:
+    """Load the cached ONNX graph for model_path, exporting it first if needed.
+
+    The first session also serializes the graph after ONNX Runtime's
+    portable (extended) optimizations, so later process starts skip both
+    the export and the graph rewrite.
+    """
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        raise ImportError("The onnx backend requires onnxruntime. Install it with: pip install onnxruntime onnx")
+
+    key = artifact_key(model_path, config_path)
+    exported_path = cache_dir / f"kokoro-{key}.onnx"
+    optimized_path = cache_dir / f"kokoro-{key}.opt.onnx"
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = num_threads or torch.get_num_threads()
+    if optimized_path.exists():
+        print(f"Using cached ONNX graph {optimized_path}")
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session = ort.InferenceSession(str(optimized_path), options, providers=['CPUExecutionProvider'])
+    else:
+        if not exported_path.exists():
+            print(f"Exporting model to ONNX (one-time, cached in {cache_dir})...")
+            start = time.perf_counter()
+            export_onnx(model_path, config_path, exported_path)
+            print(f"Export finished in {time.perf_counter() - start:.1f}s")
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+        options.optimized_model_filepath = str(optimized_path.with_suffix(f".{os.getpid()}.tmp"))
+        session = ort.InferenceSession(str(exported_path), options, providers=['CPUExecutionProvider'])
+        os.replace(options.optimized_model_filepath, optimized_path)
+
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    return OnnxKModel(session, config['vocab'], config['plbert']['max_position_embeddings'])
@@ -0,0 +1,200 @@
+"""Growable PCM audio buffer for Kokoro TTS Local
+
+PCMBuffer collects generated audio in one preallocated numpy array instead
+of lists of tensors that are concatenated and converted later:
+
+- each segment (torch tensor or numpy array) is copied once, straight into
+  the buffer; CPU float32 tensors are read without an intermediate copy
+- silence only advances the write position over storage that is already
+  zero, so no zero arrays are allocated
+- storage grows geometrically, so a good size estimate means one allocation
+- normalization happens in place, and view() exposes the samples without
+  copying them
+
+Samples are stored as float32, or as int16 to halve the memory of long
+renders. Allocation and copy counters are kept for benchmarking.
+
+When a memory budget is set (see memory_budget.py), storage that does not
+fit is memory-mapped from a scratch file, and the governor can spill a
+buffer's storage to one under memory pressure.
+"""
+from typing import Optional
+import threading
+import numpy as np
+from memory_budget import get_governor, scratch_memmap, track_buffer
+
+SAMPLE_RATE = 24000
+INT16_SCALE = 32767.0
+# Rough speaking rate, used to size a buffer from the text length
+CHARS_PER_SECOND = 14.0
+
+class PCMBuffer:
+    """Preallocated, growable mono PCM buffer in float32 or int16.
+
+    Args:
+        initial_samples: Capacity to allocate up front
+        dtype: 'float32' or 'int16'
+        sample_rate: Sample rate of the audio, used for silence and durations
+        growth: Factor the capacity grows by when an append does not fit
+    """
+
+    def __init__(self, initial_samples: int = SAMPLE_RATE * 60, dtype: str = 'float32',
+                 sample_rate: int = SAMPLE_RATE, growth: float = 1.5):
+        if dtype not in ('float32', 'int16'):
+            raise ValueError(f"Unsupported PCM dtype: {dtype}")
+        self.dtype = np.dtype(dtype)
+        self.sample_rate = sample_rate
+        self.growth = growth
+        self.length = 0
+        self.allocations = 0
+        self.bytes_copied = 0
+        self.segments = 0
+        self.silence_samples = 0
+        self.mapped = False
+        # Guards the storage against a spill from another thread
+        self._lock = threading.RLock()
+        self._data = self._allocate(max(1, int(initial_samples)))
+        track_buffer(self)
+
+    @classmethod
+    def for_text(cls, characters: int, speed: float = 1.0, silence_seconds: float = 0.0,
+                 dtype: str = 'float32', sample_rate: int = SAMPLE_RATE) -> "PCMBuffer":
+        """Create a buffer sized for speaking `characters` characters at `speed`."""
+        seconds = characters / CHARS_PER_SECOND / max(speed, 0.1) * 1.2 + silence_seconds
+        return cls(int(seconds * sample_rate), dtype, sample_rate)
+
+    def _allocate(self, samples: int) -> np.ndarray:
+        # np.zeros gets zeroed pages from the OS lazily; untouched storage is silence
+        self.allocations += 1
+        governor = get_governor()
+        if self.mapped or not governor.allow_allocation(samples * self.dtype.itemsize):
+            # Scratch files start zeroed too
+            self.mapped = True
+            return scratch_memmap(samples, self.dtype, governor.scratch_dir)
+        return np.zeros(samples, dtype=self.dtype)
+
+    def __len__(self) -> int:
+        return self.length
+
+    @property
+    def capacity(self) -> int:
+        return len(self._data)
+
+    @property
+    def seconds(self) -> float:
+        return self.length / self.sample_rate
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of storage held in memory (0 once spilled to a scratch file)."""
+        return 0 if self.mapped else self._data.nbytes
+
+    def reserve(self, samples: int) -> None:
+        """Make room for `samples` more samples, growing the storage if needed."""
+        with self._lock:
+            needed = self.length + samples
+            if needed <= len(self._data):
+                return
+            data = self._allocate(max(needed, int(len(self._data) * self.growth)))
+            data[:self.length] = self._data[:self.length]
+            self.bytes_copied += self.length * self.dtype.itemsize
+            self._data = data
+
+    def spill(self, scratch_dir: Optional[str] = None) -> int:
+        """Move the storage to a memory-mapped scratch file; returns the bytes released."""
+        with self._lock:
+            if self.mapped:
+                return 0
+            released = self._data.nbytes
+            data = scratch_memmap(len(self._data), self.dtype, scratch_dir)
+            data[:self.length] = self._data[:self.length]
+            self._data = data
+            self.mapped = True
+            self.allocations += 1
+            self.bytes_copied += self.length * self.dtype.itemsize
+            return released
+
+    def append(self, audio) -> int:
+        """Copy a segment (torch tensor or numpy array) to the end; returns its start offset."""
+        if hasattr(audio, 'detach'):
+            # Shares memory with CPU float32 tensors, so this is not a copy
+            audio = audio.detach().cpu().numpy()
+        audio = np.asarray(audio).reshape(-1)
+        with self._lock:
+            start = self.length
+            self.reserve(len(audio))
+            target = self._data[start:start + len(audio)]
+            if self.dtype == np.int16 and audio.dtype != np.int16:
+                # Samples beyond full scale are clipped
+                np.multiply(np.clip(audio, -1.0, 1.0), INT16_SCALE, out=target, casting='unsafe')
+            else:
+                target[...] = audio
+            self.length += len(audio)
+            self.bytes_copied += len(audio) * self.dtype.itemsize
+            self.segments += 1
+            return start
+
+    def append_silence(self, seconds: Optional[float] = None, samples: Optional[int] = None) -> None:
+        """Add silence by moving the write position over zeroed storage."""
+        samples = int(samples if samples is not None else seconds * self.sample_rate)
+        with self._lock:
+            self.reserve(samples)
+            self.length += samples
+            self.silence_samples += samples
+
+    def truncate(self, length: int) -> None:
+        """Drop everything after `length` samples, e.g. a partially generated chunk."""
+        with self._lock:
+            if length < self.length:
+                # Keep storage past the end zeroed so later silence stays silent
+                self._data[length:self.length] = 0
+                self.length = length
+
+    def peak(self) -> float:
+        if not self.length:
+            return 0.0
+        view = self.view()
+        peak = max(abs(float(view.max())), abs(float(view.min())))
+        return peak / INT16_SCALE if self.dtype == np.int16 else peak
+
+    def normalize(self, target_peak: float = 1.0) -> float:
+        """Scale the samples in place so the peak is `target_peak`; returns the gain.
+
+        Silent audio is left untouched (gain 1.0).
+        """
+        peak = self.peak()
+        if peak <= 0:
+            return 1.0
+        gain = target_peak / peak
+        with self._lock:
+            view = self.view()
+            if self.dtype == np.int16:
+                # Scale in blocks to avoid a float copy of the whole buffer
+                block = 1 << 20
+                for start in range(0, self.length, block):
+                    part = view[start:start + block]
+                    np.clip(np.rint(part * gain), -INT16_SCALE, INT16_SCALE, out=part, casting='unsafe')
+            else:
+                view *= gain
+        return gain
+
+    def view(self) -> np.ndarray:
+        """The samples written so far, as a view into the storage (no copy)."""
+        return self._data[:self.length]
+
+    def to_tensor(self):
+        """The samples as a torch tensor that shares memory with the buffer."""
+        import torch
+        return torch.from_numpy(self.view())
+
+    def stats(self) -> dict:
+        """Allocation and copy counters, for benchmarks and traces."""
+        return {"samples": self.length, "capacity": self.capacity, "segments": self.segments,
+                "allocations": self.allocations, "bytes_copied": self.bytes_copied,
+                "silence_samples": self.silence_samples, "mapped": self.mapped}
+
+    def write(self, path, format: Optional[str] = None) -> None:
+        """Write the samples with soundfile (int16 buffers as 16-bit PCM)."""
+        import soundfile as sf
+        subtype = 'PCM_16' if self.dtype == np.int16 else None
+        sf.write(path, self.view(), self.sample_rate, subtype=subtype, format=format)
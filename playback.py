@@ -0,0 +1,319 @@
+"""Low-latency live playback for Kokoro TTS Local
+
+Plays speech while it is being synthesized. Each generated segment is
+pushed into a ring buffer as soon as it is produced, and an audio sink
+drains the buffer in real time from its own thread (or the sound card's
+callback), so synthesis of the next segment overlaps playback of the
+current one.
+
+Sinks:
+    sounddevice  the default output device (needs the optional sounddevice package)
+    file         writes what a listener would hear, gaps included, to a WAV file
+    null         discards the audio; for headless tests and tuning
+
+The file and null sinks consume audio at the real-time rate, like a device.
+Every session reports time to first audio (TTFA) and buffer underruns,
+i.e. moments where playback had started and the buffer ran dry.
+
+Text is split into sentences (and at newlines), so the first sentence plays
+while the rest is still being synthesized.
+
+Usage:
+    python playback.py "Some text to speak." [--sink null] [--prebuffer 0.5] [--stub]
+"""
+from typing import Optional
+import argparse
+import os
+import threading
+import time
+import numpy as np
+
+SAMPLE_RATE = 24000
+DEFAULT_BLOCK_SIZE = 1024  # ~43 ms at 24 kHz
+DEFAULT_BUFFER_SECONDS = 30.0
+SINKS = ("sounddevice", "file", "null")
+# Segment boundaries: after sentence-ending punctuation, and at newlines
+SENTENCE_SPLIT = r'(?<=[.!?])\s+|\n+'
+
+class RingBuffer:
+    """Fixed-size float32 ring buffer with one writer and one reader thread.
+
+    write() blocks while the buffer is full, which throttles synthesis that
+    runs far ahead of playback; read_into() never blocks.
+    """
+
+    def __init__(self, capacity: int):
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self._capacity = capacity
+        self._read = 0   # total samples read
+        self._write = 0  # total samples written
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @property
+    def available(self) -> int:
+        with self._cond:
+            return self._write - self._read
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def write(self, samples: np.ndarray) -> None:
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        offset = 0
+        while offset < len(samples):
+            with self._cond:
+                while self._write - self._read >= self._capacity and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                count = min(len(samples) - offset, self._capacity - (self._write - self._read))
+                start = self._write % self._capacity
+                first = min(count, self._capacity - start)
+                self._data[start:start + first] = samples[offset:offset + first]
+                self._data[:count - first] = samples[offset + first:offset + count]
+                self._write += count
+                offset += count
+                self._cond.notify_all()
+
+    def read_into(self, out: np.ndarray) -> int:
+        """Copy up to len(out) samples into out; returns how many were copied."""
+        with self._cond:
+            count = min(len(out), self._write - self._read)
+            start = self._read % self._capacity
+            first = min(count, self._capacity - start)
+            out[:first] = self._data[start:start + first]
+            out[first:count] = self._data[:count - first]
+            self._read += count
+            self._cond.notify_all()
+            return count
+
+    def close(self) -> None:
+        """Mark the end of the stream; readers drain what is left."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+class PlaybackStats:
+    """Latency and underrun counters shared by the producer and the sink."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_segment = None   # seconds until the first segment was synthesized
+        self.first_audio = None     # seconds until the first samples reached the device
+        self.underruns = 0
+        self.underrun_seconds = 0.0
+        self.segments = 0
+        self.samples_played = 0
+        self.max_buffered = 0
+        self._starved = False
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def block_played(self, filled: int, block_size: int, stream_ended: bool) -> None:
+        """Record one device block of which `filled` samples came from the buffer."""
+        if filled and self.first_audio is None:
+            self.first_audio = self.elapsed()
+        self.samples_played += filled
+        if filled < block_size and not stream_ended and self.first_audio is not None:
+            if not self._starved:
+                self.underruns += 1
+            self._starved = True
+            self.underrun_seconds += (block_size - filled) / SAMPLE_RATE
+        else:
+            self._starved = False
+
+    def summary(self) -> dict:
+        return {"ttfa_s": self.first_audio, "first_segment_s": self.first_segment, "segments": self.segments,
+                "audio_s": self.samples_played / SAMPLE_RATE, "underruns": self.underruns,
+                "underrun_s": self.underrun_seconds, "max_buffered_s": self.max_buffered / SAMPLE_RATE,
+                "wall_s": self.elapsed()}
+
+class PacedSink:
+    """Base for sinks that consume the buffer at the real-time rate in a thread."""
+
+    def __init__(self, block_size: int = DEFAULT_BLOCK_SIZE):
+        self.block_size = block_size
+        self._thread = None
+
+    def start(self, ring: RingBuffer, stats: PlaybackStats, prebuffer: int) -> None:
+        self._thread = threading.Thread(target=self._run, args=(ring, stats, prebuffer), daemon=True)
+        self._thread.start()
+
+    def _run(self, ring: RingBuffer, stats: PlaybackStats, prebuffer: int) -> None:
+        block = np.zeros(self.block_size, dtype=np.float32)
+        period = self.block_size / SAMPLE_RATE
+        # Wait for the prebuffer (or the whole stream, if it is shorter)
+        while ring.available < max(1, prebuffer) and not ring.closed:
+            time.sleep(period / 4)
+        deadline = time.perf_counter()
+        while True:
+            filled = ring.read_into(block)
+            ended = ring.closed and ring.available == 0
+            if ended and filled == 0:
+                break
+            block[filled:] = 0
+            stats.block_played(filled, self.block_size, ended)
+            self.emit(block)
+            deadline += period
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def emit(self, block: np.ndarray) -> None:
+        pass
+
+    def join(self) -> None:
+        if self._thread:
+            self._thread.join()
+        self.close()
+
+    def close(self) -> None:
+        pass
+
+class NullSink(PacedSink):
+    """Consumes audio in real time and discards it."""
+
+class FileSink(PacedSink):
+    """Writes the played stream, including underrun gaps, to a WAV file."""
+
+    def __init__(self, path: str = "output_live.wav", block_size: int = DEFAULT_BLOCK_SIZE):
+        import soundfile as sf
+        super().__init__(block_size)
+        self.path = path
+        self._file = sf.SoundFile(path, 'w', samplerate=SAMPLE_RATE, channels=1, subtype='PCM_16')
+
+    def emit(self, block: np.ndarray) -> None:
+        self._file.write(block)
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+class SoundDeviceSink:
+    """Plays through the default output device with a sounddevice callback stream."""
+
+    def __init__(self, block_size: int = DEFAULT_BLOCK_SIZE):
+        import sounddevice  # noqa: F401 - fail early if it is not installed
+        self.block_size = block_size
+        self._done = threading.Event()
+        self._stream = None
+
+    def start(self, ring: RingBuffer, stats: PlaybackStats, prebuffer: int) -> None:
+        import sounddevice as sd
+
+        started = [False]
+
+        def callback(outdata, frames, time_info, status):
+            block = outdata[:, 0]
+            if not started[0]:
+                if ring.available < max(1, prebuffer) and not ring.closed:
+                    outdata.fill(0)
+                    return
+                started[0] = True
+            filled = ring.read_into(block)
+            block[filled:] = 0
+            ended = ring.closed and ring.available == 0
+            stats.block_played(filled, frames, ended)
+            if ended:
+                raise sd.CallbackStop()
+
+        self._stream = sd.OutputStream(samplerate=SAMPLE_RATE, channels=1, dtype='float32',
+                                       blocksize=self.block_size, callback=callback,
+                                       finished_callback=self._done.set)
+        self._stream.start()
+
+    def join(self) -> None:
+        self._done.wait()
+        self._stream.close()
+
+def create_sink(kind: Optional[str] = None, path: str = "output_live.wav", block_size: int = DEFAULT_BLOCK_SIZE):
+    """Create a sink by name, or from KOKORO_PLAYBACK_SINK.
+
+    Without a name, plays through sounddevice when it is installed and
+    falls back to the file sink otherwise.
+    """
+    kind = kind or os.environ.get('KOKORO_PLAYBACK_SINK')
+    if kind == "null":
+        return NullSink(block_size)
+    if kind == "file":
+        return FileSink(path, block_size)
+    try:
+        return SoundDeviceSink(block_size)
+    except (ImportError, OSError) as e:
+        if kind == "sounddevice":
+            raise
+        print(f"Note: live playback needs sounddevice ({e}); writing the stream to {path} instead")
+        return FileSink(path, block_size)
+
+def stream_speech(model, text: str, voice: str, speed: float, sink, prebuffer_seconds: float = 0.0,
+                  buffer_seconds: float = DEFAULT_BUFFER_SECONDS, on_segment=None,
+                  split_pattern: str = SENTENCE_SPLIT) -> dict:
+    """Synthesize text sentence by sentence while the sink plays it; returns the stats summary.
+
+    on_segment(graphemes, phonemes, audio) is called for each segment as
+    it is pushed to the buffer.
+    """
+    import torch
+
+    ring = RingBuffer(int(buffer_seconds * SAMPLE_RATE))
+    stats = PlaybackStats()
+    sink.start(ring, stats, int(prebuffer_seconds * SAMPLE_RATE))
+    try:
+        for gs, ps, audio in model(text, voice=f"voices/{voice}.pt", speed=speed, split_pattern=split_pattern):
+            if audio is None:
+                continue
+            if isinstance(audio, torch.Tensor):
+                audio = audio.detach().float().cpu().numpy()
+            if stats.first_segment is None:
+                stats.first_segment = stats.elapsed()
+            stats.segments += 1
+            ring.write(audio)
+            stats.max_buffered = max(stats.max_buffered, ring.available)
+            if on_segment:
+                on_segment(gs, ps, audio)
+    finally:
+        ring.close()
+        sink.join()
+    return stats.summary()
+
+def print_stats(summary: dict) -> None:
+    ttfa = f"{summary['ttfa_s'] * 1000:.0f} ms" if summary['ttfa_s'] is not None else "n/a"
+    print(f"\nTime to first audio: {ttfa}")
+    print(f"Played {summary['audio_s']:.1f}s of audio in {summary['segments']} segment(s) "
+          f"over {summary['wall_s']:.1f}s")
+    print(f"Underruns: {summary['underruns']} ({summary['underrun_s']:.2f}s of silence), "
+          f"max buffered {summary['max_buffered_s']:.1f}s")
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("text", help="Text to speak (segments are split at sentences and newlines)")
+    parser.add_argument("--voice", default="af_bella", help="Voice name (from voices/)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Speech speed (0.5-2.0)")
+    parser.add_argument("--sink", choices=SINKS, help="Audio sink (default: sounddevice, else file)")
+    parser.add_argument("--output", default="output_live.wav", help="WAV path for the file sink")
+    parser.add_argument("--prebuffer", type=float, default=0.0,
+                        help="Seconds of audio to buffer before playback starts")
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE, help="Samples per device block")
+    parser.add_argument("--stub", action="store_true", help="Use the deterministic benchmark stub instead of the model")
+    args = parser.parse_args(argv)
+
+    if args.stub:
+        from benchmarks.stub import StubPipeline
+        model = StubPipeline()
+    else:
+        import torch
+        from models import build_model
+        from runtime_config import configure_runtime
+        configure_runtime()
+        model = build_model('kokoro-v1_0.pth', 'cuda' if torch.cuda.is_available() else 'cpu')
+
+    sink = create_sink(args.sink, args.output, args.block_size)
+    summary = stream_speech(model, args.text.replace('\\n', '\n'), args.voice.replace('.pt', ''),
+                            args.speed, sink, args.prebuffer)
+    print_stats(summary)
+
+if __name__ == "__main__":
+    main()
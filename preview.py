@@ -0,0 +1,260 @@
+"""Preview-first rendering for Kokoro TTS Local
+
+Renders a short preview of a book before anything else, so voice and speed
+can be approved within seconds, then continues the full render in the
+background at a lower scheduling priority:
+
+1. The preview chunks are rendered in the foreground at normal priority and
+   written to <output stem>.preview.wav. A <preview>.ready file (JSON) is
+   written once the preview is complete, so tools watching the folder can
+   play it as soon as it is usable.
+2. The full render then runs through generate_audio in a background thread
+   whose nice value is raised, so it yields the CPU to previews and other
+   interactive work. Chunks already rendered for the preview are reused.
+
+Preview modes:
+    head     the first --seconds of the book
+    sampled  --samples chunks spread evenly across the book, up to --seconds
+
+Usage:
+    python preview.py input/book.pdf [--pages 5-120] [--seconds 60] [--mode sampled]
+"""
+from typing import Optional, List
+from pathlib import Path
+import argparse
+import json
+import os
+import threading
+import time
+import numpy as np
+import soundfile as sf
+from loudness import normalize_array
+
+SAMPLE_RATE = 24000
+PREVIEW_SILENCE_SECONDS = 0.5
+FADE_OUT_SECONDS = 0.5
+BACKGROUND_NICE = 10
+
+class CachedPipeline:
+    """Wraps a pipeline and replays the audio of chunks it has already rendered.
+
+    Chunks are keyed by (text, voice, speed), so the full render reuses
+    every chunk the preview rendered instead of synthesizing it again.
+    Only chunks rendered while `recording` is set are kept, and each is
+    dropped once replayed, so the cache never holds more than the preview.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.cache = {}
+        self.recording = True
+        self._lock = threading.Lock()
+
+    def __call__(self, text: str, voice: Optional[str] = None, speed: float = 1, **kwargs):
+        key = (text, voice, speed)
+        with self._lock:
+            cached = self.cache.pop(key, None)
+        if cached is not None:
+            yield from cached
+            return
+        results = []
+        for gs, ps, audio in self.model(text, voice=voice, speed=speed, **kwargs):
+            if self.recording:
+                results.append((gs, ps, audio))
+            yield gs, ps, audio
+        if self.recording:
+            with self._lock:
+                self.cache[key] = results
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+def select_preview_chunks(chunks: List[str], mode: str = "head", samples: int = 8) -> List[int]:
+    """Return the indices of the chunks to render for the preview, in render order."""
+    if mode == "head":
+        return list(range(len(chunks)))
+    if mode == "sampled":
+        count = min(samples, len(chunks))
+        return sorted({round(i * (len(chunks) - 1) / max(1, count - 1)) for i in range(count)})
+    raise ValueError(f"Unknown preview mode: {mode}")
+
+def lower_thread_priority(increment: int = BACKGROUND_NICE) -> bool:
+    """Raise the nice value of the calling thread (Linux); returns True on success.
+
+    On Linux each thread has its own nice value, and threads it starts,
+    such as torch's OpenMP workers for its calls, inherit it.
+    """
+    try:
+        thread_id = threading.get_native_id()
+        os.setpriority(os.PRIO_PROCESS, thread_id, os.getpriority(os.PRIO_PROCESS, thread_id) + increment)
+        return True
+    except (AttributeError, OSError):
+        # No per-thread priorities on this platform
+        return False
+
+def write_ready_flag(preview_path: Path, info: dict) -> Path:
+    """Mark a preview file as ready to play by writing <preview>.ready next to it."""
+    flag = preview_path.with_name(preview_path.name + ".ready")
+    tmp_path = flag.with_name(flag.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=2)
+    os.replace(tmp_path, flag)
+    return flag
+
+def render_preview(model, chunks: List[str], voice: str, speed: float, preview_path: Path,
+                   seconds: float = 60.0, mode: str = "head", samples: int = 8) -> Optional[Path]:
+    """Render and write the preview; returns its path, or None if no audio was produced."""
+    import torch
+
+    start = time.perf_counter()
+    budget = int(seconds * SAMPLE_RATE)
+    silence = np.zeros(int(SAMPLE_RATE * PREVIEW_SILENCE_SECONDS), dtype=np.float32)
+    segments, total, rendered = [], 0, []
+    for index in select_preview_chunks(chunks, mode, samples):
+        if total >= budget:
+            break
+        try:
+            chunk_audio = [audio for _, _, audio in model(chunks[index], voice=f"voices/{voice}.pt", speed=speed)
+                           if audio is not None]
+        except Exception as e:
+            print(f"Warning: Failed to render preview chunk {index + 1}: {e}")
+            continue
+        if not chunk_audio:
+            continue
+        audio = torch.cat([a if isinstance(a, torch.Tensor) else torch.from_numpy(a) for a in chunk_audio])
+        segments += [audio.float().cpu().numpy(), silence]
+        total += len(segments[-2]) + len(silence)
+        rendered.append(index + 1)
+    if not segments:
+        return None
+
+    audio = np.concatenate(segments)[:budget]
+    fade = min(len(audio), int(FADE_OUT_SECONDS * SAMPLE_RATE))
+    if total > budget and fade:
+        # Cut mid-chunk: fade out instead of clicking
+        audio[-fade:] *= np.linspace(1.0, 0.0, fade, dtype=np.float32)
+    # Same loudness target as the full render, so the preview sounds like the result
+    audio = normalize_array(audio)
+
+    preview_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = preview_path.with_name(preview_path.stem + ".partial.wav")
+    sf.write(tmp_path, audio, SAMPLE_RATE)
+    os.replace(tmp_path, preview_path)
+    write_ready_flag(preview_path, {"preview": str(preview_path), "mode": mode, "seconds": len(audio) / SAMPLE_RATE,
+                                    "chunks": rendered, "total_chunks": len(chunks), "voice": voice, "speed": speed,
+                                    "render_seconds": time.perf_counter() - start})
+    return preview_path
+
+class PreviewRender:
+    """A preview that is ready, plus the full render running in the background."""
+
+    def __init__(self, preview_path: Optional[Path], thread: threading.Thread, result: dict):
+        self.preview_path = preview_path
+        self._thread = thread
+        self._result = result
+
+    @property
+    def done(self) -> bool:
+        return not self._thread.is_alive()
+
+    def wait(self) -> Optional[Path]:
+        """Wait for the full render and return its output path (None if it failed)."""
+        self._thread.join()
+        if "error" in self._result:
+            print(f"Error in full render: {self._result['error']}")
+        return self._result.get("output")
+
+def render_with_preview(model, text_lines: List[str], voice: str, speed: float, output_path: str,
+                        audio_format: str = "wav", seconds: float = 60.0, mode: str = "head",
+                        samples: int = 8) -> PreviewRender:
+    """Render a preview now and start the full render in a low-priority background thread."""
+    from audio_book import generate_audio, split_text_into_chunks
+
+    output_path = Path(output_path)
+    preview_path = output_path.with_name(f"{output_path.stem}.preview.wav")
+    flag = preview_path.with_name(preview_path.name + ".ready")
+    if flag.exists():
+        flag.unlink()
+
+    cached_model = CachedPipeline(model)
+    chunks = split_text_into_chunks(' '.join(text_lines))
+    preview = render_preview(cached_model, chunks, voice, speed, preview_path, seconds, mode, samples)
+    cached_model.recording = False
+    if preview:
+        print(f"\nPreview ready: {preview}")
+    else:
+        print("\nWarning: No preview audio was generated")
+
+    result = {}
+
+    def full_render():
+        if not lower_thread_priority():
+            print("Note: could not lower the background render's priority on this platform")
+        try:
+            result["output"] = generate_audio(cached_model, text_lines, voice, speed,
+                                              audio_format=audio_format, output_path=str(output_path))
+        except Exception as e:
+            result["error"] = str(e)
+
+    thread = threading.Thread(target=full_render, name="full-render", daemon=True)
+    thread.start()
+    return PreviewRender(preview, thread, result)
+
+def main(argv: Optional[list] = None) -> int:
+    import torch
+    from models import build_model, QUANTIZE_MODES, BACKENDS
+    from audio_book import read_input_file, DEFAULT_MODEL_PATH
+    from batch_render import parse_pages
+    from runtime_config import configure_runtime
+    from instrumentation import configure_tracing, get_tracer, instrument_pipeline
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="PDF or TXT file")
+    parser.add_argument("--pages", help="Page range of a PDF, e.g. 5-120")
+    parser.add_argument("--voice", default="af_bella", help="Voice name (from voices/)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Speech speed (0.5-2.0)")
+    parser.add_argument("--format", choices=("wav", "mp3", "aac"), default="wav", help="Format of the full render")
+    parser.add_argument("--output", help="Output file (default: outputs/<input stem>.<format>)")
+    parser.add_argument("--seconds", type=float, default=60.0, help="Preview length in seconds")
+    parser.add_argument("--mode", choices=("head", "sampled"), default="head", help="Which chunks the preview uses")
+    parser.add_argument("--samples", type=int, default=8, help="Chunks in a sampled preview")
+    parser.add_argument("--preview-only", action="store_true", help="Stop after writing the preview")
+    parser.add_argument("--quantize", choices=[m for m in QUANTIZE_MODES if m], help="Quantized CPU inference")
+    parser.add_argument("--backend", choices=BACKENDS, default="eager", help="Inference backend")
+    args = parser.parse_args(argv)
+
+    voice = args.voice.replace('.pt', '')
+    if not os.path.exists(f"voices/{voice}.pt"):
+        parser.error(f"Voice file not found: voices/{voice}.pt")
+    start_page, end_page = parse_pages(args.pages)
+    text_lines = read_input_file(args.input, start_page, end_page)
+    output = args.output or f"outputs/{Path(args.input).stem}.{args.format}"
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    configure_runtime()
+    configure_tracing()
+    model = build_model(DEFAULT_MODEL_PATH, device, quantize=args.quantize, backend=args.backend)
+    instrument_pipeline(model)
+
+    start = time.perf_counter()
+    if args.preview_only:
+        from audio_book import split_text_into_chunks
+        chunks = split_text_into_chunks(' '.join(text_lines))
+        preview_path = Path(output).with_name(f"{Path(output).stem}.preview.wav")
+        preview = render_preview(model, chunks, voice, args.speed, preview_path, args.seconds, args.mode, args.samples)
+        print(f"Preview {'ready: ' + str(preview) if preview else 'failed'} ({time.perf_counter() - start:.1f}s)")
+        return 0 if preview else 1
+
+    try:
+        render = render_with_preview(model, text_lines, voice, args.speed, output, args.format,
+                                     args.seconds, args.mode, args.samples)
+        if render.preview_path:
+            print(f"Time to preview: {time.perf_counter() - start:.1f}s; full render continues in the background")
+        output_path = render.wait()
+    finally:
+        get_tracer().close()
+    print(f"Full render finished in {time.perf_counter() - start:.1f}s")
+    return 0 if output_path else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,153 @@
+"""Profiling hooks for hot-chunk analysis in Kokoro TTS Local
+
+ChunkProfiler times every chunk of a render and profiles selected chunks
+with cProfile and torch.profiler:
+
+- chunks whose text matches a regex pattern are profiled as they render
+- the slowest N chunks by time per character are re-synthesized under the
+  profilers once the render has finished
+
+Per-chunk traces and a summary ranking all chunks by time per character
+are written to a directory next to the output file. Times of chunks
+profiled inline include the profilers' overhead.
+"""
+from typing import Optional, Callable
+from contextlib import contextmanager
+from pathlib import Path
+import cProfile
+import datetime
+import io
+import json
+import os
+import pstats
+import re
+import time
+
+class ChunkProfiler:
+    """Times chunks and saves cProfile/torch.profiler traces for selected ones.
+
+    Args:
+        slowest: Number of chunks with the highest time per character to
+            re-profile after the render (0 to disable)
+        pattern: Regex; chunks whose text matches are profiled inline
+        torch_profiler: Also record a torch.profiler trace per profiled chunk
+        output_dir: Where to save traces; defaults to a directory next to
+            the render's output file
+    """
+
+    def __init__(self, slowest: int = 0, pattern: Optional[str] = None,
+                 torch_profiler: bool = True, output_dir: Optional[str] = None):
+        self.slowest = slowest
+        self.pattern = re.compile(pattern) if pattern else None
+        self.torch_profiler = torch_profiler
+        self.fixed_output_dir = Path(output_dir) if output_dir else None
+        self.output_dir = self.fixed_output_dir
+        self.records = []
+
+    def begin(self, default_dir: Path) -> None:
+        """Start a new render, saving traces to default_dir unless output_dir was given."""
+        self.output_dir = self.fixed_output_dir or Path(default_dir)
+        self.records = []
+
+    @contextmanager
+    def chunk(self, index: int, text: str):
+        """Time one chunk, profiling it if its text matches the pattern."""
+        record = {"index": index, "characters": len(text), "text": text, "profiled": None}
+        profile = self.pattern is not None and self.pattern.search(text) is not None
+        start = time.perf_counter()
+        try:
+            if profile:
+                with self._profile(index, "pattern"):
+                    yield
+                record["profiled"] = "pattern"
+            else:
+                yield
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            record["ms_per_char"] = record["seconds"] * 1000 / max(1, record["characters"])
+            self.records.append(record)
+
+    @contextmanager
+    def _profile(self, index: int, reason: str):
+        """Run a block under cProfile (and torch.profiler) and save the traces."""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        stem = self.output_dir / f"chunk_{index:04d}"
+        torch_prof = None
+        if self.torch_profiler:
+            import torch
+            torch_prof = torch.profiler.profile(
+                activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True
+            )
+            torch_prof.__enter__()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            if torch_prof is not None:
+                torch_prof.__exit__(None, None, None)
+            self._save(stem, reason, profiler, torch_prof)
+
+    def _save(self, stem: Path, reason: str, profiler: cProfile.Profile, torch_prof) -> None:
+        profiler.dump_stats(f"{stem}.prof")
+        report = io.StringIO()
+        report.write(f"Profiled because: {reason}\n\n=== cProfile (top 40 by cumulative time) ===\n")
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(40)
+        if torch_prof is not None:
+            torch_prof.export_chrome_trace(f"{stem}.trace.json")
+            report.write("\n=== torch.profiler (top 30 by self CPU time) ===\n")
+            report.write(torch_prof.key_averages().table(sort_by="self_cpu_time_total", row_limit=30))
+        with open(f"{stem}.txt", 'w', encoding='utf-8') as f:
+            f.write(report.getvalue())
+
+    def finish(self, synthesize: Callable[[str], None]) -> Optional[Path]:
+        """Re-profile the slowest chunks with `synthesize` and write the summary.
+
+        Returns the path of the summary file, or None if no chunk was timed.
+        """
+        if not self.records:
+            return None
+        candidates = sorted((r for r in self.records if not r["profiled"]),
+                            key=lambda r: r["ms_per_char"], reverse=True)
+        for record in candidates[:self.slowest]:
+            print(f"Profiling slow chunk {record['index']} ({record['ms_per_char']:.1f} ms/char)...")
+            try:
+                with self._profile(record["index"], f"slowest {self.slowest} by time per character"):
+                    synthesize(record["text"])
+                record["profiled"] = "slowest"
+            except Exception as e:
+                print(f"Warning: Failed to profile chunk {record['index']}: {e}")
+        return self.write_summary()
+
+    def write_summary(self) -> Path:
+        """Write summary.json and summary.txt ranking chunks by time per character."""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        ranked = sorted(self.records, key=lambda r: r["ms_per_char"], reverse=True)
+        with open(self.output_dir / "summary.json", 'w', encoding='utf-8') as f:
+            json.dump(ranked, f, indent=2)
+
+        lines = [f"{'rank':>4}  {'chunk':>5}  {'chars':>5}  {'seconds':>8}  {'ms/char':>8}  {'profiled':<8}  text"]
+        for rank, r in enumerate(ranked, 1):
+            text = r["text"] if len(r["text"]) <= 60 else r["text"][:57] + "..."
+            lines.append(f"{rank:>4}  {r['index']:>5}  {r['characters']:>5}  {r['seconds']:>8.3f}  "
+                         f"{r['ms_per_char']:>8.2f}  {r['profiled'] or '-':<8}  {text}")
+        summary_path = self.output_dir / "summary.txt"
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        print(f"\nProfiling summary saved to {summary_path}")
+        return summary_path
+
+def default_profile_dir() -> Path:
+    """Return a timestamped profile directory under outputs/ for renders without an output file."""
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    return Path(f"outputs/profile_{timestamp}")
+
+def profiler_from_env() -> Optional[ChunkProfiler]:
+    """Create a ChunkProfiler from KOKORO_PROFILE_SLOWEST / KOKORO_PROFILE_PATTERN, if set."""
+    slowest = int(os.environ.get('KOKORO_PROFILE_SLOWEST', 0))
+    pattern = os.environ.get('KOKORO_PROFILE_PATTERN')
+    if not slowest and not pattern:
+        return None
+    torch_profiler = os.environ.get('KOKORO_PROFILE_TORCH', '1') != '0'
+    return ChunkProfiler(slowest=slowest, pattern=pattern, torch_profiler=torch_profiler)
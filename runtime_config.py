@@ -0,0 +1,334 @@
+"""Thread and core affinity configuration for Kokoro TTS Local
+
+Sets torch intra-op/inter-op and BLAS thread counts and pins the process to
+a core set, so several renders on one machine don't oversubscribe it. Core
+sets are planned per worker and kept within one NUMA node where possible.
+
+The configuration comes from KOKORO_RUNTIME (a JSON file path or "auto") or
+from runtime.json in the working directory:
+
+    {"workers": 2, "threads_per_worker": 4, "interop_threads": 1, "numa": true,
+     "memory_limit": "8G"}
+
+Each render process picks its slot with KOKORO_WORKER_INDEX (default 0).
+"auto" benchmarks a few worker/thread splits and caches the best one.
+The optional memory_limit is shared equally between the worker slots (see
+memory_budget.py); KOKORO_MEMORY_LIMIT sets a per-process budget instead.
+"""
+from typing import Optional, List, Callable
+from pathlib import Path
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import time
+from memory_budget import configure_memory_budget
+
+DEFAULT_CONFIG_FILE = 'runtime.json'
+AUTO_CACHE_FILE = Path('.cache/runtime_auto.json')
+AUTO_BENCHMARK_SECONDS = 20.0
+# Longest a benchmark worker may take to load the model, and to report beyond its run time
+BENCHMARK_START_TIMEOUT = 600.0
+BENCHMARK_RESULT_GRACE = 300.0
+AUTO_TEXT = ("The old lighthouse keeper climbed the stairs every evening, "
+             "counting each of the one hundred and twelve steps out loud.")
+
+# Environment variables read by the BLAS/OpenMP runtimes used by numpy and torch
+BLAS_THREAD_VARS = (
+    "OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS"
+)
+
+def parse_cpulist(cpulist: str) -> List[int]:
+    """Parse a Linux cpulist string such as '0-3,8-11' into core ids."""
+    cores = []
+    for part in cpulist.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-')
+            cores.extend(range(int(start), int(end) + 1))
+        else:
+            cores.append(int(part))
+    return cores
+
+def available_cores() -> List[int]:
+    """Return the cores this process is allowed to run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def numa_nodes() -> List[List[int]]:
+    """Return the available cores grouped by NUMA node.
+
+    Falls back to a single node on machines without NUMA information
+    (non-Linux systems, containers without /sys).
+    """
+    allowed = set(available_cores())
+    nodes = []
+    for node_dir in sorted(Path('/sys/devices/system/node').glob('node[0-9]*'),
+                           key=lambda p: int(p.name[4:])):
+        try:
+            cores = [c for c in parse_cpulist((node_dir / 'cpulist').read_text()) if c in allowed]
+        except OSError:
+            continue
+        if cores:
+            nodes.append(cores)
+    return nodes or [sorted(allowed)]
+
+def plan_workers(workers: int, threads_per_worker: Optional[int] = None, numa: bool = True) -> List[List[int]]:
+    """Split the available cores into one core set per worker.
+
+    With numa=True workers are spread round-robin over NUMA nodes and each
+    node's cores are divided among the workers assigned to it, so a worker
+    only spans several nodes when there are fewer workers than nodes.
+    """
+    workers = max(1, workers)
+    groups = numa_nodes() if numa else [available_cores()]
+    if len(groups) > workers:
+        # Fewer workers than nodes: merge nodes so every core is used
+        merged = [[] for _ in range(workers)]
+        for i, group in enumerate(groups):
+            merged[i % workers].extend(group)
+        groups = merged
+
+    assigned = [[] for _ in groups]
+    for worker in range(workers):
+        assigned[worker % len(groups)].append(worker)
+
+    plan = [[] for _ in range(workers)]
+    for group, group_workers in zip(groups, assigned):
+        # With more workers than cores, workers share single cores
+        share = max(1, len(group) // len(group_workers))
+        for slot, worker in enumerate(group_workers):
+            start = (slot * share) % len(group)
+            cores = group[start:start + share]
+            plan[worker] = cores[:threads_per_worker] if threads_per_worker else cores
+    return plan
+
+def apply_thread_config(threads: int, interop_threads: Optional[int] = None,
+                        cores: Optional[List[int]] = None) -> None:
+    """Pin this process to cores and set torch and BLAS thread counts.
+
+    The BLAS environment variables only affect libraries that are not loaded
+    yet (such as in a freshly spawned process). Thread pools that are already
+    running are limited with threadpoolctl, if it is installed; torch's own
+    pool is always limited with torch.set_num_threads.
+    """
+    if cores and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    for var in BLAS_THREAD_VARS:
+        os.environ[var] = str(threads)
+    import torch
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(threads)
+    except ImportError:
+        pass
+    torch.set_num_threads(threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # Can only be set once, before any inter-op parallel work starts
+            print("Warning: torch inter-op threads already initialized, keeping current setting")
+
+def load_runtime_config(source: Optional[str] = None) -> dict:
+    """Load the runtime config from a JSON path, 'auto', KOKORO_RUNTIME or runtime.json."""
+    source = source or os.environ.get('KOKORO_RUNTIME')
+    if not source:
+        if not os.path.exists(DEFAULT_CONFIG_FILE):
+            return {}
+        source = DEFAULT_CONFIG_FILE
+    if source == 'auto':
+        return auto_config()
+    with open(source, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def configure_memory(config: Optional[dict] = None, share: Optional[int] = None):
+    """Enable the memory budget from KOKORO_MEMORY_LIMIT or the config's memory_limit.
+
+    Without a config, runtime.json (or a KOKORO_RUNTIME path) is read for
+    memory_limit, but no thread settings are applied. The config's budget is
+    split between its worker slots unless share is given. Returns the governor.
+    """
+    if os.environ.get('KOKORO_MEMORY_LIMIT'):
+        return configure_memory_budget()
+    if config is None:
+        # Auto-tuned configs never carry a memory_limit; don't benchmark just to find that out
+        config = {} if os.environ.get('KOKORO_RUNTIME') == 'auto' else load_runtime_config()
+    if config.get('memory_limit'):
+        share = int(config.get('workers', 1)) if share is None else share
+        return configure_memory_budget(config['memory_limit'], share=share)
+    return configure_memory_budget()
+
+def configure_runtime(source: Optional[str] = None, worker_index: Optional[int] = None) -> dict:
+    """Apply the runtime config for one worker slot and return the applied settings.
+
+    Returns an empty dict and leaves torch defaults untouched when no
+    config is present.
+    """
+    config = load_runtime_config(source)
+    configure_memory(config)
+    if not config:
+        return {}
+    if worker_index is None:
+        worker_index = int(os.environ.get('KOKORO_WORKER_INDEX', 0))
+
+    workers = int(config.get('workers', 1))
+    plan = plan_workers(workers, config.get('threads_per_worker'), config.get('numa', True))
+    cores = plan[worker_index % workers]
+    threads = int(config.get('threads_per_worker') or len(cores))
+    interop_threads = int(config.get('interop_threads', 1))
+    apply_thread_config(threads, interop_threads, cores if config.get('pin', True) else None)
+
+    applied = {"worker_index": worker_index, "workers": workers, "threads": threads,
+               "interop_threads": interop_threads, "cores": cores}
+    print(f"Runtime: worker {worker_index + 1}/{workers}, {threads} threads on cores {_format_cores(cores)}")
+    return applied
+
+def candidate_splits(total_cores: int) -> List[tuple]:
+    """Return the (workers, threads_per_worker) splits tried by auto mode."""
+    splits = []
+    workers = 1
+    while workers <= total_cores and len(splits) < 5:
+        splits.append((workers, total_cores // workers))
+        workers *= 2
+    return splits
+
+def synthesis_workload(seconds: float) -> float:
+    """Synthesize a fixed sentence for at least one pass and about `seconds`, returning audio seconds produced."""
+    from models import build_model
+
+    model = build_model('kokoro-v1_0.pth', 'cpu')
+    produced = 0.0
+    deadline = time.perf_counter() + seconds
+    while True:
+        for gs, ps, audio in model(AUTO_TEXT, voice="voices/af_bella.pt"):
+            if audio is not None:
+                produced += len(audio) / 24000
+        if time.perf_counter() >= deadline:
+            return produced
+
+def _benchmark_worker(cores: List[int], threads: int, seconds: float, workload: Callable,
+                      ready, go, results) -> None:
+    apply_thread_config(threads, 1, cores)
+    # Warm up (model load, kernel init) before all workers start together
+    workload(0.0)
+    ready.put(True)
+    go.wait()
+    results.put(workload(seconds))
+
+def _collect(source, processes: list, timeout: float) -> list:
+    """Get one item per process from a queue; raises if a process dies or the timeout passes."""
+    items = []
+    deadline = time.perf_counter() + timeout
+    while len(items) < len(processes):
+        try:
+            items.append(source.get(timeout=1.0))
+            continue
+        except queue.Empty:
+            pass
+        exitcodes = [p.exitcode for p in processes if p.exitcode not in (None, 0)]
+        if exitcodes:
+            raise RuntimeError(f"benchmark worker exited with code {exitcodes[0]}")
+        if time.perf_counter() > deadline:
+            raise TimeoutError(f"benchmark workers did not respond within {timeout:.0f}s")
+    return items
+
+def benchmark_split(workers: int, threads: int, seconds: float = AUTO_BENCHMARK_SECONDS,
+                    workload: Callable = synthesis_workload, numa: bool = True) -> float:
+    """Run `workers` pinned processes concurrently and return total audio seconds per wall second.
+
+    Raises RuntimeError or TimeoutError if a worker dies or hangs.
+    """
+    context = multiprocessing.get_context('spawn')
+    ready, go, results = context.Queue(), context.Event(), context.Queue()
+    processes = [
+        context.Process(target=_benchmark_worker, args=(cores, threads, seconds, workload, ready, go, results))
+        for cores in plan_workers(workers, threads, numa)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        _collect(ready, processes, BENCHMARK_START_TIMEOUT)
+        go.set()
+        start = time.perf_counter()
+        produced = sum(_collect(results, processes, seconds + BENCHMARK_RESULT_GRACE))
+        elapsed = time.perf_counter() - start
+    except BaseException:
+        # Stop the workers that are still running or hung
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        raise
+    finally:
+        for process in processes:
+            process.join()
+    return produced / elapsed
+
+def auto_config(refresh: bool = False, seconds: float = AUTO_BENCHMARK_SECONDS,
+                workload: Callable = synthesis_workload) -> dict:
+    """Benchmark a few worker/thread splits and return the one with the best total throughput.
+
+    The result is cached per machine topology in .cache/runtime_auto.json.
+    """
+    topology = [len(node) for node in numa_nodes()]
+    if not refresh and AUTO_CACHE_FILE.exists():
+        with open(AUTO_CACHE_FILE, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('topology') == topology:
+            return cached['config']
+
+    total_cores = sum(topology)
+    print(f"Auto-configuring runtime for {total_cores} cores on {len(topology)} NUMA node(s)...")
+    results = []
+    for workers, threads in candidate_splits(total_cores):
+        try:
+            throughput = benchmark_split(workers, threads, seconds, workload)
+        except (RuntimeError, TimeoutError) as e:
+            print(f"Warning: runtime benchmark failed ({e}); using the default runtime settings")
+            return {}
+        print(f"  {workers} worker(s) x {threads} thread(s): {throughput:.2f} audio s/s")
+        results.append({"workers": workers, "threads_per_worker": threads, "throughput": throughput})
+
+    best = max(results, key=lambda r: r['throughput'])
+    config = {"workers": best['workers'], "threads_per_worker": best['threads_per_worker'],
+              "interop_threads": 1, "numa": True}
+    AUTO_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(AUTO_CACHE_FILE, 'w', encoding='utf-8') as f:
+        json.dump({"topology": topology, "config": config, "results": results}, f, indent=2)
+    print(f"Selected {config['workers']} worker(s) x {config['threads_per_worker']} thread(s)")
+    return config
+
+def _format_cores(cores: List[int]) -> str:
+    """Format core ids compactly, e.g. [0, 1, 2, 5] -> '0-2,5'."""
+    ranges = []
+    for core in cores:
+        if ranges and core == ranges[-1][1] + 1:
+            ranges[-1][1] = core
+        else:
+            ranges.append([core, core])
+    return ','.join(f"{a}-{b}" if a != b else str(a) for a, b in ranges)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect or auto-tune the thread/affinity runtime config")
+    parser.add_argument("--auto", action="store_true", help="Benchmark splits and cache the best config")
+    parser.add_argument("--seconds", type=float, default=AUTO_BENCHMARK_SECONDS,
+                        help="Benchmark duration per split")
+    parser.add_argument("--workers", type=int, help="Show the core plan for this many workers")
+    args = parser.parse_args()
+
+    nodes = numa_nodes()
+    print(f"{len(available_cores())} available cores on {len(nodes)} NUMA node(s):")
+    for i, node in enumerate(nodes):
+        print(f"  node {i}: {_format_cores(node)}")
+    if args.auto:
+        print(json.dumps(auto_config(refresh=True, seconds=args.seconds), indent=2))
+    elif args.workers:
+        for i, cores in enumerate(plan_workers(args.workers)):
+            print(f"  worker {i}: cores {_format_cores(cores)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Offline tests of asset provisioning from a local mirror and a tarball"""
+from contextlib import redirect_stdout
+from pathlib import Path
+import io
+import os
+import sys
+import tarfile
+import tempfile
+import unittest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from assets import AssetProvisioner, MirrorSource, TarballSource, write_source_manifest
+
+NAMES = ["kokoro-v1_0.pth", "config.json", "voices/af_test.pt", "voices/am_test.pt"]
+
+class ProvisioningTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = Path(self._tmp.name)
+        self.mirror = self.tmp / "mirror"
+        (self.mirror / "voices").mkdir(parents=True)
+        self.content = {}
+        for number, name in enumerate(NAMES):
+            data = os.urandom(200_000 + number * 1000)
+            (self.mirror / name).write_bytes(data)
+            self.content[name] = data
+        write_source_manifest(str(self.mirror))
+        self.node = self.tmp / "node"
+        self.node.mkdir()
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def provision(self, source=None, names=NAMES, verify=False):
+        """Provision into the node directory; returns (statuses, printed output)."""
+        provisioner = AssetProvisioner(source or MirrorSource(str(self.mirror)), root=str(self.node),
+                                       manifest_path=self.node / ".cache/assets_manifest.json", verify=verify)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            statuses = provisioner.provision(names)
+        return statuses, output.getvalue()
+
+    def assertProvisioned(self):
+        for name in NAMES:
+            self.assertEqual((self.node / name).read_bytes(), self.content[name], name)
+            self.assertFalse((self.node / (name + ".part")).exists(), name)
+
+    def test_fresh_pull_then_cached(self):
+        statuses, _ = self.provision()
+        self.assertEqual(statuses, {name: "downloaded" for name in NAMES})
+        self.assertProvisioned()
+
+        statuses, output = self.provision()
+        self.assertEqual(statuses, {name: "cached" for name in NAMES})
+        self.assertNotIn("Downloading", output)
+
+    def test_part_file_is_resumed(self):
+        name = "kokoro-v1_0.pth"
+        (self.node / (name + ".part")).write_bytes(self.content[name][:50_000])
+        statuses, output = self.provision()
+        self.assertEqual(statuses[name], "downloaded")
+        self.assertIn(f"Downloading {name} (resuming", output)
+        self.assertProvisioned()
+
+    def test_corrupt_part_is_restarted(self):
+        name = "voices/af_test.pt"
+        (self.node / "voices").mkdir()
+        (self.node / (name + ".part")).write_bytes(os.urandom(50_000))
+        statuses, output = self.provision()
+        self.assertEqual(statuses[name], "downloaded")
+        # Once resuming, and once again from the start after the checksum mismatch
+        self.assertEqual(output.count(f"Downloading {name}"), 2)
+        self.assertProvisioned()
+
+    def test_tampered_file_is_fetched_again(self):
+        self.provision()
+        name = "voices/am_test.pt"
+        path = self.node / name
+        path.write_bytes(os.urandom(len(self.content[name])))
+        statuses, output = self.provision()
+        self.assertEqual(statuses[name], "downloaded")
+        self.assertIn(f"{name} does not match its checksum", output)
+        self.assertEqual({n: s for n, s in statuses.items() if n != name},
+                         {n: "cached" for n in NAMES if n != name})
+        self.assertProvisioned()
+
+    def test_tarball_with_top_level_directory(self):
+        tarball = self.tmp / "kokoro-assets.tar.gz"
+        with tarfile.open(tarball, "w:gz") as tar:
+            tar.add(self.mirror, arcname="kokoro-assets")
+        statuses, output = self.provision(TarballSource(str(tarball)))
+        self.assertEqual(statuses, {name: "downloaded" for name in NAMES})
+        self.assertNotIn("Warning", output)
+        self.assertProvisioned()
+
+    def test_source_without_manifest_warns(self):
+        (self.mirror / "manifest.json").unlink()
+        statuses, output = self.provision()
+        self.assertEqual(statuses, {name: "downloaded" for name in NAMES})
+        self.assertIn("has no manifest.json", output)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+"""End-to-end test of the shared-directory work queue with several local worker processes"""
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import unittest
+import soundfile as sf
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+class LocalWorkersTest(unittest.TestCase):
+
+    def test_local_workers_render_every_chunk(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            sentences = [f"This is sentence number {i} of the queue test." for i in range(40)]
+            book = tmp / "book.txt"
+            book.write_text("\n".join(sentences), encoding='utf-8')
+            output = tmp / "book.wav"
+            result = subprocess.run(
+                [sys.executable, str(REPO_ROOT / "work_queue.py"), "submit", str(book),
+                 "--queue", str(tmp / "queue"), "--output", str(output), "--voice", "no_such_voice",
+                 "--chunks-per-task", "3", "--local-workers", "3", "--stub", "--lease", "30"],
+                cwd=REPO_ROOT, capture_output=True, text=True, timeout=600)
+            self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+
+            # Every task was completed exactly once, by one of the local workers
+            queue = tmp / "queue"
+            self.assertEqual(list((queue / "pending").iterdir()), [])
+            self.assertEqual(list((queue / "claimed").glob("*.json.*")), [])
+            self.assertEqual(list((queue / "failed").iterdir()), [])
+            tasks = sorted(p.stem for p in (queue / "done").glob("*.json"))
+            self.assertEqual(sorted(p.stem for p in (queue / "results").glob("*.npy")), tasks)
+            self.assertIn("local0", result.stdout + result.stderr)
+
+            info = sf.info(str(output))
+            self.assertEqual(info.samplerate, 24000)
+            self.assertGreater(info.duration, 0.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,11 @@
 import torch
 from typing import Optional, Tuple, List
 from models import build_model, generate_speech, list_available_voices
+from runtime_config import configure_runtime
+from playback import create_sink, stream_speech, print_stats
+from pcm_buffer import PCMBuffer
 from tqdm.auto import tqdm
-import soundfile as sf
 from pathlib import Path
-import numpy as np
 
 # Constants
 SAMPLE_RATE = 24000
@@ -21,8 +22,9 @@ def print_menu():
     print("\n=== Kokoro TTS Menu ===")
     print("1. List available voices")
     print("2. Generate speech")
-    print("3. Exit")
-    return input("Select an option (1-3): ").strip()
+    print("3. Generate speech with live playback")
+    print("4. Exit")
+    return input("Select an option (1-4): ").strip()
 
 def select_voice(voices: List[str]) -> str:
     """Interactive voice selection."""
@@ -69,6 +71,9 @@ def main() -> None:
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
         print(f"Using device: {device}")
         
+        # Apply thread/affinity settings from KOKORO_RUNTIME or runtime.json, if any
+        configure_runtime()
+        
         # Build model
         print("\nInitializing model...")
         with tqdm(total=1, desc="Building model") as pbar:
@@ -102,29 +107,43 @@ def main() -> None:
                 print(f"Speed: {speed}x")
                 
                 # Generate speech
-                all_audio = []
+                pcm = PCMBuffer.for_text(len(text), speed)
                 generator = model(text, voice=f"voices/{voice}.pt", speed=speed, split_pattern=r'\n+')
                 
                 with tqdm(desc="Generating speech") as pbar:
                     for gs, ps, audio in generator:
                         if audio is not None:
-                            if isinstance(audio, np.ndarray):
-                                audio = torch.from_numpy(audio).float()
-                            all_audio.append(audio)
+                            pcm.append(audio)
                             print(f"\nGenerated segment: {gs}")
                             print(f"Phonemes: {ps}")
                             pbar.update(1)
                 
                 # Save audio
-                if all_audio:
-                    final_audio = torch.cat(all_audio, dim=0)
+                if len(pcm):
                     output_path = Path(DEFAULT_OUTPUT_FILE)
-                    sf.write(output_path, final_audio.numpy(), SAMPLE_RATE)
+                    pcm.write(output_path)
                     print(f"\nAudio saved to {output_path.absolute()}")
                 else:
                     print("Error: Failed to generate audio")
                     
             elif choice == "3":
+                # Play segments as they are generated
+                voices = list_available_voices()
+                if not voices:
+                    print("No voices found! Please check the voices directory.")
+                    continue
+                
+                voice = select_voice(voices)
+                text = get_text_input()
+                speed = get_speed()
+                
+                print(f"\nStreaming speech for: '{text}'")
+                sink = create_sink()
+                summary = stream_speech(model, text, voice, speed, sink,
+                                        on_segment=lambda gs, ps, audio: print(f"\nGenerated segment: {gs}"))
+                print_stats(summary)
+                
+            elif choice == "4":
                 print("\nGoodbye!")
                 break
                 
@@ -0,0 +1,280 @@
+"""Watch-folder rendering daemon for Kokoro TTS Local
+
+Watches input/ for new or changed PDF and TXT files and renders each one to
+outputs/ with a model that stays loaded between files.
+
+- A file is queued once its size and modification time have not changed for
+  --settle seconds, so files that are still being copied are not picked up.
+- Render settings come from an optional sidecar next to the file, named after
+  it with .json appended (book.pdf -> book.pdf.json). It takes the same keys
+  as a batch_render.py manifest item: pages, voice, speed, format, output.
+- Files are identified by a SHA-256 of their content plus the sidecar, kept
+  in a state file, so unchanged files are never rendered twice (also across
+  restarts) and editing the sidecar triggers a re-render.
+
+Changes are detected with inotify when inotify_simple is installed, and by
+polling the folder every --interval seconds otherwise.
+
+Usage:
+    python watch_folder.py [--input input] [--output outputs] [--metrics-port 9100]
+"""
+from typing import Optional, Dict
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import os
+import signal
+import time
+import torch
+
+from models import build_model, QUANTIZE_MODES, BACKENDS
+from audio_book import DEFAULT_MODEL_PATH
+from batch_render import normalize_item, render_item
+from runtime_config import configure_runtime
+from instrumentation import configure_tracing, get_tracer, instrument_pipeline
+
+INPUT_EXTENSIONS = ('.pdf', '.txt')
+SIDECAR_SUFFIX = '.json'
+DEFAULT_STATE_FILE = '.cache/watch_state.json'
+
+def file_signature(path: Path) -> Optional[tuple]:
+    """Return (size, mtime_ns) for path, or None if it has disappeared."""
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+def content_hash(path: Path) -> str:
+    """SHA-256 of a file's content and of its sidecar settings, if any."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    sidecar = sidecar_path(path)
+    if sidecar.exists():
+        digest.update(b'\0sidecar\0')
+        digest.update(sidecar.read_bytes())
+    return digest.hexdigest()
+
+def sidecar_path(path: Path) -> Path:
+    return path.with_name(path.name + SIDECAR_SUFFIX)
+
+def load_sidecar(path: Path) -> dict:
+    """Return the sidecar settings for an input file ({} if there is none)."""
+    sidecar = sidecar_path(path)
+    if not sidecar.exists():
+        return {}
+    with open(sidecar, 'r', encoding='utf-8') as f:
+        settings = json.load(f)
+    if not isinstance(settings, dict):
+        raise ValueError(f"{sidecar.name} must contain a JSON object")
+    return settings
+
+class WatchState:
+    """Last rendered hash per input file, persisted as JSON."""
+
+    def __init__(self, path: str = DEFAULT_STATE_FILE):
+        self.path = Path(path)
+        self.entries: Dict[str, dict] = {}
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not read {self.path}, starting fresh: {e}")
+
+    def get(self, path: Path) -> dict:
+        return self.entries.get(str(path.resolve()), {})
+
+    def update(self, path: Path, **fields) -> None:
+        self.entries[str(path.resolve())] = fields
+        self.save()
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+class FolderWatcher:
+    """Tracks input files and reports the ones that are ready to render.
+
+    A file is ready when it has been stable for `settle` seconds and its
+    content hash differs from the last one recorded in the state.
+    """
+
+    def __init__(self, input_dir: str, state: WatchState, settle: float = 2.0):
+        self.input_dir = Path(input_dir)
+        self.state = state
+        self.settle = settle
+        # path -> (signature including sidecar, time the signature was first seen)
+        self.pending: Dict[Path, tuple] = {}
+
+    def scan(self) -> list:
+        """Return input files that are ready to render, oldest first."""
+        now = time.monotonic()
+        seen = set()
+        ready = []
+        with os.scandir(self.input_dir) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith('.') or not name.lower().endswith(INPUT_EXTENSIONS) or not entry.is_file():
+                    continue
+                path = Path(entry.path)
+                seen.add(path)
+                signature = (file_signature(path), file_signature(sidecar_path(path)))
+                if signature[0] is None:
+                    continue
+
+                recorded = self.state.get(path)
+                if recorded.get("signature") == [list(s) if s else None for s in signature]:
+                    # Unchanged since the last render; no need to hash it
+                    self.pending.pop(path, None)
+                    continue
+
+                previous = self.pending.get(path)
+                if previous is None or previous[0] != signature:
+                    self.pending[path] = (signature, now)
+                elif now - previous[1] >= self.settle:
+                    ready.append((signature[0][1], path))
+
+        for path in list(self.pending):
+            if path not in seen:
+                del self.pending[path]
+        return [path for _, path in sorted(ready)]
+
+    def mark_done(self, path: Path, signature: tuple, digest: Optional[str], result: Optional[dict]) -> None:
+        """Record a file as processed so it is skipped until it changes."""
+        self.pending.pop(path, None)
+        fields = {"signature": [list(s) if s else None for s in signature], "hash": digest,
+                  "processed_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        if result is not None:
+            fields.update({"status": result["status"], "output": result.get("output"),
+                           "error": result.get("error")})
+        else:
+            fields = {**self.state.get(path), **fields}
+        self.state.update(path, **fields)
+
+def make_waiter(input_dir: str, interval: float):
+    """Return a function that blocks until the folder may have changed.
+
+    Uses inotify when inotify_simple is installed, otherwise sleeps for
+    `interval` seconds.
+    """
+    try:
+        from inotify_simple import INotify, flags
+    except ImportError:
+        print(f"Polling {input_dir} every {interval:g}s (pip install inotify_simple for inotify)")
+        return lambda: time.sleep(interval)
+
+    inotify = INotify()
+    inotify.add_watch(input_dir, flags.CLOSE_WRITE | flags.MOVED_TO | flags.MODIFY |
+                      flags.CREATE | flags.DELETE | flags.MOVED_FROM)
+    print(f"Watching {input_dir} with inotify")
+
+    def wait():
+        # Still wake up periodically so settling files are re-checked
+        inotify.read(timeout=int(interval * 1000))
+    return wait
+
+def process_file(model, watcher: FolderWatcher, path: Path, output_dir: str, quiet: bool) -> None:
+    """Render one ready file unless its content hash matches the last render."""
+    signature = (file_signature(path), file_signature(sidecar_path(path)))
+    if signature[0] is None:
+        return
+    try:
+        digest = content_hash(path)
+    except FileNotFoundError:
+        # Deleted or renamed since the scan; a new name shows up in the next one
+        watcher.pending.pop(path, None)
+        return
+    except OSError as e:
+        # Unreadable (e.g. permissions): record it so it is retried only once it changes
+        print(f"Failed: {path.name}: {e}")
+        watcher.mark_done(path, signature, None, {"input": str(path), "status": "failed", "error": str(e)})
+        return
+    recorded = watcher.state.get(path)
+    if recorded.get("hash") == digest:
+        # Touched or copied again but identical: just remember the new signature
+        watcher.mark_done(path, signature, digest, None)
+        return
+
+    print(f"\nRendering {path.name}...")
+    try:
+        item = normalize_item({**load_sidecar(path), "input": str(path)}, 0, output_dir)
+    except (ValueError, OSError) as e:
+        result = {"input": str(path), "status": "failed", "error": f"Invalid settings: {e}"}
+    else:
+        try:
+            result = render_item(model, item, quiet=quiet)
+        except OSError as e:
+            # The input vanished or became unreadable mid-render; the daemon keeps going
+            result = {"input": str(path), "status": "failed", "error": str(e)}
+
+    if result["status"] == "ok":
+        audio = result.get("audio_seconds")
+        timing = f" ({audio:.1f}s audio in {result['wall_seconds']:.1f}s)" if audio else ""
+        print(f"Done: {path.name} -> {result['output']}{timing}")
+    else:
+        print(f"Failed: {path.name}: {result['error']}")
+    # Failed files are recorded too, so they are retried only once they change
+    watcher.mark_done(path, signature, digest, result)
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", default="input", help="Folder to watch")
+    parser.add_argument("--output", default="outputs", help="Folder for rendered audio")
+    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between folder scans")
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="Seconds a file must stay unchanged before it is rendered")
+    parser.add_argument("--state", default=DEFAULT_STATE_FILE, help="State file of rendered content hashes")
+    parser.add_argument("--once", action="store_true", help="Render what is ready now, then exit")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port")
+    parser.add_argument("--quantize", choices=[m for m in QUANTIZE_MODES if m], help="Quantized CPU inference")
+    parser.add_argument("--backend", choices=BACKENDS, default="eager", help="Inference backend")
+    parser.add_argument("--quiet", action="store_true", help="Hide per-chunk progress output")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.input, exist_ok=True)
+    os.makedirs(args.output, exist_ok=True)
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    configure_runtime()
+    configure_tracing(metrics_port=args.metrics_port)
+    model = build_model(DEFAULT_MODEL_PATH, device, quantize=args.quantize, backend=args.backend)
+    instrument_pipeline(model)
+
+    watcher = FolderWatcher(args.input, WatchState(args.state), settle=0 if args.once else args.settle)
+    wait = make_waiter(args.input, args.interval)
+
+    stopping = False
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        print("\nStopping after the current file...")
+    signal.signal(signal.SIGTERM, request_stop)
+
+    try:
+        while not stopping:
+            ready = watcher.scan()
+            if args.once and not ready:
+                # First scan only records signatures; the second finds them settled
+                ready = watcher.scan()
+            for path in ready:
+                if stopping:
+                    break
+                process_file(model, watcher, path, args.output, args.quiet)
+            if args.once:
+                break
+            if not ready:
+                wait()
+    except KeyboardInterrupt:
+        print("\nStopped.")
+    finally:
+        get_tracer().close()
+
+if __name__ == "__main__":
+    main()
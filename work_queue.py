@@ -0,0 +1,431 @@
+"""Shared-directory work queue for rendering one book on many machines
+
+A coordinator splits a book into chunk-range tasks in a queue directory
+that every node can reach (a local disk or an NFS share). Any number of
+workers, on any nodes, claim tasks, synthesize them and write the audio
+back, and the coordinator stitches the results into the final file.
+
+    <queue>/
+        job.json                  text chunks and render settings
+        pending/<task>.json       tasks waiting for a worker
+        claimed/<task>.json.<worker>  claimed tasks; mtime is the lease heartbeat
+        done/<task>.json          finished tasks
+        failed/<task>.json        tasks that exhausted their attempts
+        results/<task>.npy        audio of finished tasks
+
+Claiming is an atomic rename from pending/ to claimed/, so exactly one
+worker gets each task. Workers touch their claimed file while they work;
+a claim whose mtime is older than the lease timeout belongs to a crashed
+worker and is moved back to pending/ by the coordinator or any worker.
+Lease ages are measured against the file server's clock, so nodes with
+skewed clocks do not steal each other's tasks.
+
+Usage:
+    python work_queue.py submit input/book.pdf --queue /mnt/shared/queue [--local-workers 4]
+    python work_queue.py worker /mnt/shared/queue          # on every node
+    python work_queue.py status /mnt/shared/queue
+"""
+from typing import Optional, List
+from pathlib import Path
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import numpy as np
+
+SAMPLE_RATE = 24000
+CHUNK_SILENCE_SECONDS = 0.5
+DEFAULT_CHUNKS_PER_TASK = 20
+DEFAULT_LEASE_SECONDS = 120.0
+DEFAULT_MAX_ATTEMPTS = 3
+QUEUE_DIRS = ("pending", "claimed", "done", "failed", "results")
+
+def _write_json(path: Path, data: dict) -> None:
+    """Write JSON so readers on other nodes never see a partial file."""
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _read_json(path: Path) -> dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+class WorkQueue:
+    """One render job's tasks in a shared directory."""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def dir(self, name: str) -> Path:
+        return self.root / name
+
+    def server_time(self) -> float:
+        """Current time on the file server, read from the mtime of a freshly touched file."""
+        clock = self.root / ".clock"
+        clock.touch()
+        return clock.stat().st_mtime
+
+    def load_job(self) -> Optional[dict]:
+        try:
+            return _read_json(self.root / "job.json")
+        except FileNotFoundError:
+            return None
+
+    def submit(self, chunks: List[str], voice: str, speed: float,
+               chunks_per_task: int = DEFAULT_CHUNKS_PER_TASK, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> dict:
+        """Write a new job and its tasks, replacing a finished previous job."""
+        previous = self.load_job()
+        if previous and not self.finished(previous):
+            raise RuntimeError(f"Queue {self.root} still has unfinished job {previous['job_id']}")
+        self.clear()
+        for name in QUEUE_DIRS:
+            self.dir(name).mkdir(parents=True, exist_ok=True)
+
+        job = {"job_id": uuid.uuid4().hex[:12], "voice": voice, "speed": speed, "chunks": chunks,
+               "max_attempts": max_attempts, "created": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        tasks = []
+        for number, start in enumerate(range(0, len(chunks), chunks_per_task)):
+            tasks.append({"name": f"{job['job_id']}_{number:05d}", "job_id": job["job_id"],
+                          "start": start, "end": min(start + chunks_per_task, len(chunks)), "attempts": 0})
+        job["tasks"] = [task["name"] for task in tasks]
+        # job.json first so workers never find a task without its job
+        _write_json(self.root / "job.json", job)
+        for task in tasks:
+            _write_json(self.dir("pending") / f"{task['name']}.json", task)
+        return job
+
+    def clear(self) -> None:
+        """Remove the previous job's files."""
+        for name in QUEUE_DIRS:
+            directory = self.dir(name)
+            if directory.exists():
+                for path in directory.iterdir():
+                    path.unlink()
+
+    def counts(self) -> dict:
+        return {name: sum(1 for p in self.dir(name).glob("*.json*") if not p.name.startswith('.'))
+                for name in ("pending", "claimed", "done", "failed")}
+
+    def finished(self, job: dict) -> bool:
+        # A task can be in both done/ and failed/ for a moment, so count names, not files
+        names = {p.name for name in ("done", "failed") for p in self.dir(name).glob("*.json")
+                 if not p.name.startswith('.')}
+        return len(names) >= len(job["tasks"])
+
+    def claim(self, worker_id: str) -> Optional[tuple]:
+        """Claim one pending task; returns (task, claimed_path) or None if none is left."""
+        for path in sorted(self.dir("pending").glob("*.json")):
+            claimed_path = self.dir("claimed") / f"{path.name}.{worker_id}"
+            try:
+                # Refresh the mtime first: a claim must never carry its submit time
+                # into claimed/, where requeue_expired would see an expired lease
+                os.utime(path)
+                os.rename(path, claimed_path)
+            except FileNotFoundError:
+                continue  # Another worker got it first
+            return _read_json(claimed_path), claimed_path
+        return None
+
+    def complete(self, task: dict, claimed_path: Path, audio: np.ndarray, failed_chunks: list) -> None:
+        """Store a task's audio and mark it done."""
+        results = self.dir("results")
+        tmp_path = results / f".{task['name']}.{uuid.uuid4().hex[:8]}.tmp.npy"
+        np.save(tmp_path, audio.astype(np.float32))
+        os.replace(tmp_path, results / f"{task['name']}.npy")
+        task = {**task, "failed_chunks": failed_chunks}
+        done_path = self.dir("done") / f"{task['name']}.json"
+        _write_json(done_path, task)
+        for path in (claimed_path, self.dir("pending") / f"{task['name']}.json",
+                     self.dir("failed") / f"{task['name']}.json"):
+            # Our lease may have expired and the task been requeued or failed meanwhile
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def requeue_expired(self, lease_seconds: float) -> int:
+        """Move claims whose heartbeat is older than the lease back to pending/.
+
+        Returns the number of tasks requeued (or failed after max attempts).
+        """
+        now = self.server_time()
+        job = self.load_job() or {}
+        requeued = 0
+        for claimed_path in self.dir("claimed").glob("*.json.*"):
+            try:
+                age = now - claimed_path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if age < lease_seconds:
+                continue
+            task_file = claimed_path.name.split('.json.', 1)[0] + ".json"
+            if (self.dir("done") / task_file).exists():
+                claimed_path.unlink(missing_ok=True)
+                continue
+            limbo_path = self.dir("claimed") / f".{task_file}.requeue"
+            try:
+                os.rename(claimed_path, limbo_path)
+            except FileNotFoundError:
+                continue  # Someone else requeued it or the worker just finished
+            task = _read_json(limbo_path)
+            task["attempts"] = task.get("attempts", 0) + 1
+            worker = claimed_path.name.split('.json.', 1)[1]
+            target = "failed" if task["attempts"] >= job.get("max_attempts", DEFAULT_MAX_ATTEMPTS) else "pending"
+            print(f"Lease of {task['name']} held by {worker} expired after {age:.0f}s; moving to {target}/")
+            _write_json(self.dir(target) / task_file, task)
+            limbo_path.unlink()
+            requeued += 1
+        return requeued
+
+class Heartbeat:
+    """Keeps a claim's lease alive by touching it from a background thread."""
+
+    def __init__(self, path: Path, interval: float):
+        self.path = path
+        self.interval = interval
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                self.lost = True
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+def synthesize_chunks(model, chunks: List[str], voice: str, speed: float) -> tuple:
+    """Synthesize chunks the way generate_audio does, with silence after each.
+
+    Returns (audio, failed_chunks); failed chunks are skipped.
+    """
+    from memory_budget import get_governor
+    from pcm_buffer import PCMBuffer
+
+    pcm = PCMBuffer.for_text(sum(len(chunk) for chunk in chunks), speed,
+                             silence_seconds=CHUNK_SILENCE_SECONDS * len(chunks))
+    failed = []
+    for chunk in chunks:
+        get_governor().throttle()
+        chunk_start = len(pcm)
+        try:
+            for _, _, audio in model(chunk, voice=f"voices/{voice}.pt", speed=speed):
+                if audio is not None:
+                    pcm.append(audio)
+            if len(pcm) == chunk_start:
+                raise RuntimeError("No audio generated")
+            pcm.append_silence(CHUNK_SILENCE_SECONDS)
+        except Exception as e:
+            print(f"Warning: Failed to process chunk: '{chunk}'. Error: {e}")
+            failed.append((chunk, str(e)))
+            pcm.truncate(chunk_start)
+    return pcm.view(), failed
+
+def run_worker(queue: WorkQueue, model, worker_id: Optional[str] = None, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+               poll_seconds: float = 2.0, exit_when_idle: bool = False) -> int:
+    """Claim and render tasks until stopped; returns the number of tasks completed.
+
+    With exit_when_idle the worker returns once the current job has no
+    pending or claimed tasks left.
+    """
+    from memory_budget import get_governor
+
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    completed = 0
+    while True:
+        # A worker over its memory budget frees what it can before taking on another task
+        get_governor().throttle()
+        claim = queue.claim(worker_id) if queue.dir("pending").exists() else None
+        if claim is None:
+            queue.requeue_expired(lease_seconds)
+            job = queue.load_job()
+            if exit_when_idle and (job is None or queue.finished(job)):
+                return completed
+            time.sleep(poll_seconds)
+            continue
+
+        task, claimed_path = claim
+        job = queue.load_job()
+        if job is None or job["job_id"] != task["job_id"]:
+            claimed_path.unlink(missing_ok=True)  # Leftover from a replaced job
+            continue
+        print(f"[{worker_id}] {task['name']}: chunks {task['start'] + 1}-{task['end']} of {len(job['chunks'])}")
+        start = time.perf_counter()
+        with Heartbeat(claimed_path, lease_seconds / 4) as heartbeat:
+            audio, failed = synthesize_chunks(model, job["chunks"][task["start"]:task["end"]],
+                                              job["voice"], job["speed"])
+        if heartbeat.lost:
+            print(f"[{worker_id}] Lease on {task['name']} was lost; saving the result anyway")
+        queue.complete(task, claimed_path, audio, failed)
+        completed += 1
+        print(f"[{worker_id}] {task['name']} done: {len(audio) / SAMPLE_RATE:.1f}s audio "
+              f"in {time.perf_counter() - start:.1f}s")
+
+def wait_for_job(queue: WorkQueue, job: dict, lease_seconds: float, poll_seconds: float = 2.0,
+                 workers: Optional[list] = None) -> None:
+    """Block until every task is done or failed, requeueing expired leases."""
+    last_counts = None
+    while not queue.finished(job):
+        queue.requeue_expired(lease_seconds)
+        counts = queue.counts()
+        if counts != last_counts:
+            print(f"Tasks: {counts['done']}/{len(job['tasks'])} done, {counts['claimed']} claimed, "
+                  f"{counts['pending']} pending, {counts['failed']} failed")
+            last_counts = counts
+        if workers and all(p.poll() is not None for p in workers) and not queue.finished(job):
+            if counts["claimed"] == 0 and counts["pending"] > 0:
+                raise RuntimeError("All local workers exited with tasks still pending")
+        time.sleep(poll_seconds)
+
+def stitch(queue: WorkQueue, job: dict, output_path: str, audio_format: str) -> Optional[Path]:
+    """Join task results in order, loudness-normalize and save the final file."""
+    from audio_book import save_normalized
+    from loudness import StreamingNormalizer
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    missing, failed_chunks = [], []
+    # Results are streamed one task at a time, so the book is never held in memory
+    with StreamingNormalizer(output_path.with_name(f"{output_path.stem}.unnormalized.wav"), SAMPLE_RATE) as stream:
+        for name in job["tasks"]:
+            result = queue.dir("results") / f"{name}.npy"
+            if not result.exists():
+                missing.append(name)
+                continue
+            stream.write(np.load(result))
+            failed_chunks.extend(_read_json(queue.dir("done") / f"{name}.json").get("failed_chunks", []))
+    if missing:
+        print(f"Warning: {len(missing)} task(s) failed on every attempt; their audio is missing: {', '.join(missing)}")
+    if failed_chunks:
+        print(f"Warning: {len(failed_chunks)} chunk(s) were skipped during processing")
+    if not stream.samples:
+        stream.discard()
+        print("No audio was generated.")
+        return None
+    return save_normalized(stream.path, output_path, audio_format, stream.gain_db())
+
+def start_local_workers(queue_dir: str, count: int, lease_seconds: float, stub: bool) -> list:
+    """Start worker processes on this machine, standing in for nodes."""
+    processes = []
+    for index in range(count):
+        cmd = [sys.executable, os.path.abspath(__file__), "worker", queue_dir, "--exit-when-idle",
+               "--lease", str(lease_seconds), "--worker-id", f"{socket.gethostname()}-local{index}"]
+        if stub:
+            cmd.append("--stub")
+        env = {**os.environ, "KOKORO_WORKER_INDEX": str(index)}
+        processes.append(subprocess.Popen(cmd, env=env))
+    return processes
+
+def load_worker_model(stub: bool, quantize: Optional[str] = None, backend: str = "eager"):
+    if stub:
+        from benchmarks.stub import StubPipeline
+        return StubPipeline()
+    import torch
+    from models import build_model
+    from audio_book import DEFAULT_MODEL_PATH
+    from runtime_config import configure_runtime
+    configure_runtime()
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    return build_model(DEFAULT_MODEL_PATH, device, quantize=quantize, backend=backend)
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit_parser = commands.add_parser("submit", help="Queue a book, wait for the workers and stitch the result")
+    submit_parser.add_argument("input", help="PDF or TXT file")
+    submit_parser.add_argument("--queue", required=True, help="Shared queue directory")
+    submit_parser.add_argument("--pages", help="Page range of a PDF, e.g. 5-120")
+    submit_parser.add_argument("--voice", default="af_bella", help="Voice name (from voices/)")
+    submit_parser.add_argument("--speed", type=float, default=1.0, help="Speech speed (0.5-2.0)")
+    submit_parser.add_argument("--format", choices=("wav", "mp3", "aac"), default="wav", help="Output format")
+    submit_parser.add_argument("--output", help="Output file (default: outputs/<input stem>.<format>)")
+    submit_parser.add_argument("--chunks-per-task", type=int, default=DEFAULT_CHUNKS_PER_TASK,
+                               help="Text chunks per task")
+    submit_parser.add_argument("--local-workers", type=int, default=0,
+                               help="Also start this many workers on this machine")
+
+    worker_parser = commands.add_parser("worker", help="Claim and render tasks")
+    worker_parser.add_argument("queue", help="Shared queue directory")
+    worker_parser.add_argument("--worker-id", help="Name used in claims (default: <host>-<pid>)")
+    worker_parser.add_argument("--exit-when-idle", action="store_true", help="Exit when the job has no tasks left")
+    worker_parser.add_argument("--quantize", choices=("int8",), help="Quantized CPU inference")
+    worker_parser.add_argument("--backend", choices=("eager", "onnx"), default="eager", help="Inference backend")
+
+    status_parser = commands.add_parser("status", help="Show task counts and claims")
+    status_parser.add_argument("queue", help="Shared queue directory")
+
+    for sub in (submit_parser, worker_parser):
+        sub.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS,
+                         help="Seconds without a heartbeat before a claim is taken back")
+        sub.add_argument("--stub", action="store_true",
+                         help="Synthesize with the deterministic benchmark stub instead of the model (for testing)")
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        queue = WorkQueue(args.queue)
+        job = queue.load_job()
+        if job is None:
+            print(f"No job in {args.queue}")
+            return 0
+        print(f"Job {job['job_id']}: {len(job['tasks'])} tasks, {len(job['chunks'])} chunks, voice {job['voice']}")
+        print(", ".join(f"{name}: {count}" for name, count in queue.counts().items()))
+        now = queue.server_time()
+        for path in sorted(queue.dir("claimed").glob("*.json.*")):
+            task_file, worker = path.name.split('.json.', 1)
+            print(f"  {task_file} claimed by {worker}, heartbeat {now - path.stat().st_mtime:.0f}s ago")
+        return 0
+
+    if args.command == "worker":
+        queue = WorkQueue(args.queue)
+        model = load_worker_model(args.stub, args.quantize, args.backend)
+        completed = run_worker(queue, model, args.worker_id, args.lease, exit_when_idle=args.exit_when_idle)
+        print(f"Worker finished {completed} task(s)")
+        return 0
+
+    from audio_book import read_input_file, split_text_into_chunks
+    from batch_render import parse_pages
+
+    voice = args.voice.replace('.pt', '')
+    # The stub ignores the voice, so tests can submit without voice files
+    if not args.stub and not os.path.exists(f"voices/{voice}.pt"):
+        parser.error(f"Voice file not found: voices/{voice}.pt")
+    start_page, end_page = parse_pages(args.pages)
+    chunks = split_text_into_chunks(' '.join(read_input_file(args.input, start_page, end_page)))
+    queue = WorkQueue(args.queue)
+    job = queue.submit(chunks, voice, args.speed, args.chunks_per_task)
+    print(f"Submitted job {job['job_id']}: {len(chunks)} chunks in {len(job['tasks'])} tasks to {args.queue}")
+
+    workers = start_local_workers(args.queue, args.local_workers, args.lease, args.stub) if args.local_workers else []
+    start = time.perf_counter()
+    try:
+        wait_for_job(queue, job, args.lease, workers=workers)
+    finally:
+        for process in workers:
+            process.wait()
+
+    output = args.output or f"outputs/{Path(args.input).stem}.{args.format}"
+    saved = stitch(queue, job, output, args.format)
+    if saved is None:
+        return 1
+    print(f"Stitched {len(job['tasks'])} tasks into {saved} in {time.perf_counter() - start:.1f}s")
+    return 0 if queue.counts()["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())